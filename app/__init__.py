@@ -1,4 +1,5 @@
 import os
+import shutil
 import sys
 from pathlib import Path
 
@@ -15,17 +16,32 @@ try:
         # Модели Whisper должны лежать в папке "whisper_models", которая находится рядом с .exe
         # WHISPER_MODELS_DIR = Path(sys.executable).parent / 'whisper_models'
         WHISPER_MODELS_DIR = BASE_DIR / 'whisper_models'
+        # Кэш должен переживать перезапуск, поэтому он лежит рядом с .exe, а не во временной папке
+        CACHE_DIR = Path(sys.executable).parent / 'cache'
     else:  # Запуск из .py файла
         BASE_DIR = Path(__file__).resolve().parent.parent
         FFMPEG_PATH = BASE_DIR / 'ffmpeg' / 'ffmpeg.exe'
         ICON_PATH = BASE_DIR / 'app' / 'main.ico'
         WHISPER_MODELS_DIR = BASE_DIR / 'whisper_models'
+        CACHE_DIR = BASE_DIR / 'cache'
 except Exception as e:
     print(f'Error __init__ => {e}')
 
-# Проверка существования ffmpeg.exe
-if not FFMPEG_PATH.is_file():
-    raise FileNotFoundError(f'Не найден ffmpeg: {FFMPEG_PATH}')
+# Вне Windows ffmpeg.exe не запустится - используем ffmpeg, установленный в системе
+if os.name != 'nt' and shutil.which('ffmpeg'):
+    FFMPEG_PATH = Path(shutil.which('ffmpeg'))
+
+# ffprobe необязателен: если его нет, метаданные читаются из заголовков или через ffmpeg
+FFPROBE_PATH = FFMPEG_PATH.parent / FFMPEG_PATH.name.replace('ffmpeg', 'ffprobe')
+if not FFPROBE_PATH.is_file() and shutil.which('ffprobe'):
+    FFPROBE_PATH = Path(shutil.which('ffprobe'))
 
 ffmpeg_dir = str(Path(FFMPEG_PATH).parent)
-os.environ['PATH'] = f'{ffmpeg_dir};' + os.environ.get('PATH', '')
+os.environ['PATH'] = f'{ffmpeg_dir}{os.pathsep}' + os.environ.get('PATH', '')
+
+
+def check_ffmpeg():
+    """Проверяет, что ffmpeg на месте. Вызывается при подготовке движка, а не при импорте,
+    чтобы окно программы появилось сразу и могло показать ошибку."""
+    if not FFMPEG_PATH.is_file():
+        raise FileNotFoundError(f'Не найден ffmpeg: {FFMPEG_PATH}')
@@ -0,0 +1,105 @@
+"""Разрезы записи по паузам и склейка сегментов на стыках.
+
+Используется окнами расшифровки (vad, streaming) и кусками для процессов CPU (sharding).
+Если в месте разреза нет паузы, соседние куски перекрываются на OVERLAP_SECONDS: слово на стыке
+целиком попадает хотя бы в один из них. Сегменты потом берутся только из своей зоны
+(от разреза до разреза), а слова, которые повторяют конец предыдущего куска, убираются.
+"""
+import re
+
+import numpy as np
+
+from app.convert_to_wav import SAMPLE_RATE
+
+# Длина кадра (с), по которому считается громкость при поиске паузы
+SPLIT_FRAME_SECONDS = 0.5
+# Кадр тише этого уровня (RMS) считается тишиной
+SILENCE_RMS = 0.01
+# Если паузы рядом нет, куски перекрываются на столько секунд с каждой стороны
+OVERLAP_SECONDS = 2.0
+# Больше слов за время перекрытия не произносят - длиннее совпадение на стыке не ищем
+SEAM_MAX_WORDS = 12
+# Насколько начало сегмента может отстоять от конца предыдущего, чтобы считаться тем же местом (с)
+SEAM_TOLERANCE_SECONDS = 0.5
+
+
+def find_split_point(audio, target, radius_seconds):
+    """Ищет самый тихий кадр рядом с target. Возвращает (позиция в сэмплах, найдена ли пауза)."""
+    frame = int(SPLIT_FRAME_SECONDS * SAMPLE_RATE)
+    radius = int(radius_seconds * SAMPLE_RATE)
+    start = max(0, target - radius)
+    end = min(len(audio), target + radius)
+
+    frames_count = (end - start) // frame
+    if frames_count == 0:
+        return target, False
+
+    frames = audio[start:start + frames_count * frame].reshape(frames_count, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    quietest = int(np.argmin(rms))
+
+    return start + quietest * frame + frame // 2, bool(rms[quietest] < SILENCE_RMS)
+
+
+def cut_window(audio, start, max_samples, search_seconds):
+    """Где закончить окно, которое начинается в start и не длиннее max_samples.
+
+    Разрез ищется в последних search_seconds окна. Возвращает (разрез, конец окна, начало следующего):
+    при паузе в месте разреза все три совпадают, иначе окна перекрываются на OVERLAP_SECONDS.
+    """
+    half_search = int(search_seconds * SAMPLE_RATE) // 2
+    overlap = int(OVERLAP_SECONDS * SAMPLE_RATE)
+
+    cut, silent = find_split_point(audio, start + max_samples - half_search, search_seconds / 2)
+    cut = min(max(cut, start + 1), start + max_samples)
+    if silent:
+        return cut, cut, cut
+
+    # Перекрытие после разреза тоже должно поместиться в окно
+    cut = max(start + 1, min(cut, start + max_samples - overlap))
+    return cut, min(len(audio), cut + overlap), max(start + 1, cut - overlap)
+
+
+def _seam_tokens(text):
+    return [''.join(re.findall(r'\w+', token.lower())) for token in text.split()]
+
+
+def trim_seam_repeat(previous, seg):
+    """Убирает из начала seg слова, которыми кончается previous (их расшифровали оба куска на стыке).
+
+    Возвращает сегмент без повтора или None, если он весь оказался повтором.
+    """
+    if seg['start'] >= previous['end'] + SEAM_TOLERANCE_SECONDS:
+        return seg
+
+    tokens = seg['text'].split()
+    previous_words = _seam_tokens(previous['text'])
+    words = _seam_tokens(seg['text'])
+    for size in range(min(len(previous_words), len(words), SEAM_MAX_WORDS), 0, -1):
+        if previous_words[-size:] == words[:size]:
+            if size == len(tokens):
+                return None
+            return {**seg, 'start': max(seg['start'], previous['end']), 'text': ' ' + ' '.join(tokens[size:])}
+    return seg
+
+
+def merge_window_segments(merged, segments, core_start=None, core_end=None):
+    """Сегменты очередного куска, которые нужно добавить к уже склеенным merged.
+
+    core_start, core_end - зона куска на шкале записи (с); None - кусок не перекрывается с соседом
+    с этой стороны. Сегмент берётся, если его середина в зоне; первые сегменты после перекрытия
+    сверяются с последним склеенным сегментом.
+    """
+    result = []
+    for seg in segments:
+        middle = (seg['start'] + seg['end']) / 2
+        if core_start is not None and middle < core_start:
+            continue
+        if core_end is not None and middle >= core_end:
+            continue
+        if not result and core_start is not None and merged:
+            seg = trim_seam_repeat(merged[-1], seg)
+            if seg is None:
+                continue
+        result.append(seg)
+    return result
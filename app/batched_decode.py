@@ -0,0 +1,246 @@
+"""Пакетная расшифровка: несколько 30-секундных окон за один проход энкодера и декодера.
+
+model.transcribe обрабатывает окна по одному, и видеокарта (да и многоядерный CPU) большую часть
+времени простаивает. Здесь окна, уже разрезанные по паузам (split_into_windows, pack_speech_windows),
+собираются в пакет: mel-спектрограммы считаются для всех окон сразу, а whisper.decode прогоняет
+энкодер и декодер с KV-кэшем по всему пакету. Сегменты собираются из токенов времени и переводятся
+на шкалу исходной записи так же, как в последовательном пути.
+
+Окна, где результат подозрительный (повторы, низкая уверенность), расшифровываются заново через
+model.transcribe с его повышением температуры. Если пакет не помещается в видеопамять, он делится
+пополам, а уменьшенный размер запоминается для следующих пакетов.
+
+Сравнение с последовательным путём: python -m app.batched_decode <файл> [--model small] [--batch 8]
+"""
+import argparse
+import difflib
+import itertools
+import json
+import logging
+import threading
+import time
+
+from app.tracing import count, span
+
+# Пороги те же, что у whisper.transcribe: при их нарушении окно расшифровывается заново
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+# Шаг токенов времени Whisper (с)
+TIME_PRECISION = 0.02
+
+log = logging.getLogger(__name__)
+
+# Размер пакета, который реально поместился в память: (устройство, модель) -> окон
+_batch_limits = {}
+_limits_lock = threading.Lock()
+
+
+def _is_out_of_memory(error):
+    return 'out of memory' in str(error).lower()
+
+
+def batch_limit(device, model_size, requested):
+    with _limits_lock:
+        return min(requested, _batch_limits.get((device, model_size), requested))
+
+
+def _lower_batch_limit(device, model_size, size):
+    with _limits_lock:
+        _batch_limits[(device, model_size)] = min(size, _batch_limits.get((device, model_size), size))
+
+
+def _decode_batch(model, mel, options, model_size):
+    """Декодирует пакет; при нехватке памяти делит его пополам и запоминает меньший размер."""
+    import torch
+
+    try:
+        with span('decode_batch', windows=len(mel)):
+            return model.decode(mel, options)
+    except RuntimeError as e:
+        if not _is_out_of_memory(e) or len(mel) == 1:
+            raise
+
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    half = len(mel) // 2
+    _lower_batch_limit(str(mel.device), model_size, half)
+    log.warning('Пакет из %s окон не поместился в память, уменьшаем до %s', len(mel), half)
+    count('batch_oom')
+    return _decode_batch(model, mel[:half], options, model_size) + _decode_batch(model, mel[half:], options,
+                                                                                 model_size)
+
+
+def segments_from_tokens(tokens, tokenizer, window_seconds):
+    """Сегменты окна по токенам времени: <|0.00|> текст <|2.40|><|2.40|> текст <|5.00|> ...
+
+    Время внутри окна (с). Текст без закрывающей метки (окно кончилось посреди фразы) доводится до конца окна.
+    """
+    timestamp_begin = tokenizer.timestamp_begin
+    segments = []
+    start = None
+    text_tokens = []
+
+    for token in tokens:
+        if token < timestamp_begin:
+            text_tokens.append(token)
+            continue
+
+        time_seconds = min(window_seconds, (token - timestamp_begin) * TIME_PRECISION)
+        if text_tokens and start is not None:
+            segments.append({'start': start, 'end': max(start, time_seconds), 'text': tokenizer.decode(text_tokens)})
+            text_tokens = []
+            start = None
+        else:
+            start = time_seconds
+
+    if text_tokens:
+        start = start if start is not None else 0.0
+        segments.append({'start': start, 'end': max(start, window_seconds), 'text': tokenizer.decode(text_tokens)})
+
+    return [seg for seg in segments if seg['text'].strip()]
+
+
+def _needs_fallback(result):
+    return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def _is_silence(result):
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def decode_windows_batched(model, audio, windows, fp16, language, batch_size, model_size=None, progress=None,
+                           segment_callback=None, checkpoint=None):
+    """Расшифровывает окна пакетами и отдаёт сегменты каждого окна по порядку, как decode_windows.
+
+    Контрольная точка (checkpoint) ставится только на границе пакета: при продолжении пакеты
+    собираются из тех же окон, что и без перерыва. windows может быть и генератором (потоковый режим):
+    в памяти держится только текущий пакет.
+    """
+    import torch
+    import whisper
+    from whisper.decoding import DecodingOptions
+
+    from app.audio_split import merge_window_segments
+    from app.convert_to_wav import SAMPLE_RATE
+    from app.transcribe import restore_checkpoint
+
+    tokenizer = whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                                language=language, task='transcribe')
+    options = DecodingOptions(task='transcribe', language=language, temperature=0.0, fp16=fp16,
+                              without_timestamps=False)
+    device = str(model.device)
+    segments = restore_checkpoint(checkpoint, progress, segment_callback)
+    position = checkpoint.next_window if checkpoint is not None else 0
+    windows = iter(windows)
+    # Окна до контрольной точки пропускаются без модели
+    for _ in itertools.islice(windows, position):
+        pass
+
+    while True:
+        size = batch_limit(device, model_size, batch_size)
+        batch = list(itertools.islice(windows, size))
+        if not batch:
+            break
+        position += len(batch)
+
+        with span('log_mel', windows=len(batch)):
+            window_audio = [window.extract(audio) for window in batch]
+            mel = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(samples), model.dims.n_mels)
+                               for samples in window_audio]).to(model.device)
+        results = _decode_batch(model, mel, options, model_size)
+        del mel
+        batch_segments = []
+
+        for window, samples, result in zip(batch, window_audio, results):
+            window_seconds = len(samples) / SAMPLE_RATE
+            if _is_silence(result):
+                local_segments = []
+            elif _needs_fallback(result):
+                # Последовательный путь с повышением температуры - как в model.transcribe
+                count('batch_fallback_windows')
+                with span('decode_window_fallback'):
+                    local_segments = model.transcribe(samples, fp16=fp16, language=language).get('segments', [])
+            else:
+                local_segments = segments_from_tokens(result.tokens, tokenizer, window_seconds)
+
+            window_segments = [{
+                'start': window.to_source_time(seg['start']),
+                'end': window.to_source_time(seg['end'], is_end=True),
+                'text': seg['text'],
+            } for seg in local_segments]
+            window_segments = merge_window_segments(segments, window_segments, window.core_start, window.core_end)
+            segments.extend(window_segments)
+            batch_segments.extend(window_segments)
+            count('windows')
+            count('segments', len(window_segments))
+
+            if progress:
+                progress.update(window.source_end)
+            if segment_callback:
+                segment_callback(window_segments, progress)
+
+        if checkpoint is not None:
+            checkpoint.record(position, batch_segments, batch[-1].source_end, language=language)
+
+    return segments
+
+
+def compare_with_sequential(audio, model_size='small', batch_size=8):
+    """Расшифровывает запись последовательно и пакетами: скорость и совпадение текста."""
+    from app.convert_to_wav import SAMPLE_RATE
+    from app.execution_plan import plan_execution
+    from app.model_registry import model_registry
+    from app.transcribe import decode_windows
+    from app.vad import split_into_windows
+
+    plan = plan_execution(model_size)
+    plan.apply()
+    model = model_registry.get(model_size, plan.device, plan.precision)
+    windows = split_into_windows(audio)
+    fp16 = plan.precision == 'fp16'
+
+    results = {}
+    for name, size in (('sequential', 1), ('batched', batch_size)):
+        started = time.perf_counter()
+        segments = decode_windows(model, audio, windows, fp16, batch_size=size, model_size=model_size)
+        results[name] = {'seconds': time.perf_counter() - started,
+                         'text': ' '.join(seg['text'].strip() for seg in segments), 'segments': len(segments)}
+
+    duration = len(audio) / SAMPLE_RATE
+    return {
+        'model': model_size,
+        'device': plan.device,
+        'precision': plan.precision,
+        'batch_size': batch_size,
+        'windows': len(windows),
+        'audio_seconds': round(duration, 2),
+        'segments': {name: result['segments'] for name, result in results.items()},
+        'rtf': {name: round(result['seconds'] / duration, 4) for name, result in results.items()},
+        'windows_per_second': {name: round(len(windows) / result['seconds'], 3) for name, result in results.items()},
+        'speedup': round(results['sequential']['seconds'] / results['batched']['seconds'], 2),
+        'text_similarity': round(difflib.SequenceMatcher(None, results['sequential']['text'].split(),
+                                                         results['batched']['text'].split()).ratio(), 4),
+    }
+
+
+def main(argv=None):
+    import whisper
+
+    from app.tracing import setup_logging
+    from app.transcribe import prepare_audio
+
+    parser = argparse.ArgumentParser(description='Пакетная расшифровка: сравнение с последовательной')
+    parser.add_argument('file')
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--batch', type=int, default=8, help='окон в пакете')
+    parser.add_argument('--seconds', type=float, default=600, help='сколько секунд записи сравнивать')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    audio = prepare_audio(args.file, save_converted=False)[:int(args.seconds * whisper.audio.SAMPLE_RATE)]
+    print(json.dumps(compare_with_sequential(audio, args.model, args.batch), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from app import APP_VERSION, CACHE_DIR, FFMPEG_PATH, WHISPER_MODELS_DIR, check_ffmpeg
+from app.tracing import setup_logging
+
+# Версия формата отчёта: отчёты разных версий между собой не сравниваются
+REPORT_VERSION = 1
+FIXTURES_DIR = CACHE_DIR / 'bench_fixtures'
+# Длительности синтетических записей по умолчанию (с)
+DEFAULT_LENGTHS = (30, 120, 600)
+STAGES = ('convert', 'load', 'compile', 'decode', 'format')
+# Регрессия: стало медленнее (или памяти больше) на эту долю и одновременно на абсолютный порог ниже
+DEFAULT_THRESHOLD = 0.10
+MIN_SECONDS_DELTA = 0.05
+MIN_MEMORY_DELTA_MB = 20
+# Как часто замерять память процесса во время этапа (с)
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+log = logging.getLogger(__name__)
+
+
+def current_rss_mb():
+    """Текущий объём памяти процесса (RSS, МБ) или None, если его нечем узнать."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StageMeter:
+    """Замеряет этап: время, пик RSS (фоновым опросом) и пик видеопамяти CUDA."""
+
+    def __init__(self, device):
+        self.device = device
+        self.results = {}
+
+    def measure(self, name, func, *args, **kwargs):
+        import torch
+
+        use_cuda = self.device == 'cuda' and torch.cuda.is_available()
+        if use_cuda:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+
+        peak = [current_rss_mb()]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(MEMORY_SAMPLE_INTERVAL):
+                rss = current_rss_mb()
+                if rss is not None and (peak[0] is None or rss > peak[0]):
+                    peak[0] = rss
+
+        sampler = threading.Thread(target=sample, name=f'bench-{name}', daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            if use_cuda:
+                torch.cuda.synchronize()
+        finally:
+            seconds = time.perf_counter() - started
+            done.set()
+            sampler.join()
+
+        rss = current_rss_mb()
+        if rss is not None and (peak[0] is None or rss > peak[0]):
+            peak[0] = rss
+
+        self.results[name] = {
+            'seconds': round(seconds, 4),
+            'peak_rss_mb': round(peak[0], 1) if peak[0] is not None else None,
+            'peak_vram_mb': round(torch.cuda.max_memory_allocated() / 1024 / 1024, 1) if use_cuda else None,
+        }
+        return result
+
+
+def available_devices():
+    import torch
+
+    devices = ['cpu']
+    if torch.cuda.is_available():
+        devices.append('cuda')
+    if torch.backends.mps.is_available():
+        devices.append('mps')
+    return devices
+
+
+def available_models():
+    """Модели, веса которых уже лежат в whisper_models (чтобы бенчмарк не скачивал их)."""
+    return sorted(path.stem for path in WHISPER_MODELS_DIR.glob('*.pt')) or ['small']
+
+
+def make_fixture(seconds, source=None):
+    """Готовит запись заданной длины в MP3, чтобы этап конвертации тоже работал как в реальной задаче.
+
+    Без source генерируется детерминированный сигнал (тон с шумом и паузами), иначе
+    из source вырезается начало нужной длины (короткий source повторяется).
+    """
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    name = Path(source).stem if source else 'synthetic'
+    output_path = FIXTURES_DIR / f'{name}_{seconds}s.mp3'
+    if output_path.is_file():
+        return output_path
+
+    if source:
+        inputs = ['-stream_loop', '-1', '-i', str(source)]
+    else:
+        # Тон 220 Гц с шумом (фиксированное зерно), каждые 4 секунды - секунда тишины
+        inputs = ['-f', 'lavfi', '-i',
+                  'sine=frequency=220:sample_rate=16000,volume=0.3,'
+                  'volume=enable=\'gte(mod(t,4),3)\':volume=0',
+                  '-f', 'lavfi', '-i', 'anoisesrc=color=pink:amplitude=0.02:seed=42:sample_rate=16000',
+                  '-filter_complex', 'amix=inputs=2:duration=first']
+
+    command = [str(FFMPEG_PATH), '-nostdin', '-y', *inputs, '-t', str(seconds), '-vn', '-ac', '1',
+               '-b:a', '64k', str(output_path)]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        output_path.unlink(missing_ok=True)
+        raise RuntimeError(f'Не удалось подготовить запись {output_path.name}: '
+                           f'{result.stderr.decode(errors="ignore")[-500:]}')
+    return output_path
+
+
+def _run_case(fixture, model_size, device, use_compile, backend='torch', batch_size=1):
+    """Выполняется в отдельном процессе: прогоняет конвейер расшифровки по этапам."""
+    from app.convert_to_wav import SAMPLE_RATE
+    from app.model_registry import default_precision, set_cpu_backend
+    from app.transcribe import decode_windows, format_segments, prepare_audio
+    from app.vad import split_into_windows
+
+    set_cpu_backend(backend)
+    precision = default_precision(device)
+    use_onnx = precision.startswith('onnx')
+    use_compile = use_compile and not use_onnx
+    meter = StageMeter(device)
+
+    audio = meter.measure('convert', prepare_audio, str(fixture), save_converted=False)
+    if use_onnx:
+        from app.onnx_backend import ensure_exported, load_onnx_model
+
+        # Экспорт выполняется один раз на модель, поэтому в замер загрузки не входит
+        ensure_exported(model_size, precision == 'onnx-int8')
+        weights = 'onnx'
+        model = meter.measure('load', load_onnx_model, model_size, precision == 'onnx-int8')
+    else:
+        from app.mapped_weights import MMAP_ENABLED, convert_checkpoint, is_converted, load_model, mmap_supported
+
+        # Конвертация весов для mmap, как и экспорт ONNX, выполняется один раз и в замер не входит.
+        # Модель при этом не загружаем, иначе замер загрузки всегда шёл бы по прогретому кэшу
+        if MMAP_ENABLED and mmap_supported() and not is_converted(model_size):
+            try:
+                convert_checkpoint(model_size)
+            except Exception as e:
+                log.warning('Не удалось подготовить веса %s для mmap: %s', model_size, e)
+        weights = 'mmap' if MMAP_ENABLED and is_converted(model_size) else 'pt'
+        model = meter.measure('load', load_model, model_size, device)
+
+    def compile_and_warm_up():
+        # Компиляция так же, как в обычной работе (энкодер, дисковый кэш Inductor), плюс первый прогон
+        if use_compile:
+            from app.compile_manager import compile_manager
+
+            compile_manager.compile(model, model_size, device)
+        model.transcribe(audio[:5 * SAMPLE_RATE], fp16=precision == 'fp16')
+
+    meter.measure('compile', compile_and_warm_up)
+    segments = meter.measure('decode', decode_windows, model, audio, split_into_windows(audio),
+                             precision == 'fp16', batch_size=batch_size, model_size=model_size)
+    meter.measure('format', format_segments, segments)
+
+    return {
+        'model': model_size,
+        'device': device,
+        'precision': precision,
+        'compile': use_compile,
+        'weights': weights,
+        'batch_size': batch_size,
+        'audio': Path(fixture).name,
+        'audio_seconds': round(len(audio) / SAMPLE_RATE, 2),
+        'segments': len(segments),
+        'stages': meter.results,
+    }
+
+
+def _summarize(runs):
+    """Сводит повторы одного случая: медиана времени и максимум памяти по каждому этапу."""
+    result = dict(runs[0])
+    stages = {}
+    for name in STAGES:
+        values = [run['stages'][name] for run in runs]
+        stages[name] = {
+            'seconds': round(statistics.median(value['seconds'] for value in values), 4),
+            'peak_rss_mb': max((value['peak_rss_mb'] for value in values if value['peak_rss_mb'] is not None),
+                               default=None),
+            'peak_vram_mb': max((value['peak_vram_mb'] for value in values if value['peak_vram_mb'] is not None),
+                                default=None),
+        }
+    result['stages'] = stages
+    result['repeat'] = len(runs)
+    result['total_seconds'] = round(sum(stage['seconds'] for stage in stages.values()), 4)
+    if result['audio_seconds']:
+        result['rtf'] = round(stages['decode']['seconds'] / result['audio_seconds'], 4)
+    else:
+        result['rtf'] = None
+    return result
+
+
+def system_info():
+    import torch
+    import whisper
+
+    return {
+        'app_version': APP_VERSION,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'whisper': getattr(whisper, '__version__', 'unknown'),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'cuda': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+    }
+
+
+def run_benchmark(models, devices, lengths, source=None, repeat=1, compile_modes=(True,), backend='torch',
+                  batch_size=1):
+    """Прогоняет все сочетания модели, устройства и длины записи; каждый прогон - в новом процессе,
+    чтобы пики памяти и время загрузки не зависели от предыдущих прогонов."""
+    fixtures = [make_fixture(seconds, source) for seconds in lengths]
+    results = []
+
+    for model_size in models:
+        for device in devices:
+            for fixture in fixtures:
+                for use_compile in compile_modes:
+                    runs = []
+                    for attempt in range(repeat):
+                        log.info('Бенчмарк: %s на %s, %s, компиляция: %s (%s/%s)', model_size, device, fixture.name,
+                                 use_compile, attempt + 1, repeat)
+                        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                            runs.append(pool.submit(_run_case, fixture, model_size, device, use_compile,
+                                                    backend, batch_size).result())
+                    result = _summarize(runs)
+                    results.append(result)
+                    log.info('%s', format_result(result))
+
+    return {'version': REPORT_VERSION, 'created': time.time(), 'system': system_info(), 'results': results}
+
+
+def format_result(result):
+    stages = ', '.join(f'{name} {stage["seconds"]:.2f} с' for name, stage in result['stages'].items())
+    rss = max((stage['peak_rss_mb'] or 0 for stage in result['stages'].values()), default=0)
+    return (f'{result["model"]}/{result["device"]} {result["audio"]}: {stages}; '
+            f'RTF {result["rtf"]}, пик RSS {rss:.0f} МБ')
+
+
+def _case_key(result):
+    return (result['model'], result['device'], result['precision'], result['compile'], result['audio'],
+            result.get('batch_size', 1))
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Сравнивает два отчёта и возвращает список регрессий (строки с описанием)."""
+    if baseline.get('version') != current.get('version'):
+        raise ValueError('Отчёты разных версий формата нельзя сравнивать')
+
+    base_results = {_case_key(result): result for result in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        base = base_results.get(_case_key(result))
+        if base is None:
+            continue
+        case = f'{result["model"]}/{result["device"]} {result["audio"]}'
+
+        for name, stage in result['stages'].items():
+            base_stage = base['stages'].get(name)
+            if base_stage is None:
+                continue
+            for field, min_delta, unit in (('seconds', MIN_SECONDS_DELTA, 'с'),
+                                           ('peak_rss_mb', MIN_MEMORY_DELTA_MB, 'МБ'),
+                                           ('peak_vram_mb', MIN_MEMORY_DELTA_MB, 'МБ')):
+                old, new = base_stage.get(field), stage.get(field)
+                if old is None or new is None:
+                    continue
+                if new - old > min_delta and new > old * (1 + threshold):
+                    regressions.append(f'{case}: {name}.{field} {old} -> {new} {unit} '
+                                       f'(+{(new / old - 1) * 100 if old else 100:.0f}%)')
+
+    return regressions
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_report(report, path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def print_regressions(regressions):
+    if regressions:
+        print(f'Найдено регрессий: {len(regressions)}')
+        for regression in regressions:
+            print(f'  {regression}')
+    else:
+        print('Регрессий не найдено')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк расшифровки: время этапов, RTF и пик памяти')
+    parser.add_argument('--benchmark', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--models', nargs='+', help='модели (по умолчанию - все из whisper_models)')
+    parser.add_argument('--devices', nargs='+', help='устройства (по умолчанию - все доступные)')
+    parser.add_argument('--lengths', nargs='+', type=int, default=list(DEFAULT_LENGTHS),
+                        help='длительности записей (с)')
+    parser.add_argument('--audio', help='взять записи из этого файла вместо синтетического сигнала')
+    parser.add_argument('--repeat', type=int, default=1, help='повторов каждого случая (берётся медиана)')
+    parser.add_argument('--compile', default='on', choices=('on', 'off', 'both'),
+                        help='с torch.compile, без него или оба варианта (для решения, когда компиляция окупается)')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='окон в пакете (1 - последовательная расшифровка, для сравнения с пакетной)')
+    parser.add_argument('--backend', default='torch', choices=('torch', 'onnx', 'onnx-int8'),
+                        help='бэкенд расшифровки на CPU')
+    parser.add_argument('--output', default=str(CACHE_DIR / 'benchmark.json'), help='куда сохранить отчёт')
+    parser.add_argument('--baseline', help='сравнить результат с сохранённым отчётом')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='только сравнить два сохранённых отчёта')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='допустимое ухудшение (доля, по умолчанию 0.10)')
+    parser.add_argument('--streaming-check', action='store_true',
+                        help='только проверить, что потоковый режим держит память на многочасовой записи')
+    parser.add_argument('--hours', type=float, default=10, help='длина записи для --streaming-check (ч)')
+    args, _ = parser.parse_known_args(argv)
+
+    if args.streaming_check:
+        from app.streaming import check_memory
+
+        result = check_memory(args.hours)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if result['growth_mb'] is None:
+            print('Не удалось измерить память процесса (нет psutil и /proc)')
+        elif not result['passed']:
+            print(f'Память выросла на {result["growth_mb"]} МБ при допустимых {result["budget_mb"]} МБ')
+        return 0 if result['passed'] else 1
+
+    if args.compare:
+        regressions = compare_reports(load_report(args.compare[0]), load_report(args.compare[1]), args.threshold)
+        print_regressions(regressions)
+        return 1 if regressions else 0
+
+    check_ffmpeg()
+    compile_modes = {'on': (True,), 'off': (False,), 'both': (True, False)}[args.compile]
+    report = run_benchmark(args.models or available_models(), args.devices or available_devices(), args.lengths,
+                           args.audio, args.repeat, compile_modes, args.backend, args.batch)
+    save_report(report, args.output)
+    print(f'Отчёт сохранён: {args.output}')
+
+    if args.baseline:
+        regressions = compare_reports(load_report(args.baseline), report, args.threshold)
+        print_regressions(regressions)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    setup_logging()
+    sys.exit(main())
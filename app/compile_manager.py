@@ -0,0 +1,240 @@
+"""Управление torch.compile: дисковый кэш Inductor и включение компиляции только там, где она окупается.
+
+Решение принимается по отчёту бенчмарка (python run.py --benchmark --compile both): для модели
+и устройства сравниваются прогоны с компиляцией и без. Из них получается выигрыш на секунду аудио
+и разовая стоимость компиляции, а по ним - минимальная длина записи, с которой компиляция выгодна.
+
+Сводка: python -m app.compile_manager
+"""
+import json
+import logging
+import os
+import statistics
+import threading
+import weakref
+
+import torch
+from packaging.version import Version
+
+from app import CACHE_DIR
+from app.tracing import count, span
+
+TORCH_VERSION = torch.__version__
+# Скомпилированные графы Inductor переживают перезапуск; версия torch входит в путь, потому что
+# артефакты разных версий несовместимы. Модель и устройство Inductor учитывает в ключе графа сам.
+INDUCTOR_CACHE_DIR = CACHE_DIR / 'inductor' / f'torch-{TORCH_VERSION}'
+os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', str(INDUCTOR_CACHE_DIR))
+os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+
+BENCHMARK_REPORT = CACHE_DIR / 'benchmark.json'
+# auto - по результатам бенчмарка, 1 - всегда, 0 - никогда
+COMPILE_MODE = os.environ.get('VOICE_DECODER_COMPILE', 'auto')
+
+log = logging.getLogger(__name__)
+
+
+def compile_supported():
+    """torch.compile появился в PyTorch 2.0 (сравниваем версии, а не строки: '10.0' < '2.0' как строки)."""
+    return Version(TORCH_VERSION) >= Version('2.0') and hasattr(torch, 'compile')
+
+
+class CompilePayoff:
+    """Замеры бенчмарка для модели и устройства: выигрыш на секунду аудио и стоимость компиляции."""
+
+    def __init__(self, gain_per_second, overhead_seconds, samples):
+        self.gain_per_second = gain_per_second
+        self.overhead_seconds = overhead_seconds
+        self.samples = samples
+
+    @property
+    def break_even_seconds(self):
+        """С какой длины записи компиляция окупается (None - не окупается никогда)."""
+        if self.gain_per_second <= 0:
+            return None
+        return max(0.0, self.overhead_seconds) / self.gain_per_second
+
+    def saved_seconds(self, audio_seconds, include_overhead=True):
+        saved = self.gain_per_second * audio_seconds
+        return saved - self.overhead_seconds if include_overhead else saved
+
+    def to_dict(self):
+        return {
+            'gain_per_audio_second': round(self.gain_per_second, 5),
+            'overhead_seconds': round(self.overhead_seconds, 2),
+            'break_even_audio_seconds': round(self.break_even_seconds, 1) if self.break_even_seconds is not None
+            else None,
+            'samples': self.samples,
+        }
+
+
+class CompileManager:
+    """Компилирует энкодер резидентных моделей, когда это выгодно, и считает сэкономленное время.
+
+    Компилируется только энкодер: у него фиксированная форма входа (30 секунд mel), а декодер с хуками
+    KV-кэша и растущей длиной последовательности постоянно перекомпилировался бы.
+    """
+
+    def __init__(self, report_path=BENCHMARK_REPORT, mode=COMPILE_MODE):
+        self.report_path = report_path
+        self.mode = mode
+        self.saved_seconds = 0.0
+        self._payoffs = None
+        self._report_mtime = None
+        self._compiled = weakref.WeakSet()
+        self._failed = set()  # (model_size, device): компиляция не удалась, больше не пробуем
+        self._locks = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def payoff(self, model_size, device):
+        return self._load_payoffs().get((model_size, device))
+
+    def should_compile(self, model_size, device, audio_seconds=None):
+        """Стоит ли компилировать модель для записи длиной audio_seconds (None - хоть для какой-то длины)."""
+        if self.mode == '0' or not compile_supported() or (model_size, device) in self._failed:
+            return False
+        if self.mode == '1':
+            return True
+
+        payoff = self.payoff(model_size, device)
+        if payoff is None or payoff.break_even_seconds is None:
+            return False
+        return audio_seconds is None or audio_seconds >= payoff.break_even_seconds
+
+    def is_compiled(self, model):
+        return model in self._compiled
+
+    def prepare(self, model, model_size, device, audio_seconds):
+        """Вызывается перед расшифровкой: при выгоде компилирует модель и учитывает сэкономленное время."""
+        if not isinstance(model, torch.nn.Module):
+            return False
+
+        with self._model_lock(model):
+            compiled_now = False
+            if not self.is_compiled(model):
+                if not self.should_compile(model_size, device, audio_seconds):
+                    return False
+                compiled_now = self._compile(model, model_size, device)
+                if not compiled_now:
+                    return False
+
+        payoff = self.payoff(model_size, device)
+        if payoff is not None:
+            saved = payoff.saved_seconds(audio_seconds, include_overhead=compiled_now)
+            with self._lock:
+                self.saved_seconds += saved
+            count('compile_saved_seconds', saved)
+            log.info('torch.compile для %s на %s: ожидаемая экономия %.1f с', model_size, device, saved)
+        return True
+
+    def compile(self, model, model_size, device):
+        """Компилирует модель независимо от замеров (для бенчмарка)."""
+        with self._model_lock(model):
+            return self.is_compiled(model) or self._compile(model, model_size, device)
+
+    def warm_up(self, model, model_size, device):
+        """Фоновая подготовка после предзагрузки: компиляция (из дискового кэша) ещё до первой задачи."""
+        if not isinstance(model, torch.nn.Module) or not self.should_compile(model_size, device):
+            return
+        with self._model_lock(model):
+            if not self.is_compiled(model):
+                self._compile(model, model_size, device)
+
+    def stats(self):
+        with self._lock:
+            saved = self.saved_seconds
+        return {
+            'mode': self.mode,
+            'torch': TORCH_VERSION,
+            'supported': compile_supported(),
+            'inductor_cache': str(INDUCTOR_CACHE_DIR),
+            'saved_seconds': round(saved, 1),
+            'payoffs': {f'{model_size}/{device}': payoff.to_dict()
+                        for (model_size, device), payoff in self._load_payoffs().items()},
+        }
+
+    def _model_lock(self, model):
+        with self._lock:
+            return self._locks.setdefault(model, threading.Lock())
+
+    def _compile(self, model, model_size, device):
+        """Компилирует энкодер и сразу прогоняет его: ошибки компиляции всплывают здесь, а не посреди задачи."""
+        import whisper
+
+        encoder = model.encoder
+        try:
+            with span('compile', model=model_size, device=device):
+                model.encoder = torch.compile(encoder, dynamic=False)
+                mel = torch.zeros(1, model.dims.n_mels, whisper.audio.N_FRAMES, device=model.device)
+                with torch.no_grad():
+                    model.encoder(mel.half() if device != 'cpu' else mel)
+        except Exception as e:
+            log.warning('Ошибка при компиляции модели %s, работаем без компиляции: %s', model_size, e)
+            model.encoder = encoder
+            self._failed.add((model_size, device))
+            return False
+
+        self._compiled.add(model)
+        log.debug('Энкодер %s скомпилирован (кэш Inductor: %s)', model_size, INDUCTOR_CACHE_DIR)
+        return True
+
+    def _load_payoffs(self):
+        """Читает отчёт бенчмарка заново, только если файл изменился."""
+        try:
+            mtime = os.path.getmtime(self.report_path)
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if self._payoffs is not None and mtime == self._report_mtime:
+                return self._payoffs
+
+        payoffs = {}
+        if mtime is not None:
+            try:
+                with open(self.report_path, encoding='utf-8') as file:
+                    payoffs = payoffs_from_report(json.load(file))
+            except (OSError, ValueError, KeyError) as e:
+                log.warning('Не удалось прочитать отчёт бенчмарка %s: %s', self.report_path, e)
+
+        with self._lock:
+            self._payoffs = payoffs
+            self._report_mtime = mtime
+        return payoffs
+
+
+def payoffs_from_report(report):
+    """Сопоставляет прогоны с компиляцией и без для одной модели, устройства и записи."""
+    if report.get('system', {}).get('torch') != TORCH_VERSION:
+        # Замеры другой версии torch к текущей не относятся
+        return {}
+
+    runs = {}
+    for result in report['results']:
+        if result['precision'].startswith('onnx'):
+            continue
+        key = (result['model'], result['device'], result['audio'], result.get('batch_size', 1))
+        runs.setdefault(key, {})[bool(result['compile'])] = result
+
+    gains, overheads = {}, {}
+    for (model_size, device, _, _), pair in runs.items():
+        if True not in pair or False not in pair:
+            continue
+        compiled, plain = pair[True], pair[False]
+        audio_seconds = compiled['audio_seconds']
+        if not audio_seconds:
+            continue
+        gains.setdefault((model_size, device), []).append(
+            (plain['stages']['decode']['seconds'] - compiled['stages']['decode']['seconds']) / audio_seconds)
+        # Этап compile включает первый прогон; без компиляции это просто прогрев
+        overheads.setdefault((model_size, device), []).append(
+            compiled['stages']['compile']['seconds'] - plain['stages']['compile']['seconds'])
+
+    return {key: CompilePayoff(statistics.median(gains[key]), statistics.median(overheads[key]), len(gains[key]))
+            for key in gains}
+
+
+compile_manager = CompileManager()
+
+
+if __name__ == '__main__':
+    print(json.dumps(compile_manager.stats(), ensure_ascii=False, indent=2))
@@ -1,32 +1,93 @@
+import logging
 import os
+import struct
 import subprocess
+import wave
 from pathlib import Path
 
+import numpy as np
+
 from app import FFMPEG_PATH
+from app.tracing import span
 
+SAMPLE_RATE = 16000
 
-def convert_to_wav(input_path):
-    """Конвертирует аудио- или видеофайл в WAV (PCM 16-bit, 16kHz, mono)"""
-    try:
-        input_path = Path(input_path)
-        output_path = input_path.parent / f'convert_file_{input_path.stem}.wav'
+log = logging.getLogger(__name__)
+
+
+def converted_wav_path(input_path):
+    """Путь, по которому сохраняется конвертированный WAV рядом с исходным файлом."""
+    input_path = Path(input_path)
+    return input_path.parent / f'convert_file_{input_path.stem}.wav'
+
+
+def decode_audio(input_path):
+    """Декодирует аудио- или видеофайл в память: float32, 16kHz, mono, без временных файлов."""
+    input_path = Path(input_path)
+
+    command = [
+        str(FFMPEG_PATH), '-nostdin', '-threads', '0',
+        '-i', str(input_path),
+        '-vn', '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-acodec', 'pcm_s16le',
+        '-'
+    ]
+
+    log.debug('Запуск FFmpeg: %s', ' '.join(command))
+
+    with span('ffmpeg_decode', file=input_path.name):
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        command = [
-            str(FFMPEG_PATH), '-i', str(input_path),
-            '-ac', '1', '-ar', '16000', '-acodec', 'pcm_s16le',
-            '-threads', '0',
-            '-y', str(output_path)
-        ]
+    if result.returncode != 0:
+        log.error('FFmpeg ошибка: %s', result.stderr.decode(errors='ignore'))
+        raise RuntimeError(f'Ошибка при декодировании файла {input_path}')
 
-        print(f'[DEBUG] Запуск FFmpeg: {" ".join(command)}')
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
 
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
-        if not os.path.exists(output_path):
-            print(f'FFmpeg ошибка: {result.stderr}')
-            raise FileNotFoundError(f'FFmpeg не создал файл: {output_path}')
+def wav_data_range(input_path):
+    """Смещение и размер блока data в WAV (байт).
 
-        return str(output_path)
+    Модуль wave не читает WAVE_FORMAT_EXTENSIBLE, поэтому блок ищется по заголовкам RIFF напрямую.
+    """
+    file_size = os.path.getsize(input_path)
+    with open(input_path, 'rb') as file:
+        file.seek(12)
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise ValueError(f'В файле {input_path} нет блока data')
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'data':
+                offset = file.tell()
+                # Программы, пишущие WAV потоком, оставляют в размере 0xFFFFFFFF
+                if offset + chunk_size > file_size:
+                    chunk_size = file_size - offset
+                return offset, chunk_size
+            file.seek(chunk_size + (chunk_size & 1), 1)
 
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f'Ошибка при конвертации файла {input_path}: {e}')
+
+def read_pcm_wav(input_path):
+    """Читает WAV, который уже в формате PCM 16-bit, 16kHz, mono, без запуска ffmpeg."""
+    with span('read_wav', file=Path(input_path).name):
+        offset, size = wav_data_range(input_path)
+        samples = np.fromfile(input_path, '<i2', count=size // 2, offset=offset)
+
+    return samples.astype(np.float32) / 32768.0
+
+
+def save_wav(audio, output_path):
+    """Сохраняет уже декодированный буфер в WAV (PCM 16-bit, 16kHz, mono)"""
+    pcm = np.clip(np.round(audio * 32768.0), -32768, 32767).astype('<i2')
+
+    with wave.open(str(output_path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(pcm.tobytes())
+
+    return str(output_path)
+
+
+def convert_to_wav(input_path):
+    """Конвертирует аудио- или видеофайл в WAV (PCM 16-bit, 16kHz, mono)"""
+    return save_wav(decode_audio(input_path), converted_wav_path(input_path))
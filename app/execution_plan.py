@@ -0,0 +1,310 @@
+"""План выполнения: на каком устройстве, в какой точности и со сколькими потоками расшифровывать.
+
+Железо опрашивается один раз за время работы (probe_hardware), план для модели строится по этим данным
+(plan_execution). План выбирает устройство, точность, число потоков torch и размер пакета окон,
+проверяет, помещается ли модель в память, и советует самую большую модель, которая помещается.
+
+Отчёт о плане: python -m app.execution_plan [модель]
+"""
+import json
+import logging
+import os
+import sys
+import threading
+
+from app.model_registry import MODEL_MEMORY_MB, default_precision, model_registry
+
+# Модели, которые предлагает интерфейс, от меньшей к большей
+MODEL_SIZES = ('small', 'medium', 'large-v3')
+# Память сверх весов: активации, KV-кэш, буферы CUDA (МБ)
+WORKSPACE_MB = 600
+# Запас памяти на одно дополнительное окно в пакете (МБ, энкодер fp16 + KV-кэш декодера)
+WINDOW_MEMORY_MB = 350
+MAX_BATCH_SIZE = 16
+# На CPU пакет помогает меньше: матрицы и так загружают все ядра. Выигрыш не замерен, а окна пакета
+# идут без контекста между ними, поэтому по умолчанию CPU расшифровывает по одному окну
+# (поднять - VOICE_DECODER_BATCH_SIZE после замера python -m app.benchmark --batch N)
+CPU_MAX_BATCH_SIZE = 1
+# Потоков torch на стороне CPU, когда считает видеокарта
+GPU_HOST_THREADS = 4
+
+log = logging.getLogger(__name__)
+
+
+def _env_int(name):
+    """Целое из переменной окружения; при неверном значении - предупреждение и None (выбор плана)."""
+    value = os.environ.get(name)
+    if not value:
+        return None
+    try:
+        return max(1, int(value))
+    except ValueError:
+        log.warning('Неверное значение %s=%r, используется значение по умолчанию', name, value)
+        return None
+
+
+# Переопределить число потоков torch и размер пакета окон (1 - расшифровка по одному окну)
+THREADS_OVERRIDE = _env_int('VOICE_DECODER_THREADS')
+BATCH_SIZE_OVERRIDE = _env_int('VOICE_DECODER_BATCH_SIZE')
+
+_hardware = None
+_lock = threading.Lock()
+
+
+class ModelTooLargeError(MemoryError):
+    """Модель не помещается в память ни на одном доступном устройстве."""
+
+
+class HardwareInfo:
+    """Что известно о компьютере: ядра, память, видеокарта. None - узнать не удалось."""
+
+    def __init__(self):
+        self.logical_cores = os.cpu_count() or 1
+        self.physical_cores = None
+        self.ram_total_mb = None
+        self.ram_available_mb = None
+        self.cuda_name = None
+        self.cuda_capability = None
+        self.vram_total_mb = None
+        self.vram_free_mb = None
+        self.cuda_bf16 = False
+        self.gpu_without_driver = False
+        self.mps = False
+
+    @property
+    def cores(self):
+        return self.physical_cores or self.logical_cores
+
+    @property
+    def cuda(self):
+        return self.cuda_name is not None
+
+    @property
+    def cuda_fp16(self):
+        # Быстрые операции fp16 есть начиная с compute capability 5.3
+        return self.cuda and self.cuda_capability is not None and self.cuda_capability >= (5, 3)
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _probe_memory(info):
+    try:
+        import psutil
+
+        memory = psutil.virtual_memory()
+        info.ram_total_mb = memory.total / 1024 / 1024
+        info.ram_available_mb = memory.available / 1024 / 1024
+        info.physical_cores = psutil.cpu_count(logical=False)
+        return
+    except ImportError:
+        pass
+
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            info.ram_total_mb = status.ullTotalPhys / 1024 / 1024
+            info.ram_available_mb = status.ullAvailPhys / 1024 / 1024
+        return
+
+    try:
+        with open('/proc/meminfo') as file:
+            meminfo = {line.split(':')[0]: int(line.split()[1]) for line in file}
+        info.ram_total_mb = meminfo['MemTotal'] / 1024
+        info.ram_available_mb = meminfo.get('MemAvailable', meminfo.get('MemFree', 0)) / 1024
+    except (OSError, ValueError, KeyError, IndexError):
+        pass
+
+
+def _probe_gpu(info):
+    import torch
+
+    if torch.cuda.is_available():
+        info.cuda_name = torch.cuda.get_device_name(0)
+        info.cuda_capability = tuple(torch.cuda.get_device_capability(0))
+        free, total = torch.cuda.mem_get_info(0)
+        info.vram_free_mb = free / 1024 / 1024
+        info.vram_total_mb = total / 1024 / 1024
+        info.cuda_bf16 = torch.cuda.is_bf16_supported()
+    elif torch.cuda.device_count() > 0:
+        info.gpu_without_driver = True
+
+    info.mps = torch.backends.mps.is_available()  # Apple M1/M2
+
+
+def available_ram_mb():
+    """Свободная оперативная память прямо сейчас (МБ); None - узнать не удалось."""
+    info = HardwareInfo()
+    _probe_memory(info)
+    return info.ram_available_mb
+
+
+def probe_hardware():
+    """Опрашивает железо один раз; дальше возвращает запомненный результат."""
+    global _hardware
+    with _lock:
+        if _hardware is None:
+            info = HardwareInfo()
+            _probe_memory(info)
+            try:
+                _probe_gpu(info)
+            except Exception as e:
+                log.warning('Ошибка при определении видеокарты: %s', e)
+            _hardware = info
+        return _hardware
+
+
+def required_mb(model_size, precision):
+    """Сколько памяти нужно модели с рабочими буферами."""
+    weights = MODEL_MEMORY_MB.get(model_size, MODEL_MEMORY_MB['large'])
+    if precision == 'fp16':
+        weights /= 2
+    elif precision == 'onnx-int8':
+        weights /= 4
+    return weights + WORKSPACE_MB
+
+
+class ExecutionPlan:
+    """Выбранные параметры расшифровки и пояснения к выбору."""
+
+    def __init__(self, hardware, model_size, device, precision, threads, batch_size, memory_mb, required,
+                 recommended_model, notes):
+        self.hardware = hardware
+        self.model_size = model_size
+        self.device = device
+        self.precision = precision
+        self.threads = threads
+        self.batch_size = batch_size
+        self.memory_mb = memory_mb  # сколько памяти доступно на выбранном устройстве (None - неизвестно)
+        self.required_mb = required
+        self.recommended_model = recommended_model
+        self.notes = notes
+
+    @property
+    def fits(self):
+        return self.memory_mb is None or self.required_mb <= self.memory_mb
+
+    def apply(self):
+        """Выставляет число потоков torch (процессно-глобальная настройка)."""
+        import torch
+
+        if torch.get_num_threads() != self.threads:
+            torch.set_num_threads(self.threads)
+
+    def check(self):
+        """Отказывает заранее, если модель заведомо не поместится в память.
+
+        Железо опрашивается один раз, а свободная память за часы работы меняется: для CPU она читается заново.
+        Уже загруженной модели новая память не нужна.
+        """
+        if self.device == 'cpu' and not model_registry.is_loaded(self.model_size, self.device, self.precision, None):
+            memory_mb = available_ram_mb()
+            if memory_mb is not None:
+                self.memory_mb = memory_mb
+        if not self.fits:
+            raise ModelTooLargeError(
+                f'Модели {self.model_size} нужно около {self.required_mb / 1024:.1f} ГБ памяти, '
+                f'доступно {self.memory_mb / 1024:.1f} ГБ. Выберите модель {self.recommended_model or "поменьше"}')
+
+    def report(self):
+        hardware = self.hardware
+        memory = 'видеопамяти' if self.device == 'cuda' else 'памяти'
+        lines = [f'Устройство: {self.device}' + (f' ({hardware.cuda_name})' if self.device == 'cuda' else ''),
+                 f'Точность: {self.precision}',
+                 f'Потоков CPU: {self.threads} (ядер: {hardware.cores}, логических: {hardware.logical_cores})',
+                 f'Окон в пакете: {self.batch_size}']
+        if self.memory_mb is not None:
+            lines.append(f'Модель {self.model_size}: нужно ~{self.required_mb / 1024:.1f} ГБ {memory}, '
+                         f'доступно {self.memory_mb / 1024:.1f} ГБ')
+        if self.recommended_model:
+            lines.append(f'Рекомендуемая модель: {self.recommended_model}')
+        lines += self.notes
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {
+            'model': self.model_size,
+            'device': self.device,
+            'precision': self.precision,
+            'threads': self.threads,
+            'batch_size': self.batch_size,
+            'memory_mb': round(self.memory_mb) if self.memory_mb is not None else None,
+            'required_mb': round(self.required_mb),
+            'fits': self.fits,
+            'recommended_model': self.recommended_model,
+            'notes': self.notes,
+            'hardware': self.hardware.to_dict(),
+        }
+
+
+def _largest_fitting(memory_mb, precision):
+    if memory_mb is None:
+        return None
+    fitting = [size for size in MODEL_SIZES if required_mb(size, precision) <= memory_mb]
+    return fitting[-1] if fitting else None
+
+
+def plan_execution(model_size='small'):
+    """Строит план для модели по данным опроса железа."""
+    hardware = probe_hardware()
+    notes = []
+
+    device = 'cpu'
+    if hardware.cuda:
+        if hardware.vram_free_mb is None or required_mb(model_size, 'fp16') <= hardware.vram_free_mb:
+            device = 'cuda'
+        else:
+            notes.append(f'Модель {model_size} не помещается в видеопамять, расшифровка пойдёт на CPU')
+    elif hardware.mps:
+        device = 'mps'
+    elif hardware.gpu_without_driver:
+        notes.append('GPU доступен, но не используется! Возможно, не установлены драйверы.')
+
+    if device == 'cuda':
+        precision = 'fp16' if hardware.cuda_fp16 else 'fp32'
+        if not hardware.cuda_fp16:
+            notes.append('Видеокарта без быстрых вычислений fp16, используется fp32')
+        if hardware.cuda_bf16:
+            notes.append('Видеокарта поддерживает bf16')
+        memory = hardware.vram_free_mb
+        threads = min(GPU_HOST_THREADS, hardware.cores)
+    else:
+        precision = default_precision(device)
+        memory = hardware.ram_available_mb if device == 'cpu' else None
+        threads = hardware.cores
+
+    if THREADS_OVERRIDE:
+        threads = THREADS_OVERRIDE
+
+    required = required_mb(model_size, precision)
+    # Пакет окон растёт, пока хватает памяти сверх самой модели; при нехватке во время работы
+    # batched_decode всё равно уменьшит его
+    batch_size = 1
+    if device != 'mps' and memory is not None:
+        limit = MAX_BATCH_SIZE if device == 'cuda' else CPU_MAX_BATCH_SIZE
+        batch_size = max(1, min(limit, int((memory - required) // WINDOW_MEMORY_MB) + 1))
+    if BATCH_SIZE_OVERRIDE:
+        batch_size = BATCH_SIZE_OVERRIDE
+
+    recommended = _largest_fitting(memory, precision)
+    if memory is not None and required > memory:
+        notes.append(f'Модель {model_size} не помещается в доступную память')
+
+    return ExecutionPlan(hardware, model_size, device, precision, threads, batch_size, memory, required,
+                         recommended, notes)
+
+
+if __name__ == '__main__':
+    plan = plan_execution(sys.argv[1] if len(sys.argv) > 1 else 'small')
+    print(plan.report())
+    print(json.dumps(plan.to_dict(), ensure_ascii=False, indent=2, default=str))
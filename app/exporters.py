@@ -0,0 +1,255 @@
+"""Сохранение расшифровки: текст, SRT, WebVTT, JSON lines и DOCX.
+
+Экспортёры пишут сегменты по мере их появления и ничего не накапливают, поэтому память не растёт
+даже на многочасовых записях. Файл пишется под временным именем (.part) и получает настоящее имя
+только после успешного завершения. DOCX собирается через zipfile, без сторонних библиотек.
+"""
+import io
+import json
+import os
+import re
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from app.format_time import format_time
+
+# Пауза между сегментами (с), после которой начинается новый абзац
+PARAGRAPH_PAUSE = 1.2
+DEFAULT_FORMATS = ('txt',)
+# Символы, недопустимые в XML 1.0 (в тексте Whisper изредка встречаются управляющие символы)
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+DOCX_DOCUMENT_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+)
+DOCX_DOCUMENT_TAIL = '<w:sectPr/></w:body></w:document>'
+
+
+def format_text_line(seg, previous_end=0):
+    """Строка текстовой расшифровки; после паузы длиннее PARAGRAPH_PAUSE перед ней пустая строка."""
+    line = f'{format_time(seg["start"])} - {format_time(seg["end"])} {seg["text"]}\n'
+    return '\n' + line if seg['start'] - previous_end > PARAGRAPH_PAUSE else line
+
+
+def format_timestamp(seconds, separator='.'):
+    """Время субтитров: 00:01:02.345 (WebVTT) или 00:01:02,345 (SRT)."""
+    milliseconds = round(max(0.0, seconds) * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02}:{minutes:02}:{secs:02}{separator}{milliseconds:03}'
+
+
+def export_path(file_path, fmt):
+    """Путь, куда сохраняется расшифровка в формате fmt рядом с исходным файлом."""
+    file_path = Path(file_path)
+    return file_path.parent / f'{file_path.stem}.{fmt}'
+
+
+class Exporter:
+    """Пишет сегменты в файл по мере поступления: write() можно вызывать много раз, затем close()."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.part')
+        self.segments = 0
+        self.previous_end = 0
+        self._file = self._open()
+
+    def _open(self):
+        return open(self.tmp_path, 'w', encoding='utf-8', newline='\n')
+
+    def write(self, segments):
+        for seg in segments:
+            self.segments += 1
+            self._write_segment(seg)
+            self.previous_end = seg['end']
+
+    def _write_segment(self, seg):
+        raise NotImplementedError
+
+    def _write_tail(self):
+        pass
+
+    def _close_file(self):
+        self._file.close()
+
+    def finish(self):
+        """Дописывает окончание файла и закрывает его; файл остаётся под временным именем."""
+        self._write_tail()
+        self._close_file()
+
+    def commit(self):
+        """Переименовывает законченный файл из временного."""
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def close(self):
+        """Дописывает окончание файла и переименовывает его из временного."""
+        self.finish()
+        return self.commit()
+
+    def abort(self):
+        """Закрывает и удаляет незаконченный файл (ошибка или отмена задачи)."""
+        try:
+            self._close_file()
+        except (OSError, ValueError):
+            pass
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class TextExporter(Exporter):
+    extension = 'txt'
+
+    def _write_segment(self, seg):
+        self._file.write(format_text_line(seg, self.previous_end))
+
+
+class SrtExporter(Exporter):
+    extension = 'srt'
+
+    def _write_segment(self, seg):
+        self._file.write(f'{self.segments}\n{format_timestamp(seg["start"], ",")} --> '
+                         f'{format_timestamp(seg["end"], ",")}\n{seg["text"].strip()}\n\n')
+
+
+class VttExporter(Exporter):
+    extension = 'vtt'
+
+    def _open(self):
+        file = super()._open()
+        file.write('WEBVTT\n\n')
+        return file
+
+    def _write_segment(self, seg):
+        self._file.write(f'{format_timestamp(seg["start"])} --> {format_timestamp(seg["end"])}\n'
+                         f'{seg["text"].strip()}\n\n')
+
+
+class JsonLinesExporter(Exporter):
+    extension = 'jsonl'
+
+    def _write_segment(self, seg):
+        record = {'start': round(seg['start'], 3), 'end': round(seg['end'], 3), 'text': seg['text'].strip()}
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class DocxExporter(Exporter):
+    """Документ Word: абзац на сегмент, время серым, пустой абзац после паузы (как в тексте).
+
+    Служебные части архива пишутся сразу, а word/document.xml - потоком по мере поступления сегментов.
+    """
+    extension = 'docx'
+
+    def _open(self):
+        self._zip = zipfile.ZipFile(self.tmp_path, 'w', zipfile.ZIP_DEFLATED)
+        self._zip.writestr('[Content_Types].xml', DOCX_CONTENT_TYPES)
+        self._zip.writestr('_rels/.rels', DOCX_RELS)
+        file = io.TextIOWrapper(self._zip.open('word/document.xml', 'w'), encoding='utf-8')
+        file.write(DOCX_DOCUMENT_HEAD)
+        return file
+
+    def _write_segment(self, seg):
+        if seg['start'] - self.previous_end > PARAGRAPH_PAUSE:
+            self._file.write('<w:p/>')
+        times = f'{format_time(seg["start"])} - {format_time(seg["end"])} '
+        text = _XML_INVALID.sub('', seg['text'].strip())
+        self._file.write(f'<w:p><w:r><w:rPr><w:color w:val="808080"/></w:rPr>'
+                         f'<w:t xml:space="preserve">{times}</w:t></w:r>'
+                         f'<w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>')
+
+    def _write_tail(self):
+        self._file.write(DOCX_DOCUMENT_TAIL)
+
+    def _close_file(self):
+        try:
+            self._file.close()
+        finally:
+            self._zip.close()
+
+
+EXPORTERS = {exporter.extension: exporter
+             for exporter in (TextExporter, SrtExporter, VttExporter, JsonLinesExporter, DocxExporter)}
+
+
+def open_exporter(path, fmt=None):
+    """Экспортёр для файла path; формат по умолчанию берётся из расширения."""
+    fmt = fmt or Path(path).suffix.lstrip('.').lower()
+    if fmt not in EXPORTERS:
+        raise ValueError(f'Неизвестный формат расшифровки: {fmt}')
+    return EXPORTERS[fmt](path)
+
+
+class ExportSet:
+    """Все форматы одной задачи: сегменты пишутся в каждый файл за один проход."""
+
+    def __init__(self, file_path, formats=DEFAULT_FORMATS):
+        self.exporters = []
+        try:
+            for fmt in formats:
+                self.exporters.append(open_exporter(export_path(file_path, fmt), fmt))
+        except Exception:
+            self.abort()
+            raise
+
+    def write(self, segments):
+        for exporter in self.exporters:
+            exporter.write(segments)
+
+    def close(self):
+        """Завершает все файлы и возвращает их пути.
+
+        Файлы получают настоящие имена только после того, как закрылись все: если один формат не удалось
+        дописать, рядом с записью не остаётся часть форматов.
+        """
+        try:
+            for exporter in self.exporters:
+                exporter.finish()
+        except Exception:
+            self.abort()
+            raise
+
+        paths = []
+        try:
+            for exporter in self.exporters:
+                paths.append(exporter.commit())
+        except Exception:
+            for path in paths:
+                path.unlink(missing_ok=True)
+            self.abort()
+            raise
+        return paths
+
+    def abort(self):
+        for exporter in self.exporters:
+            exporter.abort()
+
+
+def export_segments(segments, path, fmt=None):
+    """Сохраняет готовый список сегментов в один файл."""
+    exporter = open_exporter(path, fmt)
+    try:
+        exporter.write(segments)
+    except Exception:
+        exporter.abort()
+        raise
+    return exporter.close()
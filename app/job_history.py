@@ -0,0 +1,86 @@
+import json
+import logging
+import threading
+import time
+
+from app import CACHE_DIR
+
+HISTORY_PATH = CACHE_DIR / 'job_history.jsonl'
+# Сколько последних записей хранить: старое железо/версии не должны вечно влиять на оценку
+MAX_RECORDS = 2000
+# Файл перечитывается для обрезки раз в столько записей (первая запись процесса - тоже)
+TRIM_EVERY = 100
+
+_lock = threading.Lock()
+_since_trim = TRIM_EVERY - 1
+
+log = logging.getLogger(__name__)
+
+
+def record_job(model_size, device, audio_seconds, load_seconds, decode_seconds, **options):
+    """Сохраняет замеры завершённой задачи: время загрузки модели и скорость расшифровки."""
+    global _since_trim
+    if audio_seconds <= 0:
+        return
+
+    record = {
+        'time': time.time(),
+        'model': model_size,
+        'device': device,
+        'audio_seconds': round(audio_seconds, 3),
+        'load_seconds': round(load_seconds, 3),
+        'decode_seconds': round(decode_seconds, 3),
+        'rtf': round(decode_seconds / audio_seconds, 5),
+        **options,
+    }
+
+    with _lock:
+        try:
+            HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+            with open(HISTORY_PATH, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            _since_trim += 1
+            if _since_trim >= TRIM_EVERY:
+                _since_trim = 0
+                _trim()
+        except OSError as e:
+            log.warning('Не удалось записать историю задач: %s', e)
+
+
+def load_history(**filters):
+    """Возвращает записи истории, у которых совпадают все поля из filters."""
+    with _lock:
+        records = _read_all()
+    return [record for record in records
+            if all(record.get(key, _default(key)) == value for key, value in filters.items())]
+
+
+def _default(key):
+    # Значения по умолчанию для полей, которых не было в старых записях
+    return {'shards': 1, 'use_vad': False, 'backend': 'torch', 'batch_size': 1}.get(key)
+
+
+def _read_all():
+    records = []
+    try:
+        with open(HISTORY_PATH, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def _trim():
+    records = _read_all()
+    if len(records) <= MAX_RECORDS * 1.2:
+        return
+
+    tmp_path = HISTORY_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        for record in records[-MAX_RECORDS:]:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    tmp_path.replace(HISTORY_PATH)
@@ -0,0 +1,209 @@
+"""Журнал контрольных точек расшифровки: прерванная задача продолжается с последней точки.
+
+Пока идёт расшифровка, готовые сегменты, номер следующего окна, контекст (prompt) и язык
+дописываются в небольшой журнал рядом с кэшем расшифровок (cache/journals/<ключ кэша>.jsonl).
+Если программу закрыли, компьютер уснул или расшифровка упала, повторный запуск того же файла
+с той же моделью и настройками пропускает уже расшифрованные окна. Разрезы окон и VAD
+детерминированы, а контекст и язык восстанавливаются из журнала, поэтому результат совпадает
+с расшифровкой без перерыва. После успешного завершения журнал удаляется.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from app import CACHE_DIR
+from app.tracing import count
+
+# Версия формата журнала: журналы другой версии не читаются
+JOURNAL_VERSION = 1
+# Как часто (с) готовые сегменты сбрасываются на диск
+CHECKPOINT_INTERVAL_SECONDS = float(os.environ.get('VOICE_DECODER_CHECKPOINT_SECONDS', 30))
+# Журналы задач, которые так и не запустили повторно, удаляются через неделю
+JOURNAL_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+log = logging.getLogger(__name__)
+
+
+class DecodeCheckpoint:
+    """Состояние расшифровки одной задачи: восстановленное из журнала и новое, ещё не записанное."""
+
+    def __init__(self, path, meta, on_close=None):
+        self.path = Path(path)
+        self.meta = meta
+        self._on_close = on_close
+        self.settings = None
+        self.next_window = 0
+        self.decoded_seconds = 0.0
+        self.prompt = None
+        self.language = None
+        self.segments = []  # сегменты из журнала (при возобновлении)
+        self._unsaved = []
+        self._dirty = False
+        self._saved_at = time.perf_counter()
+        self._header_written = False
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def resumed(self):
+        return self.next_window > 0
+
+    def _load(self):
+        """Читает журнал; повреждённая последняя строка (запись оборвалась) пропускается."""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                lines = file.read().splitlines()
+        except OSError:
+            return
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        if not records or records[0].get('version') != JOURNAL_VERSION:
+            return
+
+        self.settings = records[0].get('settings')
+        self._header_written = True
+        for record in records[1:]:
+            self.segments.extend(record['segments'])
+            self.next_window = record['next_window']
+            self.decoded_seconds = record['decoded_seconds']
+            self.prompt = record.get('prompt')
+            self.language = record.get('language')
+
+    def begin(self, **settings):
+        """Сверяет настройки расшифровки с журналом. Журнал с другими настройками (устройство,
+        точность, размер пакета) дал бы другой результат - тогда расшифровка начинается заново."""
+        with self._lock:
+            if self._header_written and self.settings != settings:
+                if self.resumed:
+                    log.info('Настройки расшифровки изменились, журнал %s не используется', self.path.name)
+                self._reset()
+            self.settings = settings
+            if not self._header_written:
+                self._write([{'version': JOURNAL_VERSION, 'settings': settings, 'created': time.time(), **self.meta}],
+                            mode='w')
+                self._header_written = True
+            if self.resumed:
+                count('resumed_windows', self.next_window)
+                log.info('Продолжаем расшифровку с окна %s (%.0f с)', self.next_window, self.decoded_seconds)
+
+    def record(self, next_window, segments, decoded_seconds, prompt=None, language=None):
+        """Отмечает, что окна до next_window расшифрованы; на диск пишет не чаще CHECKPOINT_INTERVAL_SECONDS."""
+        with self._lock:
+            self._unsaved.extend({'start': seg['start'], 'end': seg['end'], 'text': seg['text']} for seg in segments)
+            self.next_window = next_window
+            self.decoded_seconds = decoded_seconds
+            self.prompt = prompt
+            self.language = language
+            self._dirty = True
+            if time.perf_counter() - self._saved_at >= CHECKPOINT_INTERVAL_SECONDS:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Сбрасывает прогресс на диск и освобождает журнал для следующего запуска задачи."""
+        self.flush()
+        self._release()
+
+    def discard(self):
+        """Удаляет журнал: задача завершена."""
+        with self._lock:
+            self._unsaved = []
+            self._dirty = False
+            self.path.unlink(missing_ok=True)
+        self._release()
+
+    def _release(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+    def _flush(self):
+        self._saved_at = time.perf_counter()
+        if not self._header_written or not self._dirty:
+            return
+        self._write([{'next_window': self.next_window, 'decoded_seconds': self.decoded_seconds,
+                      'prompt': self.prompt, 'language': self.language, 'segments': self._unsaved}])
+        self._unsaved = []
+        self._dirty = False
+        count('checkpoints')
+
+    def _reset(self):
+        self.next_window = 0
+        self.decoded_seconds = 0.0
+        self.prompt = None
+        self.language = None
+        self.segments = []
+        self._unsaved = []
+        self._dirty = False
+        self._header_written = False
+
+    def _write(self, records, mode='a'):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, mode, encoding='utf-8') as file:
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                file.flush()
+                # Запись должна пережить внезапное выключение
+                os.fsync(file.fileno())
+        except OSError as e:
+            log.warning('Не удалось записать журнал %s: %s', self.path, e)
+
+
+class JobJournal:
+    """Журналы контрольных точек задач, по одному файлу на ключ кэша расшифровок."""
+
+    def __init__(self, journal_dir):
+        self.journal_dir = Path(journal_dir)
+        self._cleaned = False
+        self._open_keys = set()
+        self._lock = threading.Lock()
+
+    def open(self, key, **meta):
+        """Контрольная точка задачи: с сохранённым прогрессом, если журнал уже есть.
+
+        None - журнал этого ключа уже ведёт другая задача (тот же файл с теми же настройками в соседнем
+        воркере): обе писали бы в один файл, а первая завершившаяся удалила бы его у второй.
+        """
+        self._remove_stale()
+        with self._lock:
+            if key in self._open_keys:
+                log.info('Журнал %s уже используется другой задачей, контрольные точки не ведутся', key)
+                return None
+            self._open_keys.add(key)
+        return DecodeCheckpoint(self.journal_dir / f'{key}.jsonl', meta, lambda: self._release(key))
+
+    def _release(self, key):
+        with self._lock:
+            self._open_keys.discard(key)
+
+    def _entries(self):
+        if not self.journal_dir.exists():
+            return []
+        return list(self.journal_dir.glob('*.jsonl'))
+
+    def _remove_stale(self):
+        if self._cleaned:
+            return
+        self._cleaned = True
+        now = time.time()
+        for path in self._entries():
+            try:
+                if now - path.stat().st_mtime > JOURNAL_MAX_AGE_SECONDS:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+job_journal = JobJournal(CACHE_DIR / 'journals')
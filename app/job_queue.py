@@ -0,0 +1,511 @@
+import itertools
+import logging
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+from app.convert_to_wav import SAMPLE_RATE
+from app.execution_plan import plan_execution
+from app.exporters import DEFAULT_FORMATS, ExportSet
+from app.format_time import format_time
+from app.job_journal import job_journal
+from app.media_probe import probe_media
+from app.model_registry import cpu_backend
+from app.streaming import should_stream, transcribe_stream
+from app.tracing import JobTrace, bind_job, counters, span
+from app.transcribe import prepare_audio, transcribe_audio, format_segments
+from app.transcript_cache import transcript_cache
+
+VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm']
+MEDIA_EXTENSIONS = VIDEO_EXTENSIONS + ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.m4a', '.wma', '.aiff', '.aif']
+
+# Статусы задач
+QUEUED = 'queued'
+DECODING = 'decoding'
+DECODED = 'decoded'
+TRANSCRIBING = 'transcribing'
+DONE = 'done'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+
+STATUS_TITLES = {
+    QUEUED: 'В очереди',
+    DECODING: 'Конвертация',
+    DECODED: 'Ожидает модель',
+    TRANSCRIBING: 'Расшифровка',
+    DONE: 'Готово',
+    ERROR: 'Ошибка',
+    CANCELLED: 'Отменено',
+}
+
+_job_ids = itertools.count(1)
+
+log = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена: новые задачи не принимаются, пока не освободится место."""
+
+
+class JobCancelled(Exception):
+    """Задачу отменили во время расшифровки."""
+
+
+class Job:
+    """Задача на расшифровку одного файла."""
+
+    def __init__(self, file_path, model_size='small', save_converted=False, use_vad=False, save_transcript=True,
+                 shards=1, use_cache=True, formats=DEFAULT_FORMATS):
+        self.id = next(_job_ids)
+        self.file_path = str(file_path)
+        self.model_size = model_size
+        self.save_converted = save_converted
+        self.use_vad = use_vad
+        self.shards = shards
+        # False - не читать кэш (результат всё равно перезапишет запись в кэше)
+        self.use_cache = use_cache
+        self.cache_key = None
+        self.from_cache = False
+        # Контрольная точка расшифровки (app.job_journal): прерванная задача продолжится с неё
+        self.checkpoint = None
+        self.save_transcript = save_transcript
+        # Форматы, в которых расшифровка сохраняется рядом с файлом (txt, srt, vtt, jsonl, docx)
+        self.formats = tuple(formats)
+        self.exports = None
+
+        self.status = QUEUED
+        self.progress = 0
+        self.segments = []
+        self.result_text = ''
+        self.report = ''
+        self.error = ''
+        self.output_path = None
+        self.output_paths = []
+        self.audio = None
+        self.audio_seconds = 0.0
+        # Длинная запись расшифровывается потоком (app.streaming), не загружаясь в память целиком
+        self.streaming = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Время этапов и счётчики задачи (конвертация, загрузка модели, окна расшифровки...)
+        self.trace = JobTrace(self.id)
+
+    @property
+    def finished(self):
+        return self.status in (DONE, ERROR, CANCELLED)
+
+    @property
+    def name(self):
+        return Path(self.file_path).name
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'file': self.file_path,
+            'model': self.model_size,
+            'vad': self.use_vad,
+            'shards': self.shards,
+            'from_cache': self.from_cache,
+            'status': self.status,
+            'progress': self.progress,
+            'audio_seconds': round(self.audio_seconds, 3),
+            'streaming': self.streaming,
+            'segments': len(self.segments),
+            'report': self.report,
+            'error': self.error,
+            'output_path': self.output_path,
+            'output_paths': self.output_paths,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'timings': self.trace.to_dict(),
+        }
+
+
+class JobQueue:
+    """Очередь файлов с конвейером: пока модель расшифровывает файл N, CPU декодирует файл N+1.
+
+    inference_workers задаёт число воркеров, каждый со своим экземпляром модели.
+    max_pending ограничивает число незавершённых задач (None - без ограничения).
+    """
+
+    def __init__(self, on_update=None, on_progress=None, on_report=None, on_segments=None, inference_workers=1,
+                 max_pending=None, on_released=None):
+        self.on_update = on_update
+        self.on_progress = on_progress
+        self.on_report = on_report
+        self.on_segments = on_segments
+        # Вызывается, когда очередь больше не читает файл задачи (завершена, отменена, ошибка)
+        self.on_released = on_released
+        self.inference_workers = inference_workers
+        self.max_pending = max_pending
+
+        self.jobs = []
+        self._condition = threading.Condition()
+        self._running = False
+        # Ограниченная очередь декодированных файлов: декодер опережает воркеров не больше чем на их число
+        self._decoded = queue.Queue(maxsize=inference_workers)
+        self._workers = []
+
+        self._started_at = None
+        self._busy = 0
+        self._done_audio_seconds = 0.0
+        self._done_jobs = 0
+
+    def add(self, file_path, **options):
+        job = Job(file_path, **options)
+        with self._condition:
+            if self.max_pending is not None and self._pending_locked() >= self.max_pending:
+                raise QueueFullError(f'Очередь заполнена ({self.max_pending} задач)')
+            self.jobs.append(job)
+            self._condition.notify_all()
+        self._notify(job)
+        return job
+
+    def add_folder(self, folder, **options):
+        """Добавляет все медиафайлы из папки (включая вложенные)."""
+        files = sorted(path for path in Path(folder).rglob('*')
+                       if path.is_file() and path.suffix.lower() in MEDIA_EXTENSIONS
+                       and not path.name.startswith('convert_file_'))
+        return [self.add(path, **options) for path in files]
+
+    def get(self, job_id):
+        with self._condition:
+            for job in self.jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def cancel(self, job_id):
+        """Отменяет задачу. Идущая расшифровка остановится после текущего окна."""
+        job = self.get(job_id)
+        with self._condition:
+            if job is None or job.finished:
+                return False
+            # Задачу, которую ещё не взял ни один воркер, больше никто не отпустит
+            was_queued = job.status == QUEUED
+            job.status = CANCELLED
+
+        job.audio = None
+        self._notify(job)
+        if was_queued:
+            self._release(job)
+        return True
+
+    def move(self, job_id, offset):
+        """Сдвигает задачу в очереди на offset позиций (отрицательное значение - вверх)."""
+        with self._condition:
+            job = next((job for job in self.jobs if job.id == job_id), None)
+            if job is None:
+                return False
+
+            index = self.jobs.index(job)
+            new_index = max(0, min(len(self.jobs) - 1, index + offset))
+            self.jobs.insert(new_index, self.jobs.pop(index))
+        return True
+
+    def remove_finished(self):
+        with self._condition:
+            self.jobs = [job for job in self.jobs if not job.finished]
+
+    def update_queued(self, options):
+        """Меняет настройки задач, которые ещё не взял ни один воркер. Под блокировкой, чтобы воркер
+        не начал задачу со смесью старых и новых настроек."""
+        with self._condition:
+            for job in self.jobs:
+                if job.status == QUEUED:
+                    for name, value in options.items():
+                        setattr(job, name, tuple(value) if name == 'formats' else value)
+
+    def pending_count(self):
+        with self._condition:
+            return self._pending_locked()
+
+    def _pending_locked(self):
+        return sum(1 for job in self.jobs if not job.finished)
+
+    def stats(self):
+        """Глубина очереди и пропускная способность - чтобы подбирать размер пула воркеров."""
+        with self._condition:
+            counts = {status: 0 for status in STATUS_TITLES}
+            for job in self.jobs:
+                counts[job.status] += 1
+
+            uptime = time.time() - self._started_at if self._started_at else 0.0
+            return {
+                'workers': self.inference_workers,
+                'busy_workers': self._busy,
+                'max_pending': self.max_pending,
+                'pending': self._pending_locked(),
+                'statuses': counts,
+                'done_jobs': self._done_jobs,
+                'done_audio_seconds': round(self._done_audio_seconds, 1),
+                'uptime_seconds': round(uptime, 1),
+                # Сколько секунд аудио обрабатывается за секунду работы сервиса
+                'audio_seconds_per_second': round(self._done_audio_seconds / uptime, 3) if uptime else 0.0,
+                'jobs_per_hour': round(self._done_jobs / uptime * 3600, 2) if uptime else 0.0,
+                'cache': transcript_cache.stats(),
+                # Счётчики трассировки (заполняются при VOICE_DECODER_TRACE=1)
+                'counters': counters(),
+                'compile': self._compile_stats(),
+            }
+
+    @staticmethod
+    def _compile_stats():
+        # compile_manager тянет torch - импортируем только если torch уже загружен
+        if 'torch' not in sys.modules:
+            return None
+        from app.compile_manager import compile_manager
+
+        return compile_manager.stats()
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        """Запускает рабочие потоки (декодирование и расшифровку)."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._started_at = self._started_at or time.time()
+
+        self._workers = [threading.Thread(target=self._decode_worker, name='job-decode', daemon=True)]
+        self._workers += [threading.Thread(target=self._inference_worker, args=(slot,),
+                                           name=f'job-inference-{slot}', daemon=True)
+                          for slot in range(self.inference_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for _ in range(self.inference_workers):
+            self._decoded.put(None)
+
+    def _next_queued(self):
+        with self._condition:
+            while self._running:
+                for job in self.jobs:
+                    if job.status == QUEUED:
+                        job.status = DECODING
+                        return job
+                self._condition.wait()
+        return None
+
+    def _decode_worker(self):
+        while True:
+            job = self._next_queued()
+            if job is None:
+                return
+            self._notify(job)
+
+            try:
+                with bind_job(job.trace):
+                    duration = probe_media(job.file_path).duration
+                    # Длительность из заголовков: точная появится после декодирования, а задаче из кэша
+                    # её хватит для пропускной способности в /stats
+                    job.audio_seconds = duration or 0.0
+                    job.streaming = should_stream(duration, job.save_converted, job.use_vad, job.shards)
+                    if self._finish_from_cache(job):
+                        self._release(job)
+                        continue
+                    if job.streaming:
+                        log.debug('Задача %s: потоковая расшифровка (%s с)', job.id, duration)
+                    else:
+                        job.audio = prepare_audio(job.file_path, job.save_converted)
+                        job.audio_seconds = len(job.audio) / SAMPLE_RATE
+            except Exception as e:
+                log.exception('Error decode job %s => %s', job.id, e)
+                self._fail(job, e)
+                self._release(job)
+                continue
+
+            # Статус меняется под блокировкой: иначе отмена между проверкой и записью потеряется
+            with self._condition:
+                cancelled = job.status == CANCELLED
+                if not cancelled:
+                    job.status = DECODED
+            if cancelled:
+                job.audio = None
+                self._release(job)
+                continue
+
+            self._notify(job)
+            # Блокируется, пока модель занята предыдущим файлом
+            self._decoded.put(job)
+
+    def _inference_worker(self, slot):
+        while True:
+            job = self._decoded.get()
+            if job is None:
+                return
+            with self._condition:
+                cancelled = job.status == CANCELLED
+                if not cancelled:
+                    job.status = TRANSCRIBING
+                    self._busy += 1
+            if cancelled:
+                self._release(job)
+                continue
+
+            job.started_at = time.time()
+            self._notify(job)
+            try:
+                with bind_job(job.trace):
+                    self._run_job(job, slot)
+            except JobCancelled:
+                log.debug('Задача %s отменена', job.id)
+            except Exception as e:
+                log.exception('Error transcribe job %s => %s', job.id, e)
+                self._fail(job, e)
+            finally:
+                job.audio = None
+                # Отменённая задача оставляет недописанные файлы - удаляем их
+                self._abort_exports(job)
+                # Прогресс прерванной задачи остаётся в журнале
+                if job.checkpoint is not None:
+                    job.checkpoint.close()
+                    job.checkpoint = None
+                job.finished_at = time.time()
+                with self._condition:
+                    self._busy -= 1
+                self._release(job)
+
+    def _finish_from_cache(self, job):
+        """Завершает задачу сразу, если такой файл с теми же настройками уже расшифровывался."""
+        with span('cache_lookup'):
+            # Точность и пакет окон тоже меняют результат: пакет расшифровывается без контекста между окнами
+            plan = plan_execution(job.model_size)
+            job.cache_key = transcript_cache.make_key(job.file_path, job.model_size, use_vad=job.use_vad,
+                                                      shards=job.shards, backend=cpu_backend(),
+                                                      precision=plan.precision, batch_size=plan.batch_size)
+            # Конвертированный WAV можно получить только декодированием, поэтому кэш тогда не читаем
+            if not job.use_cache or job.save_converted:
+                return False
+
+            segments = transcript_cache.get(job.cache_key)
+        if segments is None:
+            return False
+
+        log.debug('Задача %s: расшифровка найдена в кэше', job.id)
+        job.from_cache = True
+        job.started_at = time.time()
+        self._open_exports(job)
+        try:
+            self._segments(job, segments, None)
+            self._finish(job, segments)
+        except JobCancelled:
+            log.debug('Задача %s отменена', job.id)
+            self._abort_exports(job)
+        job.finished_at = time.time()
+        return True
+
+    def _run_job(self, job, slot):
+        job.segments = []
+        self._open_exports(job)
+        if job.cache_key:
+            job.checkpoint = job_journal.open(job.cache_key, file=job.name, model=job.model_size)
+        if job.streaming:
+            segments = transcribe_stream(job.file_path, job.model_size, lambda value: self._progress(job, value),
+                                         lambda report: self._report(job, report), slot,
+                                         lambda new_segments, progress: self._segments(job, new_segments, progress),
+                                         job.audio_seconds, job.checkpoint)
+        else:
+            segments = transcribe_audio(job.audio, job.model_size,
+                                        lambda value: self._progress(job, value),
+                                        job.use_vad, lambda report: self._report(job, report), slot, job.shards,
+                                        lambda new_segments, progress: self._segments(job, new_segments, progress),
+                                        job.checkpoint)
+        job.audio = None
+
+        if job.status == CANCELLED:
+            return
+
+        if job.cache_key:
+            transcript_cache.put(job.cache_key, segments, file=job.name, model=job.model_size)
+        if job.checkpoint is not None:
+            job.checkpoint.discard()
+        self._finish(job, segments)
+
+    def _finish(self, job, segments):
+        # Отменённая задача не сохраняет расшифровку; отмена во время записи файлов уже опоздала
+        with self._condition:
+            if job.status == CANCELLED:
+                raise JobCancelled()
+        job.segments = segments
+        job.result_text = format_segments(segments)
+        if job.exports is not None:
+            with span('export', formats=','.join(job.formats)):
+                job.output_paths = [str(path) for path in job.exports.close()]
+            job.exports = None
+            job.output_path = job.output_paths[0] if job.output_paths else None
+
+        with self._condition:
+            self._done_jobs += 1
+            self._done_audio_seconds += job.audio_seconds
+            job.status = DONE
+
+        self._progress(job, 100)
+        self._notify(job)
+
+    def _open_exports(self, job):
+        """Открывает файлы расшифровки: сегменты дописываются в них по мере готовности."""
+        self._abort_exports(job)
+        if job.save_transcript and job.formats:
+            job.exports = ExportSet(job.file_path, job.formats)
+
+    @staticmethod
+    def _abort_exports(job):
+        if job.exports is not None:
+            job.exports.abort()
+            job.exports = None
+
+    def _fail(self, job, error):
+        self._abort_exports(job)
+        with self._condition:
+            # Ошибка после отмены (например, прерванное чтение файла) статус отмены не меняет
+            if job.status == CANCELLED:
+                return
+            job.status = ERROR
+        job.error = str(error)
+        job.result_text = 'Ошибка при обработке файла'
+        if job.checkpoint is not None and job.checkpoint.decoded_seconds:
+            job.checkpoint.flush()
+            job.result_text += (f'\nРасшифровано до {format_time(job.checkpoint.decoded_seconds)}: '
+                                f'при повторном запуске расшифровка продолжится с этого места')
+        self._notify(job)
+
+    def _progress(self, job, value):
+        job.progress = value
+        if self.on_progress:
+            self.on_progress(job, value)
+
+    def _segments(self, job, segments, progress):
+        # Отмена прерывает расшифровку между окнами
+        if job.status == CANCELLED:
+            raise JobCancelled()
+
+        job.segments.extend(segments)
+        if job.exports is not None:
+            job.exports.write(segments)
+        if self.on_segments:
+            self.on_segments(job, segments, progress)
+
+    def _report(self, job, report):
+        job.report = report
+        if self.on_report:
+            self.on_report(job, report)
+
+    def _notify(self, job):
+        if self.on_update:
+            self.on_update(job)
+
+    def _release(self, job):
+        if self.on_released:
+            self.on_released(job)
@@ -0,0 +1,394 @@
+"""Живая расшифровка непрерывного потока: микрофон, URL трансляции, канал или stdin.
+
+ffmpeg отдаёт PCM небольшими блоками; поток чтения отмечает время прихода каждого блока.
+Несказанный до конца хвост речи (до 30 с) расшифровывается заново каждые latency/2 секунд,
+и его сегменты отдаются как предварительные - каждое следующее окно перекрывает предыдущее.
+Когда VAD видит после речи паузу (ENDPOINT_SILENCE_SECONDS), речь до паузы расшифровывается
+окончательно, сегменты отдаются как окончательные, а аудио до этого места освобождается.
+Если пауз долго нет, окончательными становятся все сегменты, кроме последнего.
+Если расшифровка не успевает за потоком (за шаг пришло больше звука, чем целевая задержка),
+предварительные расшифровки пропускаются до конца фразы, пока отставание не сойдёт на нет.
+
+Для каждого сегмента замеряется задержка: от прихода звука его конца до выдачи сегмента.
+Проверка на записанном файле в темпе реального времени:
+python -m app.live запись.mp3 --realtime --latency 3
+"""
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from app import FFMPEG_PATH, check_ffmpeg
+from app.convert_to_wav import SAMPLE_RATE
+from app.execution_plan import plan_execution
+from app.format_time import format_time
+from app.model_registry import model_registry
+from app.streaming import read_ffmpeg_blocks
+from app.tracing import count, span
+from app.transcribe import PROMPT_CHARS, detect_language
+from app.vad import MAX_WINDOW_SECONDS, detect_speech
+
+# Размер блока чтения (с): меньше блок - меньше задержка, но больше накладных расходов
+LIVE_BLOCK_SECONDS = 0.2
+# Целевая задержка выдачи сегментов (с)
+DEFAULT_LATENCY_SECONDS = 3.0
+MIN_LATENCY_SECONDS = 1.0
+# Пауза после речи, по которой фраза считается законченной (с)
+ENDPOINT_SILENCE_SECONDS = 0.6
+# Тишина, которая остаётся в буфере перед речью, чтобы не обрезать её начало (с)
+SPEECH_PAD_SECONDS = 0.2
+# Форматы ffmpeg для устройств записи: "dshow:audio=Микрофон", "pulse:default"
+DEVICE_FORMATS = ('dshow', 'pulse', 'alsa', 'avfoundation', 'openal', 'jack')
+# Отдельный слот модели: живая расшифровка может идти одновременно с очередью файлов
+LIVE_MODEL_SLOT = 'live'
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+# Сколько непрочитанного звука держит очередь блоков (с); дальше поток чтения ждёт
+MAX_QUEUED_SECONDS = 60
+
+log = logging.getLogger(__name__)
+
+
+def parse_source(text):
+    """Разбирает источник: 'dshow:audio=Микрофон' -> ('dshow', 'audio=Микрофон'), '-' - stdin."""
+    text = text.strip()
+    prefix, _, rest = text.partition(':')
+    if rest and prefix in DEVICE_FORMATS:
+        return prefix, rest
+    return None, text
+
+
+def live_command(source, input_format=None, realtime=False):
+    """Команда ffmpeg, которая пишет PCM источника в stdout без буферизации."""
+    command = [str(FFMPEG_PATH), '-loglevel', 'error', '-fflags', 'nobuffer']
+    if source != '-':
+        # stdin нужен только источнику '-'
+        command.insert(1, '-nostdin')
+    if realtime:
+        # Записанный файл читается в темпе воспроизведения - как живой поток
+        command.append('-re')
+    if input_format:
+        command += ['-f', input_format]
+    command += ['-i', 'pipe:0' if source == '-' else source,
+                '-vn', '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-acodec', 'pcm_s16le',
+                '-flush_packets', '1', '-']
+    return command
+
+
+class LatencyStats:
+    """Задержки выдачи сегментов (с): предварительных и окончательных."""
+
+    def __init__(self):
+        self.values = {'provisional': [], 'final': []}
+
+    def add(self, kind, seconds):
+        self.values[kind].append(seconds)
+
+    def to_dict(self):
+        result = {}
+        for kind, values in self.values.items():
+            if not values:
+                result[kind] = {'count': 0}
+                continue
+            points = np.percentile(values, LATENCY_PERCENTILES)
+            result[kind] = {'count': len(values), 'max': round(max(values), 3)}
+            result[kind].update({f'p{p}': round(float(value), 3) for p, value in zip(LATENCY_PERCENTILES, points)})
+        return result
+
+    def report(self):
+        titles = {'provisional': 'Предварительные', 'final': 'Окончательные'}
+        lines = []
+        for kind, stats in self.to_dict().items():
+            if not stats['count']:
+                continue
+            points = ', '.join(f'p{p} {stats[f"p{p}"]:.2f}' for p in LATENCY_PERCENTILES)
+            lines.append(f'{titles[kind]} ({stats["count"]}): задержка {points}, макс. {stats["max"]:.2f} с')
+        return '\n'.join(lines) or 'Сегментов нет'
+
+
+class LiveTranscriber:
+    """Расшифровывает поток по мере поступления звука.
+
+    on_segments(segments, final) вызывается из рабочего потока. При final=False segments - текущие
+    предварительные сегменты (заменяют предыдущие предварительные), при final=True - новые окончательные
+    (дописываются). У каждого сегмента есть start, end, text, final и latency.
+    """
+
+    def __init__(self, source, model_size='small', latency=DEFAULT_LATENCY_SECONDS, input_format=None,
+                 realtime=False, on_segments=None):
+        self.source = source
+        self.model_size = model_size
+        self.latency = max(MIN_LATENCY_SECONDS, latency)
+        self.input_format = input_format
+        self.realtime = realtime
+        self.on_segments = on_segments
+        self.stats = LatencyStats()
+
+        self._blocks = queue.Queue(maxsize=int(MAX_QUEUED_SECONDS / LIVE_BLOCK_SECONDS))
+        self._stopped = threading.Event()
+        self._reader = None
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pending_start = 0  # абсолютная позиция первого сэмпла буфера
+        # Время прихода звука: конец блока (абсолютный сэмпл) -> perf_counter
+        self._arrival_ends = []
+        self._arrival_times = []
+        self._prompt = None
+        self._language = None
+        self.model = None
+        self.fp16 = False
+        self._finished = False
+        self._error = None
+        self._behind = False
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def step_samples(self):
+        # Новый звук расшифровывается каждые latency/2: ещё половина уходит на саму расшифровку
+        return int(self.latency / 2 * SAMPLE_RATE)
+
+    def _put(self, item):
+        """Кладёт блок в очередь; если очередь полна, ждёт, пока расшифровка её разберёт, или stop()."""
+        while not self._stopped.is_set():
+            try:
+                self._blocks.put(item, timeout=LIVE_BLOCK_SECONDS)
+                return True
+            except queue.Full:
+                count('live_queue_full')
+        return False
+
+    def _read(self):
+        blocks = read_ffmpeg_blocks(live_command(self.source, self.input_format, self.realtime), LIVE_BLOCK_SECONDS)
+        try:
+            for block in blocks:
+                if not self._put((block, time.perf_counter())):
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            blocks.close()
+            self._put(None)
+
+    def _receive(self, wait):
+        """Забирает пришедшие блоки в буфер; wait - сколько ждать первого блока (с)."""
+        received = []
+        total = 0
+        timeout = wait
+        while True:
+            try:
+                item = self._blocks.get(timeout=timeout) if timeout else self._blocks.get_nowait()
+            except queue.Empty:
+                break
+            timeout = None
+            if item is None:
+                self._finished = True
+                break
+            if isinstance(item, Exception):
+                self._error = item
+                self._finished = True
+                break
+            block, arrived = item
+            received.append(block)
+            total += len(block)
+            self._arrival_ends.append(self._pending_start + len(self._pending) + total)
+            self._arrival_times.append(arrived)
+
+        if received:
+            self._pending = np.concatenate([self._pending] + received)
+        return total
+
+    def _arrival_time(self, seconds):
+        """Когда пришёл звук момента seconds (по концу блока, в котором он лежит)."""
+        if not self._arrival_times:
+            return time.perf_counter()
+        index = bisect_left(self._arrival_ends, int(seconds * SAMPLE_RATE))
+        index = min(index, len(self._arrival_times) - 1)
+        return self._arrival_times[index]
+
+    def _commit(self, samples):
+        """Освобождает первые samples сэмплов буфера."""
+        samples = max(0, min(samples, len(self._pending)))
+        self._pending = self._pending[samples:].copy()
+        self._pending_start += samples
+        keep = bisect_left(self._arrival_ends, self._pending_start)
+        # Блок, в котором лежит начало буфера, ещё нужен
+        del self._arrival_ends[:keep], self._arrival_times[:keep]
+
+    def _decode(self, audio):
+        """Расшифровывает кусок буфера; время сегментов - на шкале потока (с)."""
+        if self._language is None:
+            with span('language_detection'):
+                self._language = detect_language(self.model, audio)
+            log.debug('Язык потока: %s', self._language)
+
+        with span('live_decode', seconds=round(len(audio) / SAMPLE_RATE, 2)):
+            result = self.model.transcribe(audio, fp16=self.fp16, initial_prompt=self._prompt,
+                                           language=self._language)
+        offset = self._pending_start / SAMPLE_RATE
+        audio_end = offset + len(audio) / SAMPLE_RATE
+        return [{'start': offset + seg['start'], 'end': min(audio_end, offset + seg['end']), 'text': seg['text']}
+                for seg in result.get('segments', []) if seg['text'].strip()]
+
+    def _emit(self, segments, final):
+        now = time.perf_counter()
+        kind = 'final' if final else 'provisional'
+        for seg in segments:
+            seg['final'] = final
+            seg['latency'] = now - self._arrival_time(seg['end'])
+            self.stats.add(kind, seg['latency'])
+        count(f'live_{kind}_segments', len(segments))
+
+        if final:
+            text = ' '.join(seg['text'].strip() for seg in segments)
+            if text:
+                self._prompt = ((self._prompt or '') + ' ' + text)[-PROMPT_CHARS:]
+        if self.on_segments and (segments or not final):
+            self.on_segments(segments, final)
+
+    def _finalize(self, samples, keep_last=False):
+        """Окончательно расшифровывает первые samples сэмплов буфера. keep_last - последний сегмент
+        может быть оборван, он остаётся в буфере и будет расшифрован ещё раз."""
+        segments = self._decode(self._pending[:samples])
+        if keep_last and len(segments) > 1:
+            cut = int(segments[-1]['start'] * SAMPLE_RATE) - self._pending_start
+            if 0 < cut < samples:
+                segments.pop()
+                samples = cut
+        self._emit(segments, final=True)
+        self._commit(samples)
+
+    def _step(self, backlog=0.0):
+        """Один шаг: конец фразы - окончательные сегменты, иначе - предварительные.
+
+        backlog - сколько звука (с) пришло с прошлого шага. Если это больше целевой задержки, расшифровка
+        не успевает за потоком: предварительные сегменты пропускаются, остаются только окончательные.
+        """
+        pending = len(self._pending)
+        endpoint_samples = int(ENDPOINT_SILENCE_SECONDS * SAMPLE_RATE)
+        pad = int(SPEECH_PAD_SECONDS * SAMPLE_RATE)
+        start_before = self._pending_start
+
+        with span('live_vad'):
+            spans = detect_speech(self._pending)
+        if not spans:
+            # Только тишина: расшифровывать нечего, оставляем хвост, где может начинаться речь
+            self._commit(pending - pad)
+            if self.on_segments:
+                self.on_segments([], False)
+            return
+
+        # Тишину перед речью не храним
+        if spans[0][0] > pad:
+            self._commit(spans[0][0] - pad)
+            pending = len(self._pending)
+        speech_end = spans[-1][1] - (self._pending_start - start_before)
+        if self._finished:
+            self._finalize(pending)
+        elif pending - speech_end >= endpoint_samples:
+            self._finalize(min(pending, speech_end + pad))
+        elif pending >= int(MAX_WINDOW_SECONDS * SAMPLE_RATE) - self.step_samples:
+            # Долго без пауз: окно вот-вот переполнится
+            self._finalize(pending, keep_last=True)
+        elif self._is_behind(backlog):
+            count('live_skipped_provisional')
+        else:
+            self._emit(self._decode(self._pending), final=False)
+
+    def _is_behind(self, backlog):
+        behind = backlog > self.latency
+        if behind != self._behind:
+            if behind:
+                log.info('Расшифровка отстаёт от потока на %.1f с: предварительные сегменты пропускаются', backlog)
+            else:
+                log.info('Расшифровка догнала поток')
+            self._behind = behind
+        return behind
+
+    def run(self):
+        """Расшифровывает поток до его конца или до stop(). Возвращает статистику задержек."""
+        plan = plan_execution(self.model_size)
+        plan.check()
+        plan.apply()
+        self.fp16 = plan.precision == 'fp16'
+        self.model = model_registry.get(self.model_size, plan.device, plan.precision, LIVE_MODEL_SLOT)
+        log.info('Живая расшифровка на %s: %s (задержка %.1f с)', plan.device, self.source, self.latency)
+
+        self._reader = threading.Thread(target=self._read, name='live-reader', daemon=True)
+        self._reader.start()
+
+        new_samples = 0
+        while not self._finished:
+            new_samples += self._receive(wait=LIVE_BLOCK_SECONDS)
+            if self._stopped.is_set():
+                # Остановка: уже принятый звук расшифровывается окончательно
+                self._finished = True
+            if new_samples >= self.step_samples or (self._finished and len(self._pending)):
+                self._step(new_samples / SAMPLE_RATE)
+                new_samples = 0
+
+        self.stop()
+        if self._error is not None:
+            raise self._error
+        log.info('Живая расшифровка завершена. %s', self.stats.report())
+        return self.stats
+
+
+def print_segments(segments, final, provisional=False, output=None):
+    """Консольный потребитель: окончательные сегменты - строками в stdout, предварительные - в stderr."""
+    if final:
+        for seg in segments:
+            print(f'{format_time(seg["start"])} - {format_time(seg["end"])} {seg["text"].strip()}', flush=True)
+    elif provisional and segments:
+        print('… ' + ' '.join(seg['text'].strip() for seg in segments), file=sys.stderr, flush=True)
+
+    if output is not None:
+        for seg in segments:
+            output.write(json.dumps(seg, ensure_ascii=False) + '\n')
+        output.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Живая расшифровка потока (URL, устройство, файл или stdin "-")')
+    parser.add_argument('--live', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('source', help='источник ffmpeg: URL, файл, "-" (stdin) или "dshow:audio=Микрофон"')
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY_SECONDS, help='целевая задержка (с)')
+    parser.add_argument('--realtime', action='store_true', help='читать файл в темпе реального времени')
+    parser.add_argument('--provisional', action='store_true', help='печатать предварительные сегменты в stderr')
+    parser.add_argument('--output', help='записывать все сегменты в JSON Lines')
+    parser.add_argument('--report', help='сохранить перцентили задержки в JSON')
+    args, _ = parser.parse_known_args(argv)
+
+    check_ffmpeg()
+    input_format, source = parse_source(args.source)
+    output = open(args.output, 'w', encoding='utf-8') if args.output else None
+    transcriber = LiveTranscriber(source, args.model, args.latency, input_format, args.realtime,
+                                  lambda segments, final: print_segments(segments, final, args.provisional, output))
+    try:
+        transcriber.run()
+    except KeyboardInterrupt:
+        transcriber.stop()
+    finally:
+        if output is not None:
+            output.close()
+
+    stats = transcriber.stats.to_dict()
+    print(transcriber.stats.report(), file=sys.stderr)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump({'source': args.source, 'model': args.model, 'latency_target': transcriber.latency,
+                       'latency': stats}, file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    from app.tracing import setup_logging
+
+    setup_logging()
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Веса Whisper в формате, который отображается в память (mmap), вместо чтения .pt целиком.
+
+Чекпоинт из whisper_models один раз переводится в whisper_models/mmap/<модель>.pt: веса в fp32
+(в той точности, в которой с ними работает модель), каждый тензор - отдельная выровненная запись
+в zip-архиве torch.save. Загрузка открывает файл через torch.load(mmap=True) и подставляет тензоры
+в модель без копирования (load_state_dict(assign=True)), поэтому:
+
+- повторная загрузка берёт страницы из файлового кэша ОС и почти ничего не стоит;
+- процессы пула (sharding) и воркеры сервиса делят одни и те же физические страницы,
+  а не держат по частной копии весов.
+
+Сравнение с обычной загрузкой (время и RSS): python -m app.mapped_weights [--models small medium]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from app import WHISPER_MODELS_DIR
+from app.tracing import span
+
+MAPPED_DIR = WHISPER_MODELS_DIR / 'mmap'
+# Версия формата: при изменении файлы конвертируются заново
+FORMAT_VERSION = 1
+# 0 - загружать .pt как раньше (whisper.load_model)
+MMAP_ENABLED = os.environ.get('VOICE_DECODER_MMAP', '1') != '0'
+
+log = logging.getLogger(__name__)
+
+
+def mmap_supported():
+    """torch.load(mmap=True) и load_state_dict(assign=True) появились в PyTorch 2.1."""
+    import torch
+    from packaging.version import Version
+
+    return Version(torch.__version__) >= Version('2.1')
+
+
+def checkpoint_path(model_size):
+    """Исходный чекпоинт Whisper в whisper_models (имя файла берётся из ссылки на скачивание)."""
+    import whisper
+
+    url = whisper._MODELS.get(model_size)
+    return WHISPER_MODELS_DIR / (os.path.basename(url) if url else f'{model_size}.pt')
+
+
+def mapped_path(model_size):
+    return MAPPED_DIR / f'{model_size}.pt'
+
+
+def is_converted(model_size):
+    """Файл для mmap есть и не старше исходного чекпоинта."""
+    path, source = mapped_path(model_size), checkpoint_path(model_size)
+    if not path.is_file():
+        return False
+    return not source.is_file() or path.stat().st_mtime >= source.stat().st_mtime
+
+
+def convert_checkpoint(model_size):
+    """Переводит чекпоинт в формат для mmap. Файл пишется под временным именем и переносится целиком.
+
+    Модель могут впервые загружать сразу несколько процессов (пул кусков, воркеры сервиса),
+    поэтому у каждого своё временное имя: os.replace переносит только дописанный файл.
+    """
+    import torch
+
+    source = checkpoint_path(model_size)
+    if not source.is_file():
+        raise FileNotFoundError(f'Нет чекпоинта модели {model_size}: {source}')
+
+    target = mapped_path(model_size)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f'{model_size}.', suffix='.tmp')
+    os.close(fd)
+
+    log.info('Подготовка весов %s для быстрой загрузки (один раз)', model_size)
+    try:
+        with span('mmap_convert', model=model_size):
+            checkpoint = torch.load(source, map_location='cpu', weights_only=True)
+            state = {name: tensor.float().contiguous() if tensor.is_floating_point() else tensor.contiguous()
+                     for name, tensor in checkpoint['model_state_dict'].items()}
+            torch.save({'version': FORMAT_VERSION, 'dims': checkpoint['dims'], 'model_state_dict': state},
+                       tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _restore_buffers(model):
+    """Восстанавливает буферы, которых нет в state_dict (persistent=False): после создания модели
+    на устройстве meta они пустые. Значения - как в конструкторах Whisper."""
+    import torch
+
+    dims = model.dims
+    model.decoder.register_buffer('mask', torch.empty(dims.n_text_ctx, dims.n_text_ctx).fill_(-float('inf')).triu_(1),
+                                  persistent=False)
+    all_heads = torch.zeros(dims.n_text_layer, dims.n_text_head, dtype=torch.bool)
+    all_heads[dims.n_text_layer // 2:] = True
+    model.register_buffer('alignment_heads', all_heads.to_sparse(), persistent=False)
+
+    missing = [name for name, tensor in (*model.named_parameters(), *model.named_buffers()) if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f'Не восстановлены тензоры: {", ".join(missing)}')
+
+
+def load_mapped_model(model_size, device):
+    """Загружает модель из файла для mmap: веса на CPU остаются отображением файла, без копии в памяти."""
+    import torch
+    import whisper
+    from whisper.model import ModelDimensions, Whisper
+
+    checkpoint = torch.load(mapped_path(model_size), map_location='cpu', mmap=True, weights_only=True)
+    if checkpoint.get('version') != FORMAT_VERSION:
+        raise ValueError(f'Устаревший формат весов {mapped_path(model_size)}')
+
+    # Модель создаётся без выделения памяти под веса: их место займут тензоры из файла
+    with torch.device('meta'):
+        model = Whisper(ModelDimensions(**checkpoint['dims']))
+    model.load_state_dict(checkpoint['model_state_dict'], assign=True)
+    _restore_buffers(model)
+
+    alignment_heads = whisper._ALIGNMENT_HEADS.get(model_size)
+    if alignment_heads is not None:
+        model.set_alignment_heads(alignment_heads)
+    return model.to(device)
+
+
+def load_model(model_size, device):
+    """Загружает модель через mmap, при первом запуске конвертируя чекпоинт.
+
+    Если mmap недоступен (старый PyTorch, VOICE_DECODER_MMAP=0) или конвертация не удалась,
+    модель загружается обычным whisper.load_model.
+    """
+    import whisper
+
+    if MMAP_ENABLED and mmap_supported():
+        try:
+            if not is_converted(model_size):
+                convert_checkpoint(model_size)
+            with span('model_load', model=model_size, device=device, weights='mmap'):
+                return load_mapped_model(model_size, device)
+        except FileNotFoundError:
+            # Чекпоинта ещё нет: whisper.load_model скачает его, а конвертация будет в следующий раз
+            pass
+        except Exception as e:
+            log.warning('Не удалось загрузить веса %s через mmap, обычная загрузка: %s', model_size, e)
+
+    with span('model_load', model=model_size, device=device, weights='pt'):
+        return whisper.load_model(model_size, device=device, download_root=str(WHISPER_MODELS_DIR))
+
+
+def memory_mb():
+    """RSS процесса, а на Linux ещё и его состав: частная память (RssAnon) и страницы файлов (RssFile),
+    которые делятся между процессами."""
+    from app.benchmark import current_rss_mb
+
+    result = {'rss_mb': current_rss_mb()}
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key in ('RssAnon', 'RssFile'):
+                    result[f'{key[3:].lower()}_mb'] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        pass
+    return {key: round(value, 1) if value is not None else None for key, value in result.items()}
+
+
+def _measure_load(model_size, weights):
+    """Выполняется в отдельном процессе: время загрузки и память после неё."""
+    import torch
+    import whisper
+
+    torch.set_grad_enabled(False)
+    before = memory_mb()
+    started = time.perf_counter()
+    if weights == 'mmap':
+        model = load_mapped_model(model_size, 'cpu')
+    else:
+        model = whisper.load_model(model_size, device='cpu', download_root=str(WHISPER_MODELS_DIR))
+    seconds = time.perf_counter() - started
+    after = memory_mb()
+
+    # Веса должны быть рабочими: один проход энкодера по тишине
+    mel = torch.zeros(1, model.dims.n_mels, whisper.audio.N_FRAMES)
+    model.encoder(mel)
+    return {'weights': weights, 'load_seconds': round(seconds, 3), 'before': before, 'after_load': after,
+            'after_encode': memory_mb()}
+
+
+def compare_loading(model_size, repeat=2):
+    """Загружает модель обычным способом и через mmap, каждый раз в новом процессе.
+
+    Повторные загрузки mmap показывают тёплый случай, когда файл уже в кэше ОС.
+    """
+    if not is_converted(model_size):
+        convert_checkpoint(model_size)
+
+    runs = []
+    for weights in ('pt', 'mmap'):
+        for attempt in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                run = pool.submit(_measure_load, model_size, weights).result()
+            run['attempt'] = attempt + 1
+            runs.append(run)
+    return {'model': model_size, 'runs': runs}
+
+
+def main(argv=None):
+    from app.tracing import setup_logging
+
+    parser = argparse.ArgumentParser(description='Веса для mmap: конвертация и сравнение загрузки')
+    parser.add_argument('--models', nargs='+', default=['small'])
+    parser.add_argument('--repeat', type=int, default=2, help='загрузок каждого вида')
+    parser.add_argument('--convert-only', action='store_true', help='только подготовить файлы')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    for model_size in args.models:
+        if args.convert_only:
+            convert_checkpoint(model_size)
+            print(f'{model_size}: {mapped_path(model_size)}')
+        else:
+            print(json.dumps(compare_loading(model_size, args.repeat), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import re
+import struct
+import subprocess
+import threading
+
+from app import CACHE_DIR, FFMPEG_PATH, FFPROBE_PATH
+from app.tracing import span
+
+PROBE_CACHE_PATH = CACHE_DIR / 'probe_cache.json'
+# Сколько файлов помнит кэш метаданных; сверх этого сначала забываются удалённые файлы, затем самые старые
+MAX_PROBE_CACHE_ENTRIES = 5000
+
+# Контейнеры на базе ISO BMFF, заголовки которых разбираются без ffmpeg
+MP4_EXTENSIONS = ('.mp4', '.m4a', '.mov', '.3gp')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+
+class MediaInfo:
+    """Метаданные медиафайла: длительность (с), частота, число каналов, кодек и способ получения."""
+
+    def __init__(self, duration=None, sample_rate=None, channels=None, codec=None, source=''):
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.codec = codec
+        self.source = source
+
+    @property
+    def is_whisper_pcm(self):
+        """Файл уже в том виде, который нужен Whisper: PCM 16-bit, 16kHz, mono."""
+        return self.codec == 'pcm_s16le' and self.sample_rate == 16000 and self.channels == 1
+
+    def to_dict(self):
+        return {'duration': self.duration, 'sample_rate': self.sample_rate, 'channels': self.channels,
+                'codec': self.codec, 'source': self.source}
+
+    def __repr__(self):
+        return f'MediaInfo({self.to_dict()})'
+
+
+def probe_media(file_path):
+    """Возвращает MediaInfo файла. Результат кэшируется по пути, времени изменения и размеру."""
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = f'{file_path}|{stat.st_mtime_ns}|{stat.st_size}'
+
+    with _cache_lock:
+        cache = _load_cache()
+        if key in cache:
+            return MediaInfo(**cache[key])
+
+    with span('probe', file=os.path.basename(file_path)):
+        info = _probe_headers(file_path) or _probe_ffprobe(file_path) or _probe_ffmpeg(file_path)
+
+    with _cache_lock:
+        # Старые записи того же файла больше не нужны
+        for old_key in [old_key for old_key in cache if old_key.startswith(f'{file_path}|')]:
+            del cache[old_key]
+        cache[key] = info.to_dict()
+        _prune_cache(cache)
+        _save_cache(cache)
+
+    return info
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(PROBE_CACHE_PATH, encoding='utf-8') as file:
+                _cache = json.load(file)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _prune_cache(cache):
+    if len(cache) <= MAX_PROBE_CACHE_ENTRIES:
+        return
+    for old_key in [old_key for old_key in cache if not os.path.exists(old_key.rsplit('|', 2)[0])]:
+        del cache[old_key]
+    # Словарь хранит порядок добавления: первыми идут самые давние записи
+    for old_key in list(cache)[:max(0, len(cache) - MAX_PROBE_CACHE_ENTRIES)]:
+        del cache[old_key]
+
+
+def _save_cache(cache):
+    try:
+        PROBE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = PROBE_CACHE_PATH.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(cache, file, ensure_ascii=False)
+        os.replace(tmp_path, PROBE_CACHE_PATH)
+    except OSError as e:
+        log.warning('Не удалось сохранить кэш метаданных: %s', e)
+
+
+def _probe_headers(file_path):
+    """Читает заголовки WAV, FLAC и MP4 напрямую, без запуска внешних процессов."""
+    try:
+        with open(file_path, 'rb') as file:
+            magic = file.read(12)
+            file.seek(0)
+
+            if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+                return _probe_wav(file, os.path.getsize(file_path))
+            if magic[:4] == b'fLaC':
+                return _probe_flac(file)
+            if magic[4:8] == b'ftyp' or file_path.lower().endswith(MP4_EXTENSIONS):
+                return _probe_mp4(file, os.path.getsize(file_path))
+    except (OSError, struct.error, ValueError) as e:
+        log.debug('Не удалось прочитать заголовки %s: %s', file_path, e)
+    return None
+
+
+def _probe_wav(file, size):
+    file.seek(12)
+    fmt = None
+
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+        if chunk_id == b'fmt ':
+            fmt_data = file.read(chunk_size)
+            fmt = list(struct.unpack('<HHIIHH', fmt_data[:16]))
+            # WAVE_FORMAT_EXTENSIBLE: настоящий формат - первые 2 байта GUID SubFormat
+            if fmt[0] == 0xFFFE and len(fmt_data) >= 26:
+                fmt[0] = struct.unpack('<H', fmt_data[24:26])[0]
+            file.seek(chunk_size & 1, 1)
+        elif chunk_id == b'data':
+            if fmt is None:
+                return None
+            audio_format, channels, sample_rate, _, block_align, bits = fmt
+            # Программы, пишущие WAV потоком, оставляют в размере 0xFFFFFFFF (как в wav_data_range)
+            chunk_size = min(chunk_size, size - file.tell())
+            codec = {1: f'pcm_s{bits}le' if bits > 8 else 'pcm_u8', 3: f'pcm_f{bits}le'}.get(audio_format)
+            duration = chunk_size / (block_align * sample_rate) if block_align and sample_rate else None
+            return MediaInfo(duration, sample_rate, channels, codec or f'wav_{audio_format}', 'wav')
+        else:
+            file.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def _probe_flac(file):
+    file.seek(4)
+    block_header = file.read(4)
+    if block_header[0] & 0x7F != 0:  # Первым блоком обязан быть STREAMINFO
+        return None
+
+    streaminfo = file.read(34)
+    packed = int.from_bytes(streaminfo[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+
+    duration = total_samples / sample_rate if sample_rate and total_samples else None
+    return MediaInfo(duration, sample_rate, channels, 'flac', 'flac')
+
+
+def _iter_atoms(file, start, end):
+    """Перебирает атомы ISO BMFF в диапазоне [start, end): (тип, начало данных, конец атома)."""
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        size, atom_type = struct.unpack('>I4s', file.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', file.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return
+        yield atom_type, position + header, position + size
+        position += size
+
+
+def _find_atom(file, start, end, *path):
+    for atom_type, data_start, atom_end in _iter_atoms(file, start, end):
+        if atom_type == path[0]:
+            if len(path) == 1:
+                return data_start, atom_end
+            return _find_atom(file, data_start, atom_end, *path[1:])
+    return None
+
+
+def _read_duration(file, data_start):
+    """Длительность из mvhd/mdhd: поддерживаются версии 0 и 1."""
+    file.seek(data_start)
+    version = file.read(4)[0]
+    if version == 1:
+        _, _, timescale, duration = struct.unpack('>QQIQ', file.read(28))
+    else:
+        _, _, timescale, duration = struct.unpack('>IIII', file.read(16))
+    return duration / timescale if timescale else None
+
+
+def _probe_mp4(file, size):
+    moov = _find_atom(file, 0, size, b'moov')
+    if moov is None:
+        return None
+
+    mvhd = _find_atom(file, moov[0], moov[1], b'mvhd')
+    info = MediaInfo(_read_duration(file, mvhd[0]) if mvhd else None, source='mp4')
+
+    # Ищем первую звуковую дорожку и берём кодек, частоту и число каналов из её описания
+    for atom_type, trak_start, trak_end in _iter_atoms(file, moov[0], moov[1]):
+        if atom_type != b'trak':
+            continue
+        hdlr = _find_atom(file, trak_start, trak_end, b'mdia', b'hdlr')
+        if hdlr is None:
+            continue
+        file.seek(hdlr[0] + 8)
+        if file.read(4) != b'soun':
+            continue
+
+        mdhd = _find_atom(file, trak_start, trak_end, b'mdia', b'mdhd')
+        if mdhd and info.duration is None:
+            info.duration = _read_duration(file, mdhd[0])
+
+        stsd = _find_atom(file, trak_start, trak_end, b'mdia', b'minf', b'stbl', b'stsd')
+        if stsd:
+            file.seek(stsd[0] + 8)  # версия/флаги и число записей
+            _, codec = struct.unpack('>I4s', file.read(8))
+            file.seek(stsd[0] + 8 + 8 + 16)  # SampleEntry (8) + зарезервированные поля звуковой записи
+            channels, _, _, _, sample_rate = struct.unpack('>HHHHI', file.read(12))
+            info.codec = {'mp4a': 'aac'}.get(codec.decode('latin-1'), codec.decode('latin-1').strip())
+            info.channels = channels
+            info.sample_rate = sample_rate >> 16
+        break
+
+    return info if info.duration else None
+
+
+def _probe_ffprobe(file_path):
+    """Один вызов ffprobe с ответом в JSON."""
+    if not FFPROBE_PATH.is_file():
+        return None
+
+    command = [str(FFPROBE_PATH), '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+               '-select_streams', 'a:0', str(file_path)]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        data = json.loads(result.stdout or b'{}')
+    except (OSError, ValueError) as e:
+        log.debug('ffprobe не сработал для %s: %s', file_path, e)
+        return None
+
+    stream = (data.get('streams') or [{}])[0]
+    duration = data.get('format', {}).get('duration') or stream.get('duration')
+    if duration is None:
+        return None
+    return MediaInfo(float(duration), int(stream['sample_rate']) if stream.get('sample_rate') else None,
+                     stream.get('channels'), stream.get('codec_name'), 'ffprobe')
+
+
+def _probe_ffmpeg(file_path):
+    """Запасной вариант: разбор вывода ffmpeg -i (если ffprobe нет)."""
+    command = [str(FFMPEG_PATH), '-hide_banner', '-i', str(file_path)]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='ignore')
+
+    info = MediaInfo(source='ffmpeg')
+    duration = re.search(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if duration:
+        h, m, s = duration.groups()
+        info.duration = int(h) * 3600 + int(m) * 60 + float(s)
+
+    audio = re.search(r'Audio:\s*([\w\-]+)[^,]*,\s*(\d+)\s*Hz,\s*([\w.()]+)', result.stderr)
+    if audio:
+        info.codec = audio.group(1)
+        info.sample_rate = int(audio.group(2))
+        info.channels = {'mono': 1, 'stereo': 2}.get(audio.group(3))
+
+    return info
@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from app import WHISPER_MODELS_DIR
+from app.mapped_weights import load_model
+
+# Примерный объём памяти, который занимает загруженная модель (МБ, веса fp32)
+MODEL_MEMORY_MB = {
+    'tiny': 150,
+    'base': 290,
+    'small': 970,
+    'medium': 3060,
+    'large': 6200,
+    'large-v3': 6200,
+}
+
+# Бюджеты памяти под резидентные модели (МБ), можно переопределить через переменные окружения
+DEFAULT_RAM_BUDGET_MB = int(os.environ.get('VOICE_DECODER_RAM_BUDGET_MB', 8000))
+DEFAULT_VRAM_BUDGET_MB = int(os.environ.get('VOICE_DECODER_VRAM_BUDGET_MB', 6500))
+
+# Бэкенд расшифровки на CPU: torch, onnx или onnx-int8 (ONNX Runtime)
+CPU_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+log = logging.getLogger(__name__)
+
+
+def cpu_backend():
+    backend = os.environ.get('VOICE_DECODER_CPU_BACKEND', 'torch')
+    return backend if backend in CPU_BACKENDS else 'torch'
+
+
+def set_cpu_backend(backend):
+    """Выбирает бэкенд для CPU. Хранится в переменной окружения, чтобы его видели и процессы пула."""
+    if backend not in CPU_BACKENDS:
+        raise ValueError(f'Неизвестный бэкенд: {backend}')
+    os.environ['VOICE_DECODER_CPU_BACKEND'] = backend
+
+
+def default_precision(device):
+    """Точность вычислений по умолчанию для устройства (для CPU с ONNX Runtime - onnx-fp32 или onnx-int8)."""
+    if device != 'cpu':
+        return 'fp16'
+    return {'onnx': 'onnx-fp32', 'onnx-int8': 'onnx-int8'}.get(cpu_backend(), 'fp32')
+
+
+class ModelRegistry:
+    """Хранит загруженные модели Whisper между задачами и вытесняет давно не использованные (LRU).
+
+    Экземпляр модели нельзя использовать из двух потоков одновременно (Whisper вешает хуки KV-кэша
+    на модули), поэтому параллельные воркеры берут модели из разных слотов (slot).
+    """
+
+    def __init__(self, ram_budget_mb=DEFAULT_RAM_BUDGET_MB, vram_budget_mb=DEFAULT_VRAM_BUDGET_MB):
+        self.ram_budget_mb = ram_budget_mb
+        self.vram_budget_mb = vram_budget_mb
+        self._models = OrderedDict()  # (model_size, device, precision, slot) -> model
+        self._loading = {}  # (model_size, device, precision, slot) -> threading.Lock
+        self._lock = threading.Lock()
+
+    def get(self, model_size, device, precision=None, slot=0):
+        """Возвращает модель из реестра, при необходимости загружая её."""
+        key = (model_size, device, precision or default_precision(device), slot)
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                log.debug('Модель %s уже загружена', key)
+                return self._models[key]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Один поток загружает модель, остальные ждут его результата
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+
+            model = self._load(model_size, device, key[2])
+
+            with self._lock:
+                self._models[key] = model
+                self._loading.pop(key, None)
+                self._evict(keep=key)
+
+        return model
+
+    def preload(self, model_size, device, precision=None, slot=0):
+        """Загружает модель в фоновом потоке, пока пользователь выбирает файл."""
+
+        def worker():
+            from app.compile_manager import compile_manager
+
+            try:
+                model = self.get(model_size, device, precision, slot)
+                # Если компиляция этой модели окупается, готовим её заранее, а не в первой задаче
+                compile_manager.warm_up(model, model_size, device)
+            except Exception as e:
+                log.warning('Ошибка предзагрузки модели %s: %s', model_size, e)
+
+        thread = threading.Thread(target=worker, name=f'preload-{model_size}', daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, model_size, device, precision=None, slot=0):
+        """Загружена ли модель в слоте slot (None - в любом слоте)."""
+        key = (model_size, device, precision or default_precision(device), slot)
+        with self._lock:
+            if slot is None:
+                return any(loaded[:3] == key[:3] for loaded in self._models)
+            return key in self._models
+
+    def unload(self, model_size, device, precision=None, slot=0):
+        key = (model_size, device, precision or default_precision(device), slot)
+        with self._lock:
+            self._models.pop(key, None)
+        self._release_memory(device)
+
+    def clear(self):
+        with self._lock:
+            devices = {key[1] for key in self._models}
+            self._models.clear()
+        for device in devices:
+            self._release_memory(device)
+
+    def _load(self, model_size, device, precision):
+        if not WHISPER_MODELS_DIR.exists():
+            raise FileNotFoundError(f'Папка whisper_models не найдена: {WHISPER_MODELS_DIR}')
+
+        log.debug('Загрузка модели %s на %s (%s)', model_size, device, precision)
+        if precision.startswith('onnx'):
+            from app.onnx_backend import load_onnx_model
+
+            return load_onnx_model(model_size, quantize=precision == 'onnx-int8')
+
+        # Веса отображаются в память (mmap): процессы и повторные загрузки делят страницы файла.
+        # torch.compile включает compile_manager перед расшифровкой, если это окупается
+        return load_model(model_size, device)
+
+    def _budget_for(self, device):
+        return self.ram_budget_mb if device == 'cpu' else self.vram_budget_mb
+
+    def _used_mb(self, device):
+        return sum(MODEL_MEMORY_MB.get(size, MODEL_MEMORY_MB['large'])
+                   for size, dev, _, _ in self._models if dev == device)
+
+    def _evict(self, keep):
+        """Вытесняет самые старые модели, пока не уложимся в бюджет устройства."""
+        device = keep[1]
+        budget = self._budget_for(device)
+        evicted = False
+
+        for key in list(self._models):
+            if self._used_mb(device) <= budget:
+                break
+            if key == keep or key[1] != device:
+                continue
+            log.debug('Выгрузка модели %s (превышен бюджет %s МБ)', key, budget)
+            del self._models[key]
+            evicted = True
+
+        if evicted:
+            self._release_memory(device)
+
+    @staticmethod
+    def _release_memory(device):
+        import torch
+
+        if device == 'cuda' and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,394 @@
+"""Бэкенд ONNX Runtime для расшифровки на CPU.
+
+Модель Whisper один раз экспортируется в три графа ONNX (энкодер, ключи/значения cross-attention,
+декодер с KV-кэшем) и сохраняется в whisper_models/onnx/<модель>. Декодирование (поиск токенов,
+временные метки, fallback по температуре) остаётся за Whisper: OnnxWhisper подставляется вместо
+модели PyTorch, поэтому сегменты имеют ту же структуру.
+
+Проверка совпадения с PyTorch и сравнение скорости:
+    python -m app.onnx_backend <файл> [--model small] [--int8] [--seconds 120]
+"""
+import argparse
+import difflib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import whisper
+from filelock import FileLock
+from whisper.decoding import DecodingOptions, DecodingTask, detect_language as whisper_detect_language
+
+from app import WHISPER_MODELS_DIR
+from app.tracing import span
+
+ONNX_DIR = WHISPER_MODELS_DIR / 'onnx'
+# Версия формата экспорта: при изменении графов старые файлы экспортируются заново
+EXPORT_VERSION = 1
+OPSET_VERSION = 17
+GRAPHS = ('encoder', 'cross_kv', 'decoder')
+# Маска будущих токенов: большое отрицательное число вместо -inf, чтобы не получить NaN в softmax
+MASK_VALUE = -1e9
+
+log = logging.getLogger(__name__)
+
+
+def _attention(q, k, v, n_head, mask=None):
+    """То же, что MultiHeadAttention.qkv_attention в Whisper, но без зависимости от версии и SDPA."""
+    n_batch, n_ctx, n_state = q.shape
+    scale = (n_state // n_head) ** -0.25
+    q = q.view(n_batch, n_ctx, n_head, -1).permute(0, 2, 1, 3) * scale
+    k = k.view(k.shape[0], k.shape[1], n_head, -1).permute(0, 2, 3, 1) * scale
+    v = v.view(v.shape[0], v.shape[1], n_head, -1).permute(0, 2, 1, 3)
+
+    qk = q @ k
+    if mask is not None:
+        qk = qk + mask
+    weights = torch.softmax(qk.float(), dim=-1).to(q.dtype)
+    return (weights @ v).permute(0, 2, 1, 3).flatten(start_dim=2)
+
+
+class _CrossKV(torch.nn.Module):
+    """audio_features -> ключи и значения cross-attention всех слоёв: (слои, 2, batch, кадры, state)."""
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.blocks = decoder.blocks
+
+    def forward(self, audio_features):
+        return torch.stack([torch.stack([block.cross_attn.key(audio_features),
+                                         block.cross_attn.value(audio_features)])
+                            for block in self.blocks])
+
+
+class _DecoderWithCache(torch.nn.Module):
+    """Декодер Whisper с явным KV-кэшем self-attention на входе и выходе (вместо хуков на модулях)."""
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.decoder = decoder
+
+    def forward(self, tokens, cross_kv, self_kv, offset):
+        decoder = self.decoder
+        positions = offset + torch.arange(tokens.shape[1])
+        x = decoder.token_embedding(tokens) + decoder.positional_embedding[positions]
+
+        # Новый токен видит все предыдущие (из кэша) и себя, но не следующие
+        total = self_kv.shape[3] + tokens.shape[1]
+        mask = (torch.arange(total)[None, :] > positions[:, None]).to(x.dtype) * MASK_VALUE
+
+        present = []
+        for index, block in enumerate(decoder.blocks):
+            h = block.attn_ln(x)
+            k = torch.cat([self_kv[index, 0], block.attn.key(h)], dim=1)
+            v = torch.cat([self_kv[index, 1], block.attn.value(h)], dim=1)
+            present.append(torch.stack([k, v]))
+            x = x + block.attn.out(_attention(block.attn.query(h), k, v, block.attn.n_head, mask))
+
+            h = block.cross_attn_ln(x)
+            x = x + block.cross_attn.out(_attention(block.cross_attn.query(h), cross_kv[index, 0], cross_kv[index, 1],
+                                                    block.cross_attn.n_head))
+            x = x + block.mlp(block.mlp_ln(x))
+
+        x = decoder.ln(x)
+        logits = x @ torch.transpose(decoder.token_embedding.weight.to(x.dtype), 0, 1)
+        return logits.float(), torch.stack(present)
+
+
+def model_dir(model_size):
+    return ONNX_DIR / model_size
+
+
+def graph_path(model_size, name, quantize=False):
+    return model_dir(model_size) / (f'{name}_int8.onnx' if quantize else f'{name}.onnx')
+
+
+def is_exported(model_size, quantize=False):
+    dims_path = model_dir(model_size) / 'dims.json'
+    if not dims_path.is_file():
+        return False
+    try:
+        with open(dims_path, encoding='utf-8') as file:
+            if json.load(file).get('version') != EXPORT_VERSION:
+                return False
+    except (OSError, ValueError):
+        return False
+    return all(graph_path(model_size, name, quantize).is_file() for name in GRAPHS)
+
+
+def export_model(model_size):
+    """Экспортирует модель в ONNX (fp32). Файлы пишутся во временную папку процесса и переносятся целиком."""
+    target = model_dir(model_size)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=target.parent, prefix=f'{model_size}.', suffix='.tmp'))
+
+    try:
+        log.info('Экспорт модели %s в ONNX (один раз, может занять несколько минут)', model_size)
+        model = whisper.load_model(model_size, device='cpu', download_root=str(WHISPER_MODELS_DIR)).eval()
+        dims = model.dims
+        n_layer, n_state = dims.n_text_layer, dims.n_text_state
+
+        mel = torch.zeros(1, dims.n_mels, whisper.audio.N_FRAMES)
+        audio_features = torch.zeros(1, dims.n_audio_ctx, dims.n_audio_state)
+        cross_kv = torch.zeros(n_layer, 2, 1, dims.n_audio_ctx, n_state)
+        tokens = torch.zeros(1, 3, dtype=torch.long)
+        self_kv = torch.zeros(n_layer, 2, 1, 2, n_state)
+        offset = torch.tensor(2, dtype=torch.long)
+
+        with span('onnx_export', model=model_size), torch.no_grad():
+            torch.onnx.export(model.encoder, (mel,), str(tmp_dir / 'encoder.onnx'), opset_version=OPSET_VERSION,
+                              input_names=['mel'], output_names=['audio_features'],
+                              dynamic_axes={'mel': {0: 'batch'}, 'audio_features': {0: 'batch'}})
+            torch.onnx.export(_CrossKV(model.decoder), (audio_features,), str(tmp_dir / 'cross_kv.onnx'),
+                              opset_version=OPSET_VERSION, input_names=['audio_features'], output_names=['cross_kv'],
+                              dynamic_axes={'audio_features': {0: 'batch'}, 'cross_kv': {2: 'batch'}})
+            torch.onnx.export(_DecoderWithCache(model.decoder), (tokens, cross_kv, self_kv, offset),
+                              str(tmp_dir / 'decoder.onnx'), opset_version=OPSET_VERSION,
+                              input_names=['tokens', 'cross_kv', 'self_kv', 'offset'],
+                              output_names=['logits', 'present_kv'],
+                              dynamic_axes={'tokens': {0: 'batch', 1: 'tokens'}, 'cross_kv': {2: 'batch'},
+                                            'self_kv': {2: 'batch', 3: 'past'}, 'logits': {0: 'batch', 1: 'tokens'},
+                                            'present_kv': {2: 'batch', 3: 'total'}})
+
+        # dims.json пишется последним: по нему видно, что экспорт завершён
+        with open(tmp_dir / 'dims.json', 'w', encoding='utf-8') as file:
+            json.dump({'version': EXPORT_VERSION, 'dims': vars(dims)}, file)
+
+        shutil.rmtree(target, ignore_errors=True)
+        tmp_dir.rename(target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def check_quantization():
+    """Квантованию нужен пакет onnx (onnxruntime без него только выполняет графы)."""
+    if importlib.util.find_spec('onnx') is None:
+        raise RuntimeError('Для бэкенда onnx-int8 нужен пакет onnx: pip install onnx '
+                           '(или VOICE_DECODER_CPU_BACKEND=onnx без квантования)')
+
+
+def quantize_model(model_size):
+    """Создаёт int8-версии графов (динамическое квантование весов)."""
+    check_quantization()
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise RuntimeError('Для int8 нужен пакет onnx: pip install onnx') from e
+
+    with span('onnx_quantize', model=model_size):
+        for name in GRAPHS:
+            output_path = graph_path(model_size, name, quantize=True)
+            tmp_path = output_path.with_suffix('.tmp')
+            quantize_dynamic(str(graph_path(model_size, name)), str(tmp_path), weight_type=QuantType.QInt8)
+            os.replace(tmp_path, output_path)
+
+
+class OnnxInference:
+    """Замена PyTorchInference из Whisper: KV-кэш хранится в массивах numpy и передаётся в граф явно."""
+
+    def __init__(self, model, initial_token_length):
+        self.model = model
+        self.initial_token_length = initial_token_length
+        self.cross_kv = None
+        self.self_kv = None
+
+    def logits(self, tokens, audio_features):
+        if self.cross_kv is None:
+            self.cross_kv = self.model.cross_kv(audio_features, tokens.shape[0])
+            self.self_kv = self.model.empty_kv(tokens.shape[0])
+
+        # После первого прохода в граф подаётся только последний токен, остальные уже в кэше
+        if tokens.shape[-1] > self.initial_token_length:
+            tokens = tokens[:, -1:]
+
+        logits, self.self_kv = self.model.run_decoder(tokens, self.cross_kv, self.self_kv)
+        return logits
+
+    def rearrange_kv_cache(self, source_indices):
+        if source_indices != list(range(len(source_indices))):
+            self.self_kv = self.self_kv[:, :, source_indices]
+
+    def cleanup_caching(self):
+        self.cross_kv = None
+        self.self_kv = None
+
+
+class OnnxDecodingTask(DecodingTask):
+    def __init__(self, model, options):
+        super().__init__(model, options)
+        self.inference = OnnxInference(model, len(self.initial_tokens))
+        # Поиск лучом хранит ссылку на inference, созданный в DecodingTask
+        if hasattr(self.decoder, 'inference'):
+            self.decoder.inference = self.inference
+
+
+class OnnxWhisper:
+    """Модель Whisper на ONNX Runtime с тем же интерфейсом, что использует whisper.transcribe."""
+
+    def __init__(self, model_size, quantize=False, threads=None):
+        import onnxruntime
+
+        with open(model_dir(model_size) / 'dims.json', encoding='utf-8') as file:
+            self.dims = whisper.model.ModelDimensions(**json.load(file)['dims'])
+        self.model_size = model_size
+        self.quantize = quantize
+        self.device = torch.device('cpu')
+        # PyTorchInference, который DecodingTask создаёт до замены, читает decoder.blocks
+        self.decoder = SimpleNamespace(blocks=[])
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sessions = {name: onnxruntime.InferenceSession(str(graph_path(model_size, name, quantize)), options,
+                                                            providers=['CPUExecutionProvider'])
+                         for name in GRAPHS}
+
+    @property
+    def is_multilingual(self):
+        return self.dims.n_vocab >= 51865
+
+    @property
+    def num_languages(self):
+        return self.dims.n_vocab - 51765 - int(self.is_multilingual)
+
+    def encoder(self, mel):
+        audio_features = self.sessions['encoder'].run(None, {'mel': mel.float().cpu().numpy()})[0]
+        return torch.from_numpy(audio_features)
+
+    def cross_kv(self, audio_features, n_batch):
+        cross_kv = self.sessions['cross_kv'].run(None, {'audio_features': audio_features.float().cpu().numpy()})[0]
+        # Для поиска лучом токенов больше, чем записей: повторяем ключи каждой записи по размеру группы
+        if cross_kv.shape[2] != n_batch:
+            cross_kv = np.repeat(cross_kv, n_batch // cross_kv.shape[2], axis=2)
+        return cross_kv
+
+    def empty_kv(self, n_batch):
+        return np.zeros((self.dims.n_text_layer, 2, n_batch, 0, self.dims.n_text_state), dtype=np.float32)
+
+    def run_decoder(self, tokens, cross_kv, self_kv):
+        logits, present_kv = self.sessions['decoder'].run(None, {
+            'tokens': tokens.cpu().numpy().astype(np.int64),
+            'cross_kv': cross_kv,
+            'self_kv': self_kv,
+            'offset': np.array(self_kv.shape[3], dtype=np.int64),
+        })
+        return torch.from_numpy(logits), present_kv
+
+    def logits(self, tokens, audio_features):
+        logits, _ = self.run_decoder(tokens, self.cross_kv(audio_features, tokens.shape[0]),
+                                     self.empty_kv(tokens.shape[0]))
+        return logits
+
+    def detect_language(self, mel, tokenizer=None):
+        return whisper_detect_language(self, mel, tokenizer)
+
+    @torch.no_grad()
+    def decode(self, mel, options=DecodingOptions(), **kwargs):
+        single = mel.ndim == 2
+        if single:
+            mel = mel.unsqueeze(0)
+        if kwargs:
+            options = replace(options, **kwargs)
+
+        result = OnnxDecodingTask(self, options).run(mel)
+        return result[0] if single else result
+
+    def transcribe(self, audio, **kwargs):
+        return whisper.transcribe(self, audio, **kwargs)
+
+
+def ensure_exported(model_size, quantize=False):
+    """Экспортирует (и квантует) модель, если это ещё не сделано.
+
+    Впервые загрузить модель могут сразу несколько процессов (пул кусков, воркеры сервиса):
+    экспортирует первый, остальные ждут его на файловой блокировке и берут готовые файлы.
+    """
+    if is_exported(model_size) and (not quantize or is_exported(model_size, quantize=True)):
+        return
+    if quantize:
+        # Без onnx квантование упадёт только после многоминутного экспорта - проверяем заранее
+        check_quantization()
+
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    with FileLock(str(ONNX_DIR / f'{model_size}.lock')):
+        if not is_exported(model_size):
+            export_model(model_size)
+        if quantize and not is_exported(model_size, quantize=True):
+            quantize_model(model_size)
+
+
+def load_onnx_model(model_size, quantize=False):
+    """Загружает ONNX-модель, при первом запуске экспортируя (и квантуя) её."""
+    ensure_exported(model_size, quantize)
+
+    with span('model_load', model=model_size, backend='onnx-int8' if quantize else 'onnx'):
+        return OnnxWhisper(model_size, quantize)
+
+
+def _text_similarity(first, second):
+    return difflib.SequenceMatcher(None, first.split(), second.split()).ratio()
+
+
+def check_parity(audio, model_size='small', quantize=False):
+    """Сравнивает ONNX с PyTorch на одной записи: расхождение логитов, совпадение текста и скорость."""
+    from app.transcribe import decode_windows
+    from app.vad import split_into_windows
+
+    torch_model = whisper.load_model(model_size, device='cpu', download_root=str(WHISPER_MODELS_DIR)).eval()
+    onnx_model = load_onnx_model(model_size, quantize)
+
+    # Логиты первого шага на первых 30 секундах
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), torch_model.dims.n_mels).unsqueeze(0)
+    tokenizer = whisper.tokenizer.get_tokenizer(torch_model.is_multilingual, num_languages=torch_model.num_languages)
+    tokens = torch.tensor([list(tokenizer.sot_sequence_including_notimestamps)])
+    with torch.no_grad():
+        torch_logits = torch_model.logits(tokens, torch_model.encoder(mel))
+    onnx_logits = onnx_model.logits(tokens, onnx_model.encoder(mel))
+
+    results = {}
+    windows = split_into_windows(audio)
+    for name, model in (('torch', torch_model), ('onnx', onnx_model)):
+        started = time.perf_counter()
+        segments = decode_windows(model, audio, windows, fp16=False)
+        results[name] = {'seconds': time.perf_counter() - started,
+                         'text': ' '.join(seg['text'].strip() for seg in segments), 'segments': segments}
+
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+    return {
+        'model': model_size,
+        'backend': 'onnx-int8' if quantize else 'onnx',
+        'audio_seconds': round(duration, 2),
+        'max_logit_diff': float((torch_logits - onnx_logits).abs().max()),
+        'text_similarity': round(_text_similarity(results['torch']['text'], results['onnx']['text']), 4),
+        'segments': {name: len(result['segments']) for name, result in results.items()},
+        'rtf': {name: round(result['seconds'] / duration, 4) for name, result in results.items()},
+        'speedup': round(results['torch']['seconds'] / results['onnx']['seconds'], 2),
+    }
+
+
+def main(argv=None):
+    from app.transcribe import prepare_audio
+    from app.tracing import setup_logging
+
+    parser = argparse.ArgumentParser(description='Проверка ONNX-бэкенда: совпадение с PyTorch и скорость')
+    parser.add_argument('file')
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--int8', action='store_true', help='квантованные веса int8')
+    parser.add_argument('--seconds', type=float, default=120, help='сколько секунд записи сравнивать')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    audio = prepare_audio(args.file, save_converted=False)[:int(args.seconds * whisper.audio.SAMPLE_RATE)]
+    print(json.dumps(check_parity(audio, args.model, args.int8), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""Просмотр расшифровки как списка сегментов (модель/представление Qt).
+
+QListView рисует только видимые строки, а текст строки собирается в data() по запросу, поэтому
+многочасовая расшифровка (100 тысяч сегментов и больше) открывается и прокручивается без задержек.
+Новые сегменты добавляются в конец без перестройки всего списка.
+"""
+import bisect
+from itertools import accumulate
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QAction, QColor, QKeySequence
+from PyQt6.QtWidgets import QAbstractItemView, QApplication, QHBoxLayout, QLabel, QLineEdit, QListView, \
+    QPushButton, QVBoxLayout, QWidget
+
+from .format_time import format_time
+
+# Задержка поиска после ввода (мс), чтобы не искать на каждую букву
+SEARCH_DELAY_MS = 200
+MATCH_COLOR = QColor(255, 235, 150)
+CURRENT_MATCH_COLOR = QColor(255, 190, 80)
+
+SegmentRole = Qt.ItemDataRole.UserRole
+
+
+class SegmentListModel(QAbstractListModel):
+    """Сегменты расшифровки и индекс для поиска по их тексту."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._segments = []
+        self._lower_texts = []
+        # Индекс поиска: весь текст одной строкой и смещения начала каждого сегмента в ней.
+        # Перестраивается лениво - при первом поиске после добавления сегментов
+        self._search_blob = None
+        self._offsets = []
+        self.matches = []
+        self._match_rows = set()
+        self.current_match = -1
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._segments)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        seg = self._segments[index.row()]
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f'{format_time(seg["start"])} - {format_time(seg["end"])} {seg["text"].strip()}'
+        if role == Qt.ItemDataRole.BackgroundRole and index.row() in self._match_rows:
+            if self.current_match >= 0 and self.matches[self.current_match] == index.row():
+                return CURRENT_MATCH_COLOR
+            return MATCH_COLOR
+        if role == SegmentRole:
+            return seg
+        return None
+
+    @property
+    def segments(self):
+        return self._segments
+
+    def set_segments(self, segments):
+        self.beginResetModel()
+        self._segments = list(segments)
+        self._lower_texts = [seg['text'].strip().lower() for seg in self._segments]
+        self._search_blob = None
+        self._set_matches([])
+        self.endResetModel()
+
+    def append_segments(self, segments):
+        """Дописывает сегменты в конец. Пакет, который уже попал в список целиком, пропускается
+        (сигнал с ним мог прийти после того, как список заполнили из задачи)."""
+        if not segments:
+            return
+        if self._segments and segments[-1]['end'] <= self._segments[-1]['end']:
+            return
+
+        first = len(self._segments)
+        self.beginInsertRows(QModelIndex(), first, first + len(segments) - 1)
+        self._segments.extend(segments)
+        self._lower_texts.extend(seg['text'].strip().lower() for seg in segments)
+        self._search_blob = None
+        self.endInsertRows()
+
+    def clear(self):
+        self.set_segments([])
+
+    def find(self, query):
+        """Номера строк, в тексте которых есть query (без учёта регистра), по порядку."""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        if self._search_blob is None:
+            # Сегменты разделены '\n', поэтому совпадение не может перейти через границу сегмента
+            self._search_blob = '\n'.join(self._lower_texts)
+            self._offsets = list(accumulate((len(text) + 1 for text in self._lower_texts[:-1]), initial=0))
+
+        rows = []
+        position = self._search_blob.find(query)
+        while position != -1:
+            row = bisect.bisect_right(self._offsets, position) - 1
+            rows.append(row)
+            # С найденного сегмента переходим сразу к следующему
+            next_start = self._offsets[row + 1] if row + 1 < len(self._offsets) else len(self._search_blob)
+            position = self._search_blob.find(query, next_start)
+        return rows
+
+    def search(self, query):
+        self._set_matches(self.find(query))
+        return self.matches
+
+    def _set_matches(self, rows):
+        changed = self._match_rows | set(rows)
+        self.matches = rows
+        self._match_rows = set(rows)
+        self.current_match = 0 if rows else -1
+        if changed and self._segments:
+            # Подсветка меняется у разрозненных строк - проще обновить видимую область целиком
+            self.dataChanged.emit(self.index(0), self.index(len(self._segments) - 1),
+                                  [Qt.ItemDataRole.BackgroundRole])
+
+    def step_match(self, offset):
+        """Переходит к следующему (offset=1) или предыдущему (-1) совпадению и возвращает номер строки."""
+        if not self.matches:
+            return None
+        previous = self.matches[self.current_match]
+        self.current_match = (self.current_match + offset) % len(self.matches)
+        for row in (previous, self.matches[self.current_match]):
+            self.dataChanged.emit(self.index(row), self.index(row), [Qt.ItemDataRole.BackgroundRole])
+        return self.matches[self.current_match]
+
+
+class SegmentView(QWidget):
+    """Список сегментов с поиском. По щелчку на строке сообщает время её начала (timestamp_selected)."""
+
+    timestamp_selected = pyqtSignal(float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.model = SegmentListModel(self)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        search_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('Поиск по расшифровке')
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self._schedule_search)
+        self.search_edit.returnPressed.connect(lambda: self.step_match(1))
+        self.btn_prev = QPushButton('↑')
+        self.btn_prev.setFixedWidth(32)
+        self.btn_prev.clicked.connect(lambda: self.step_match(-1))
+        self.btn_next = QPushButton('↓')
+        self.btn_next.setFixedWidth(32)
+        self.btn_next.clicked.connect(lambda: self.step_match(1))
+        self.match_label = QLabel('')
+
+        search_layout.addWidget(self.search_edit)
+        search_layout.addWidget(self.btn_prev)
+        search_layout.addWidget(self.btn_next)
+        search_layout.addWidget(self.match_label)
+        layout.addLayout(search_layout)
+
+        # Сообщение вместо списка (ошибка обработки и т.п.)
+        self.message_label = QLabel('')
+        self.message_label.setWordWrap(True)
+        self.message_label.hide()
+        layout.addWidget(self.message_label)
+
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        # Одинаковая высота строк: представлению не нужно измерять каждую строку
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setWordWrap(False)
+        self.list_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.list_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.list_view.clicked.connect(self._on_clicked)
+        layout.addWidget(self.list_view)
+
+        copy_action = QAction('Копировать', self.list_view)
+        copy_action.setShortcut(QKeySequence.StandardKey.Copy)
+        copy_action.setShortcutContext(Qt.ShortcutContext.WidgetShortcut)
+        copy_action.triggered.connect(self.copy_selection)
+        self.list_view.addAction(copy_action)
+
+        self.setLayout(layout)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.run_search)
+
+    def set_segments(self, segments):
+        self.set_message('')
+        self.model.set_segments(segments)
+        self.run_search()
+
+    def append_segments(self, segments):
+        """Дописывает сегменты; если список был прокручен до конца, он остаётся в конце."""
+        scroll_bar = self.list_view.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum()
+        self.model.append_segments(segments)
+        if at_bottom:
+            self.list_view.scrollToBottom()
+        if self.search_edit.text().strip():
+            self._schedule_search()
+
+    def clear(self):
+        self.set_message('')
+        self.model.clear()
+        self.match_label.setText('')
+
+    def set_message(self, text):
+        self.message_label.setText(text)
+        self.message_label.setVisible(bool(text))
+
+    def _schedule_search(self):
+        self.search_timer.start(SEARCH_DELAY_MS)
+
+    def run_search(self):
+        query = self.search_edit.text()
+        matches = self.model.search(query)
+        if not query.strip():
+            self.match_label.setText('')
+            return
+        self.match_label.setText(f'1 из {len(matches)}' if matches else 'Не найдено')
+        if matches:
+            self._show_row(matches[0])
+
+    def step_match(self, offset):
+        if self.search_timer.isActive():
+            self.search_timer.stop()
+            self.run_search()
+            return
+        row = self.model.step_match(offset)
+        if row is None:
+            return
+        self.match_label.setText(f'{self.model.current_match + 1} из {len(self.model.matches)}')
+        self._show_row(row)
+
+    def _show_row(self, row):
+        index = self.model.index(row)
+        self.list_view.setCurrentIndex(index)
+        self.list_view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def _on_clicked(self, index):
+        seg = self.model.data(index, SegmentRole)
+        if seg is not None:
+            self.timestamp_selected.emit(float(seg['start']))
+
+    def copy_selection(self):
+        rows = sorted(index.row() for index in self.list_view.selectionModel().selectedIndexes())
+        text = '\n'.join(self.model.data(self.model.index(row)) for row in rows)
+        if text:
+            QApplication.clipboard().setText(text)
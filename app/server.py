@@ -0,0 +1,251 @@
+"""Локальный сервис расшифровки без графического интерфейса.
+
+Запуск: python run.py --server [--host 127.0.0.1] [--port 8765] [--workers 1] [--max-queue 32]
+
+POST   /jobs                 - поставить задачу: JSON {"path": ..., "model": ..., "vad": ..., "shards": ...}
+                               или тело с файлом (?filename=rec.mp3&model=small);
+                               "formats": ["srt", "docx"] - сохранить расшифровку рядом с файлом
+GET    /jobs                 - список задач
+GET    /jobs/<id>            - состояние задачи
+GET    /jobs/<id>/result     - сегменты построчно (JSON lines) по мере готовности
+DELETE /jobs/<id>            - отменить задачу
+GET    /stats                - глубина очереди, пропускная способность и статистика кэша
+GET    /trace                - события трассировки в формате Chrome trace (VOICE_DECODER_TRACE=1)
+DELETE /cache                - очистить кэш расшифровок
+"""
+import argparse
+import json
+import logging
+import shutil
+import tempfile
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+from app import check_ffmpeg, tracing
+from app.exporters import EXPORTERS
+from app.job_queue import JobQueue, QueueFullError
+from app.model_registry import CPU_BACKENDS, MODEL_MEMORY_MB, set_cpu_backend
+from app.transcript_cache import transcript_cache
+
+log = logging.getLogger(__name__)
+
+# Как часто поток выдачи результата проверяет новые сегменты (с)
+RESULT_POLL_SECONDS = 0.5
+
+
+class TranscriptionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workers=1, max_queue=32):
+        super().__init__(address, TranscriptionRequestHandler)
+        self.job_queue = JobQueue(inference_workers=workers, max_pending=max_queue, on_released=self._remove_upload)
+        self.upload_dir = Path(tempfile.mkdtemp(prefix='voice_decoder_uploads_'))
+        self.job_queue.start()
+
+    def _remove_upload(self, job):
+        """Загруженный файл нужен только пока задача в работе."""
+        path = Path(job.file_path)
+        if path.parent == self.upload_dir:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                log.warning('Не удалось удалить загруженный файл %s: %s', path, e)
+
+    def server_close(self):
+        super().server_close()
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+
+class TranscriptionRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'VoiceDecoder'
+    # Результат отдаётся с Transfer-Encoding: chunked, а он есть только в HTTP/1.1.
+    # Поэтому у всех остальных ответов должен быть Content-Length
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = self._path_parts()
+
+        if parts == ['stats']:
+            return self._send_json(200, self.server.job_queue.stats())
+        if parts == ['trace']:
+            return self._send_json(200, tracing.chrome_trace())
+        if parts == ['jobs']:
+            return self._send_json(200, [job.to_dict() for job in self.server.job_queue.jobs])
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self._find_job(parts[1])
+            if job is None:
+                return
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == 'result':
+                return self._stream_result(job)
+
+        self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self._path_parts() != ['jobs']:
+            # Тело запроса не прочитано - соединение дальше использовать нельзя
+            return self._send_json(404, {'error': 'not found'}, {'Connection': 'close'})
+
+        try:
+            options, file_path = self._read_submission()
+        except ValueError as e:
+            return self._send_json(400, {'error': str(e)})
+
+        try:
+            job = self.server.job_queue.add(file_path, save_transcript=bool(options['formats']), **options)
+        except QueueFullError as e:
+            if Path(file_path).parent == self.server.upload_dir:
+                Path(file_path).unlink(missing_ok=True)
+            # Обратное давление: клиент должен повторить запрос позже
+            return self._send_json(429, {'error': str(e)}, {'Retry-After': '5'})
+
+        self._send_json(202, job.to_dict())
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        if parts == ['cache']:
+            transcript_cache.clear()
+            return self._send_json(200, transcript_cache.stats())
+        if len(parts) != 2 or parts[0] != 'jobs':
+            return self._send_json(404, {'error': 'not found'})
+
+        job = self._find_job(parts[1])
+        if job is None:
+            return
+        self.server.job_queue.cancel(job.id)
+        self._send_json(200, job.to_dict())
+
+    def _read_submission(self):
+        query = parse_qs(urlparse(self.path).query)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if self.headers.get_content_type() == 'application/json':
+            try:
+                data = json.loads(body or b'{}')
+            except json.JSONDecodeError:
+                raise ValueError('некорректный JSON')
+            if not isinstance(data, dict):
+                raise ValueError('ожидается JSON-объект')
+            file_path = data.get('path')
+            if not isinstance(file_path, str) or not file_path or not Path(file_path).is_file():
+                raise ValueError(f'файл не найден: {file_path}')
+        else:
+            # Файл пришёл в теле запроса - сохраняем его во временную папку сервиса
+            data = {key: values[0] for key, values in query.items()}
+            if not body:
+                raise ValueError('пустое тело запроса')
+            file_name = Path(data.get('filename', 'upload.bin')).name
+            file_path = self.server.upload_dir / f'{time.time_ns()}_{file_name}'
+            file_path.write_bytes(body)
+
+        formats = data.get('formats') or []
+        if isinstance(formats, str):
+            formats = formats.split(',')
+        if not isinstance(formats, list) or not all(isinstance(fmt, str) for fmt in formats):
+            raise ValueError('formats - список строк или строка через запятую')
+        unknown = [fmt for fmt in formats if fmt not in EXPORTERS]
+        if unknown:
+            raise ValueError(f'неизвестные форматы: {", ".join(unknown)}')
+
+        model_size = data.get('model', 'small')
+        if not isinstance(model_size, str) or model_size not in MODEL_MEMORY_MB:
+            raise ValueError(f'неизвестная модель: {model_size} (доступны: {", ".join(MODEL_MEMORY_MB)})')
+
+        options = {
+            'model_size': model_size,
+            'use_vad': str(data.get('vad', False)).lower() in ('1', 'true', 'yes'),
+            'shards': _positive_int(data.get('shards', 1), 'shards'),
+            'use_cache': str(data.get('cache', True)).lower() not in ('0', 'false', 'no'),
+            'formats': tuple(formats),
+        }
+        return options, str(file_path)
+
+    def _stream_result(self, job):
+        """Отдаёт сегменты в формате JSON lines по мере появления, затем итоговое состояние задачи."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        sent = 0
+        while True:
+            finished = job.finished
+            segments = job.segments
+            for seg in segments[sent:]:
+                self._write_chunk({'start': seg['start'], 'end': seg['end'], 'text': seg['text']})
+            sent = len(segments)
+
+            if finished:
+                break
+            time.sleep(RESULT_POLL_SECONDS)
+
+        self._write_chunk({'status': job.status, 'error': job.error})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data):
+        payload = (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(payload):X}\r\n'.encode('ascii') + payload + b'\r\n')
+        self.wfile.flush()
+
+    def _find_job(self, job_id):
+        job = self.server.job_queue.get(int(job_id)) if job_id.isdigit() else None
+        if job is None:
+            self._send_json(404, {'error': f'задача {job_id} не найдена'})
+        return job
+
+    def _path_parts(self):
+        return [part for part in urlparse(self.path).path.split('/') if part]
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _positive_int(value, name):
+    """Целое число не меньше 1 из JSON или строки запроса; иначе ValueError (ответ 400)."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+        raise ValueError(f'{name} - целое число не меньше 1')
+    number = int(value)
+    if number < 1:
+        raise ValueError(f'{name} - целое число не меньше 1')
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сервис расшифровки без графического интерфейса')
+    parser.add_argument('--server', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help='число воркеров со своей моделью')
+    parser.add_argument('--max-queue', type=int, default=32, help='максимум незавершённых задач')
+    parser.add_argument('--backend', choices=CPU_BACKENDS, help='бэкенд расшифровки на CPU (по умолчанию torch)')
+    args, _ = parser.parse_known_args(argv)
+
+    if args.backend:
+        set_cpu_backend(args.backend)
+    check_ffmpeg()
+
+    server = TranscriptionServer((args.host, args.port), args.workers, args.max_queue)
+    log.info('Сервис расшифровки запущен: http://%s:%s (воркеров: %s)', args.host, args.port, args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.job_queue.stop()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    tracing.setup_logging()
+    main()
@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from app.audio_split import OVERLAP_SECONDS, find_split_point, merge_window_segments
+from app.convert_to_wav import SAMPLE_RATE
+from app.tracing import span
+
+# Записи короче этого (с) на куски не делим: загрузка моделей в воркерах не окупится
+MIN_SHARD_SECONDS = 5 * 60
+# В каком радиусе от целевой точки (с) искать паузу для разреза
+SPLIT_SEARCH_SECONDS = 15
+
+_pools = {}  # (кусков, потоков на кусок) -> [пул, сколько задач им сейчас пользуется]
+_pools_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+
+def default_shard_count():
+    """Число кусков по умолчанию: по одному на пару ядер, но не меньше двух."""
+    return max(2, (os.cpu_count() or 2) // 2)
+
+
+def shard_count(duration, shards=None):
+    """Сколько кусков на самом деле получит запись длиной duration (с): короткие на куски не делятся."""
+    shards = shards or default_shard_count()
+    if duration < 2 * MIN_SHARD_SECONDS:
+        return 1
+    return min(shards, int(duration // MIN_SHARD_SECONDS))
+
+
+def threads_per_shard(shards):
+    return max(1, (os.cpu_count() or 1) // shards)
+
+
+def plan_shards(audio, shards):
+    """Делит запись на куски по паузам.
+
+    Возвращает список (начало, конец, начало зоны ответственности, конец зоны ответственности) в сэмплах.
+    Кусок расшифровывается целиком, но в итог попадают только сегменты из его зоны ответственности.
+    """
+    overlap = int(OVERLAP_SECONDS * SAMPLE_RATE)
+    borders = [(0, True)]
+    for index in range(1, shards):
+        borders.append(find_split_point(audio, len(audio) * index // shards, SPLIT_SEARCH_SECONDS))
+    borders.append((len(audio), True))
+
+    plan = []
+    for (core_start, clean_start), (core_end, clean_end) in zip(borders, borders[1:]):
+        start = core_start if clean_start else max(0, core_start - overlap)
+        end = core_end if clean_end else min(len(audio), core_end + overlap)
+        plan.append((start, end, core_start, core_end))
+
+    return plan
+
+
+def _init_worker(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def _shard_model(model_size, seconds):
+    """Модель процесса пула: загружается один раз на процесс и остаётся в памяти."""
+    from app.compile_manager import compile_manager
+    from app.model_registry import default_precision, model_registry
+
+    model = model_registry.get(model_size, 'cpu', default_precision('cpu'))
+    compile_manager.prepare(model, model_size, 'cpu', seconds)
+    return model
+
+
+def _detect_shard_language(audio, model_size):
+    from app.transcribe import detect_language
+
+    return detect_language(_shard_model(model_size, len(audio) / SAMPLE_RATE), audio)
+
+
+def _language_sample(audio, use_vad):
+    """Звук, по которому определяется язык: первое окно записи, как в обычном пути."""
+    from app.vad import MAX_WINDOW_SECONDS, detect_speech, pack_speech_windows
+
+    if use_vad:
+        windows = pack_speech_windows(detect_speech(audio))
+        if windows:
+            return windows[0].extract(audio)
+    return audio[:int(MAX_WINDOW_SECONDS * SAMPLE_RATE)]
+
+
+def _transcribe_shard(audio, model_size, use_vad, offset, language=None):
+    """Выполняется в процессе пула. Кусок режется на окна и расшифровывается так же, как запись
+    в обычном пути (decode_windows), с языком, определённым один раз на всю запись."""
+    from app.transcribe import decode_windows, transcribe_speech_only
+    from app.vad import split_into_windows
+
+    model = _shard_model(model_size, len(audio) / SAMPLE_RATE)
+    if use_vad:
+        segments = transcribe_speech_only(model, audio, False, language=language)
+    else:
+        segments = decode_windows(model, audio, split_into_windows(audio), False, language=language)
+
+    return [{'start': seg['start'] + offset, 'end': seg['end'] + offset, 'text': seg['text']}
+            for seg in segments]
+
+
+@contextmanager
+def use_pool(shards):
+    """Пул процессов переиспользуется между задачами, чтобы не загружать модели заново.
+
+    Задачи идут параллельно (несколько воркеров очереди), поэтому пул другой формы закрывается,
+    только когда им больше никто не пользуется.
+    """
+    shape = (shards, threads_per_shard(shards))
+    with _pools_lock:
+        for other in [other for other, (_, users) in _pools.items() if other != shape and users == 0]:
+            _pools.pop(other)[0].shutdown(cancel_futures=True)
+        if shape not in _pools:
+            _pools[shape] = [ProcessPoolExecutor(max_workers=shards, initializer=_init_worker,
+                                                 initargs=(shape[1],)), 0]
+        entry = _pools[shape]
+        entry[1] += 1
+
+    try:
+        yield entry[0]
+    finally:
+        with _pools_lock:
+            entry[1] -= 1
+
+
+def merge_shard_segments(plan, shard_segments, merged=None):
+    """Склеивает сегменты кусков: оставляет сегменты своей зоны и убирает слова, повторённые на стыках.
+
+    merged - уже склеенные сегменты предыдущих кусков (для постепенной выдачи результата).
+    """
+    merged = [] if merged is None else merged
+    added_from = len(merged)
+
+    for (start, end, core_start, core_end), segments in zip(plan, shard_segments):
+        # Стык без паузы: куски перекрываются, и сегменты сверяются по зонам и словам
+        merged.extend(merge_window_segments(merged, segments,
+                                            core_start / SAMPLE_RATE if start < core_start else None,
+                                            core_end / SAMPLE_RATE if end > core_end else None))
+
+    return merged[added_from:]
+
+
+def transcribe_sharded(audio, model_size, shards=None, use_vad=False, progress=None, segment_callback=None):
+    """Расшифровывает длинную запись параллельно на нескольких процессах CPU.
+
+    Сегменты отдаются в segment_callback по порядку: кусок выдаётся, когда готовы все куски перед ним.
+    """
+    shards = shard_count(len(audio) / SAMPLE_RATE, shards)
+
+    plan = plan_shards(audio, shards)
+    log.debug('Запись разбита на %s кусков, потоков на кусок: %s', len(plan), threads_per_shard(len(plan)))
+
+    with use_pool(len(plan)) as pool:
+        # Язык определяется один раз на всю запись: иначе куски могли бы получить разный язык
+        with span('language_detection'):
+            language = pool.submit(_detect_shard_language, _language_sample(audio, use_vad), model_size).result()
+        log.debug('Язык записи: %s', language)
+        futures = {pool.submit(_transcribe_shard, audio[start:end], model_size, use_vad, start / SAMPLE_RATE,
+                               language): index
+                   for index, (start, end, _, _) in enumerate(plan)}
+
+        shard_segments = [None] * len(plan)
+        merged = []
+        next_index = 0
+        decoded_samples = 0
+
+        for future in as_completed(futures):
+            index = futures[future]
+            shard_segments[index] = future.result()
+            decoded_samples += plan[index][3] - plan[index][2]
+
+            # Выдаём готовые куски по порядку, чтобы сегменты шли по возрастанию времени
+            new_segments = []
+            while next_index < len(plan) and shard_segments[next_index] is not None:
+                new_segments += merge_shard_segments(plan[next_index:next_index + 1],
+                                                     shard_segments[next_index:next_index + 1], merged)
+                next_index += 1
+
+            if progress:
+                progress.update(decoded_samples / SAMPLE_RATE)
+            if segment_callback:
+                segment_callback(new_segments, progress)
+
+    return merged
@@ -0,0 +1,137 @@
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from app import APP_VERSION, CACHE_DIR, check_ffmpeg
+
+STARTUP_LOG_PATH = CACHE_DIR / 'startup.jsonl'
+
+log = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Замеры запуска: сколько занял каждый импорт и этап от старта run.py до готовности движка."""
+
+    def __init__(self, started=None):
+        self.started = started or time.perf_counter()
+        self.steps = {}  # имя этапа -> секунды
+        self.marks = {}  # имя события -> секунды от старта
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps[name] = round(time.perf_counter() - started, 4)
+
+    def mark(self, name):
+        with self._lock:
+            self.marks[name] = round(time.perf_counter() - self.started, 4)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'version': APP_VERSION,
+                'frozen': bool(getattr(sys, 'frozen', False)),
+                'time': time.time(),
+                'marks': dict(self.marks),
+                'steps': dict(self.steps),
+            }
+
+    def save(self):
+        """Дописывает замеры в cache/startup.jsonl, чтобы сравнивать запуск между версиями."""
+        try:
+            STARTUP_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            with open(STARTUP_LOG_PATH, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(self.to_dict(), ensure_ascii=False) + '\n')
+        except OSError as e:
+            log.warning('Не удалось сохранить замеры запуска: %s', e)
+
+
+startup_timer = StartupTimer()
+
+
+def _import_torch():
+    import torch
+
+    return torch
+
+
+def _import_whisper():
+    import whisper
+
+    return whisper
+
+
+def _import_vad():
+    import silero_vad
+
+    return silero_vad
+
+
+def _plan_execution():
+    from app.execution_plan import plan_execution
+
+    return plan_execution().device
+
+
+class EngineLoader:
+    """Загружает тяжёлые библиотеки (torch, whisper, Silero VAD) и определяет устройство в фоновом потоке,
+    пока окно уже открыто. on_ready получает устройство, on_error - текст ошибки."""
+
+    STEPS = (
+        ('ffmpeg', check_ffmpeg),
+        ('torch', _import_torch),
+        ('whisper', _import_whisper),
+        ('silero_vad', _import_vad),
+        ('device', _plan_execution),
+    )
+
+    def __init__(self, on_ready=None, on_error=None, timer=startup_timer):
+        self.on_ready = on_ready
+        self.on_error = on_error
+        self.timer = timer
+        self.device = None
+        self.error = None
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self.error is None
+
+    def start(self):
+        thread = threading.Thread(target=self._load, name='engine-loader', daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _load(self):
+        try:
+            for name, step in self.STEPS:
+                with self.timer.measure(name):
+                    result = step()
+                if name == 'device':
+                    self.device = result
+        except Exception as e:
+            log.exception('Ошибка при загрузке движка: %s', e)
+            self.error = str(e)
+            self._ready.set()
+            if self.on_error:
+                self.on_error(self.error)
+            return
+
+        self.timer.mark('engine_ready')
+        self.timer.save()
+        log.info('Движок готов за %.2f с: %s', self.timer.marks['engine_ready'],
+                 ', '.join(f'{name} {seconds:.2f} с' for name, seconds in self.timer.steps.items()))
+        self._ready.set()
+        if self.on_ready:
+            self.on_ready(self.device)
@@ -0,0 +1,308 @@
+"""Потоковая расшифровка длинных записей с ограниченной памятью.
+
+Обычный путь декодирует весь файл в массив float32 (10 часов - больше 2 ГБ). В потоковом режиме
+PCM читается из ffmpeg блоками фиксированного размера в кольцевой буфер на одно окно (30 с + блок),
+окна режутся по паузам так же, как в split_into_windows, и по очереди уходят в модель с текстом
+предыдущего окна в качестве контекста. Прочитанное аудио сразу освобождается, поэтому пик памяти
+не зависит от длины записи.
+
+Проверка пика памяти на синтетической записи: python run.py --benchmark --streaming-check --hours 10
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from app import FFMPEG_PATH
+from app.audio_split import cut_window
+from app.convert_to_wav import SAMPLE_RATE, wav_data_range
+from app.execution_plan import plan_execution
+from app.job_history import record_job
+from app.media_probe import probe_media
+from app.model_registry import cpu_backend, model_registry
+from app.tracing import count, span
+from app.transcribe import DecodeProgress, decode_windows
+from app.vad import MAX_WINDOW_SECONDS, WINDOW_CUT_SEARCH_SECONDS
+
+# Размер блока чтения из ffmpeg (с)
+BLOCK_SECONDS = 5
+# auto - только для записей длиннее порога, 1 - всегда, 0 - никогда
+STREAMING_MODE = os.environ.get('VOICE_DECODER_STREAMING', 'auto')
+STREAMING_MIN_SECONDS = float(os.environ.get('VOICE_DECODER_STREAMING_MIN_HOURS', 2)) * 3600
+# Допустимый рост RSS в проверке памяти (МБ): буфер, окно и служебные объекты, но не сама запись
+STREAMING_RSS_BUDGET_MB = 64
+
+log = logging.getLogger(__name__)
+
+
+def should_stream(duration, save_converted=False, use_vad=False, shards=1):
+    """Нужен ли потоковый режим.
+
+    Конвертированный WAV можно сохранить только из целой записи, а VAD и деление на куски работают
+    с записью целиком - если пользователь их выбрал, запись декодируется в память как обычно.
+    """
+    if save_converted or use_vad or shards != 1 or STREAMING_MODE == '0':
+        return False
+    if STREAMING_MODE == '1':
+        return True
+    return duration is not None and duration >= STREAMING_MIN_SECONDS
+
+
+class RingBuffer:
+    """Кольцевой буфер сэмплов фиксированной ёмкости с абсолютными позициями в записи."""
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.start = 0  # абсолютная позиция первого сэмпла в буфере
+        self.end = 0  # абсолютная позиция после последнего сэмпла
+
+    @property
+    def available(self):
+        return self.end - self.start
+
+    @property
+    def free(self):
+        return len(self.data) - self.available
+
+    def write(self, samples):
+        if len(samples) > self.free:
+            raise OverflowError(f'В буфере нет места для {len(samples)} сэмплов')
+        offset = self.end % len(self.data)
+        first = min(len(samples), len(self.data) - offset)
+        self.data[offset:offset + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+        self.end += len(samples)
+
+    def read(self, length):
+        """Копия первых length сэмплов буфера (без удаления)."""
+        length = min(length, self.available)
+        offset = self.start % len(self.data)
+        first = min(length, len(self.data) - offset)
+        return np.concatenate((self.data[offset:offset + first], self.data[:length - first]))
+
+    def consume(self, length):
+        self.start += min(length, self.available)
+
+
+class StreamWindow:
+    """Окно потоковой расшифровки: своё аудио и положение в исходной записи (интерфейс как у SpeechWindow)."""
+
+    def __init__(self, source_start, audio, core_start=None, core_end=None):
+        self.source_start = source_start
+        self.audio = audio
+        self.core_start = core_start
+        self.core_end = core_end
+
+    @property
+    def source_end(self):
+        return (self.source_start + len(self.audio)) / SAMPLE_RATE
+
+    def extract(self, audio=None):
+        return self.audio
+
+    def to_source_time(self, seconds, is_end=False):
+        return self.source_start / SAMPLE_RATE + min(max(0.0, seconds), len(self.audio) / SAMPLE_RATE)
+
+
+def _pcm_to_float(data):
+    # Нечётный байт может остаться только в самом конце потока
+    data = data[:len(data) - len(data) % 2]
+    return np.frombuffer(data, '<i2').astype(np.float32) / 32768.0
+
+
+def read_ffmpeg_blocks(command, block_seconds=BLOCK_SECONDS):
+    """Запускает ffmpeg и отдаёт PCM из его stdout блоками float32. Процесс завершается вместе с генератором."""
+    block_bytes = int(block_seconds * SAMPLE_RATE) * 2
+    log.debug('Запуск FFmpeg (поток): %s', ' '.join(command))
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=block_bytes)
+    # stderr читается в фоне, чтобы ffmpeg не встал на заполненном канале
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield _pcm_to_float(data)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        stderr_thread.join()
+
+    if process.returncode != 0:
+        log.error('FFmpeg ошибка: %s', b''.join(stderr_chunks).decode(errors='ignore'))
+        raise RuntimeError('Ошибка при потоковом декодировании')
+
+
+def stream_pcm(input_path, block_seconds=BLOCK_SECONDS):
+    """Блоки PCM файла: WAV в нужном формате читается напрямую, остальное - через ffmpeg."""
+    if probe_media(input_path).is_whisper_pcm:
+        block_bytes = int(block_seconds * SAMPLE_RATE) * 2
+        offset, remaining = wav_data_range(input_path)
+        with open(input_path, 'rb') as file:
+            file.seek(offset)
+            while remaining > 0:
+                data = file.read(min(block_bytes, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield _pcm_to_float(data)
+        return
+
+    command = [
+        str(FFMPEG_PATH), '-nostdin', '-loglevel', 'error', '-threads', '0',
+        '-i', str(input_path),
+        '-vn', '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-acodec', 'pcm_s16le',
+        '-'
+    ]
+    yield from read_ffmpeg_blocks(command, block_seconds)
+
+
+def stream_windows(blocks, max_window_seconds=MAX_WINDOW_SECONDS, block_seconds=BLOCK_SECONDS):
+    """Режет поток блоков на окна не длиннее max_window_seconds по самым тихим местам (как split_into_windows).
+
+    Если паузы нет, окна перекрываются, а зоны окон указывают, чьи сегменты брать на стыке.
+    """
+    max_samples = int(max_window_seconds * SAMPLE_RATE)
+    buffer = RingBuffer(max_samples + int(block_seconds * SAMPLE_RATE))
+    pending = np.zeros(0, dtype=np.float32)  # часть блока, не поместившаяся в буфер
+    blocks = iter(blocks)
+    finished = False
+    core_start = None
+
+    while True:
+        # Заполняем буфер, пока в нём нет окна целиком и чуть больше (чтобы знать, что запись продолжается)
+        while buffer.available <= max_samples and not finished:
+            if not len(pending):
+                pending = next(blocks, None)
+                if pending is None:
+                    finished = True
+                    pending = np.zeros(0, dtype=np.float32)
+                    break
+            taken = min(len(pending), buffer.free)
+            buffer.write(pending[:taken])
+            pending = pending[taken:]
+
+        if buffer.available == 0:
+            return
+
+        source_start = buffer.start
+        if buffer.available > max_samples:
+            segment = buffer.read(max_samples)
+            cut, end, next_start = cut_window(segment, 0, max_samples, WINDOW_CUT_SEARCH_SECONDS)
+            window_audio = segment[:end].copy()
+            del segment
+            core_end = (source_start + cut) / SAMPLE_RATE if end != cut else None
+        else:
+            window_audio = buffer.read(buffer.available)
+            next_start = len(window_audio)
+            core_end = None
+
+        buffer.consume(next_start)
+        count('stream_windows')
+        yield StreamWindow(source_start, window_audio, core_start, core_end)
+        core_start = core_end
+
+
+def transcribe_stream(file_path, model_size='small', progress_callback=None, report_callback=None, model_slot=0,
+                      segment_callback=None, duration=None, checkpoint=None):
+    """Расшифровывает файл потоком окон, не загружая запись целиком. Возвращает список сегментов.
+
+    При продолжении с контрольной точки (checkpoint) запись читается с начала, но уже расшифрованные
+    окна пропускаются без модели - разрезы окон те же, что в прошлый раз.
+    """
+    from app.compile_manager import compile_manager
+
+    plan = plan_execution(model_size)
+    plan.check()
+    plan.apply()
+    device = plan.device
+    log.info('Потоковая расшифровка на %s: %s', device, file_path)
+    if report_callback:
+        report_callback('Потоковый режим: запись читается по частям')
+
+    progress = DecodeProgress(duration or 0.0, progress_callback)
+    load_started = time.perf_counter()
+    model = model_registry.get(model_size, device, plan.precision, model_slot)
+    compile_manager.prepare(model, model_size, device, duration or 0.0)
+    if checkpoint is not None:
+        checkpoint.begin(device=device, precision=plan.precision, batch_size=plan.batch_size, streaming=True)
+    progress.started_at = time.perf_counter()
+
+    windows = stream_windows(stream_pcm(file_path))
+    try:
+        with span('stream_decode'):
+            # Пакеты окон, как и в обычном пути, собираются из генератора: в памяти только текущий пакет
+            segments = decode_windows(model, None, windows, plan.precision == 'fp16', progress, segment_callback,
+                                      plan.batch_size, model_size, checkpoint)
+    finally:
+        windows.close()
+
+    decoded = progress.decoded_seconds if duration else (segments[-1]['end'] if segments else 0.0)
+    count('audio_seconds', decoded)
+    record_job(model_size, device, decoded - progress.resumed_seconds, progress.started_at - load_started,
+               time.perf_counter() - progress.started_at, use_vad=False, shards=1, batch_size=plan.batch_size,
+               backend=cpu_backend() if device == 'cpu' else 'torch', compiled=compile_manager.is_compiled(model))
+    return segments
+
+
+def synthetic_blocks(hours, block_seconds=BLOCK_SECONDS):
+    """Синтетическая запись заданной длины блоками: тон с шумом и паузой каждые 10 секунд."""
+    block = int(block_seconds * SAMPLE_RATE)
+    rng = np.random.default_rng(0)
+    t = np.arange(block) / SAMPLE_RATE
+    for index in range(int(hours * 3600 / block_seconds)):
+        samples = (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(block)).astype(np.float32)
+        # Пауза в каждом втором блоке - по ней режутся окна
+        if index % 2:
+            samples[block // 2:block // 2 + SAMPLE_RATE] = 0
+        yield samples
+
+
+def check_memory(hours=10, budget_mb=STREAMING_RSS_BUDGET_MB):
+    """Прогоняет синтетическую многочасовую запись через буфер и нарезку окон и проверяет, что RSS
+    не растёт больше чем на budget_mb. Если ffmpeg доступен, блоки идут через него, как в обычной работе."""
+    from app.benchmark import current_rss_mb
+
+    if FFMPEG_PATH.is_file() and os.access(FFMPEG_PATH, os.X_OK):
+        command = [str(FFMPEG_PATH), '-nostdin', '-loglevel', 'error', '-f', 'lavfi',
+                   '-i', f'sine=frequency=220:sample_rate={SAMPLE_RATE}:duration={int(hours * 3600)}',
+                   '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-acodec', 'pcm_s16le', '-']
+        blocks, source = read_ffmpeg_blocks(command), 'ffmpeg'
+    else:
+        blocks, source = synthetic_blocks(hours), 'numpy'
+
+    baseline = current_rss_mb()
+    peak = baseline
+    windows = 0
+    seconds = 0.0
+    started = time.perf_counter()
+    for window in stream_windows(blocks):
+        windows += 1
+        seconds = window.source_end
+        if windows % 20 == 0:
+            rss = current_rss_mb()
+            if rss is not None and rss > peak:
+                peak = rss
+
+    growth = peak - baseline if baseline is not None else None
+    return {
+        'source': source,
+        'audio_hours': round(seconds / 3600, 2),
+        'windows': windows,
+        'seconds': round(time.perf_counter() - started, 2),
+        'baseline_rss_mb': round(baseline, 1) if baseline is not None else None,
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        'growth_mb': round(growth, 1) if growth is not None else None,
+        'budget_mb': budget_mb,
+        # Целиком такая запись заняла бы столько (float32)
+        'full_buffer_mb': round(seconds * SAMPLE_RATE * 4 / 1024 / 1024, 1),
+        # Без замера RSS проверка не может считаться пройденной
+        'passed': growth is not None and growth <= budget_mb,
+    }
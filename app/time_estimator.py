@@ -1,16 +1,48 @@
+import logging
+import math
 import os
-import subprocess
+import sys
+import time
 
-from app import FFMPEG_PATH
-from app.get_best_device import get_best_device
+from app.execution_plan import plan_execution
+from app.job_history import load_history
+from app.media_probe import probe_media
+from app.sharding import default_shard_count, shard_count
 
-# Параметры моделей: коэффициент скорости + фиксированное время загрузки
+log = logging.getLogger(__name__)
+
+# Параметры моделей: коэффициент скорости + фиксированное время загрузки.
+# Используются как априорная оценка, пока на этом компьютере нет истории завершённых задач.
 MODEL_PARAMS = {
     'small': {'coefficient': 0.5, 'load_time': 5},
     'medium': {'coefficient': 1.0, 'load_time': 10},
-    'large': {'coefficient': 2.0, 'load_time': 20}
+    'large': {'coefficient': 2.0, 'load_time': 20},
+    'large-v3': {'coefficient': 2.0, 'load_time': 20},
 }
 
+# Какую долю идеального ускорения даёт каждый дополнительный кусок при параллельной обработке на CPU
+SHARD_EFFICIENCY = 0.7
+
+# Вес априорной оценки в «задачах»: чем больше истории, тем меньше влияние таблицы
+PRIOR_WEIGHT = 3
+# Разброс априорной оценки скорости (логарифм коэффициента): таблица может ошибаться в разы
+PRIOR_LOG_STD = 0.7
+# Квантиль нормального распределения для 80% интервала
+INTERVAL_Z = 1.28
+# Загрузка быстрее этого (с) означает, что модель уже была в памяти
+WARM_LOAD_SECONDS = 0.5
+
+
+class Estimate:
+    """Оценка времени расшифровки (с) с границами 80% интервала."""
+
+    def __init__(self, seconds, low, high, samples, load_seconds):
+        self.seconds = seconds
+        self.low = low
+        self.high = high
+        self.samples = samples
+        self.load_seconds = load_seconds
+
 
 def get_audio_duration(file_path):
     """Возвращает длительность аудио/видео файла в секундах."""
@@ -18,19 +50,10 @@ def get_audio_duration(file_path):
         if not os.path.exists(file_path):
             return None
 
-        command = [FFMPEG_PATH, '-i', file_path, '-hide_banner']
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='ignore')
-
-        duration_line = [line for line in result.stderr.split("\n") if "Duration" in line]
-        if not duration_line:
-            return None
-
-        duration_str = duration_line[0].split("Duration: ")[1].split(",")[0]
-        h, m, s = map(float, duration_str.replace(":", " ").split())
-        return h * 3600 + m * 60 + s
+        return probe_media(file_path).duration
 
     except Exception as e:
-        print(f'Error get_audio_duration => {e}')
+        log.warning('Error get_audio_duration => %s', e)
         return None
 
 
@@ -42,31 +65,132 @@ def format_time(seconds):
     return f'{h:02}:{m:02}:{s:02}'
 
 
-def estimate_transcription_time(file_path, model_size='small'):
+def prior_speed_factor(model_size='small', device='cpu', shards=1):
+    """Коэффициент скорости (секунд работы на секунду аудио) из таблицы MODEL_PARAMS."""
+    gpu_boost = 0.5 if device in ('cuda', 'mps') else 1.0
+
+    model_params = MODEL_PARAMS.get(model_size, {'coefficient': 2.0, 'load_time': 10})  # Значения по умолчанию
+    speed_factor = model_params['coefficient'] * gpu_boost
+    if shards > 1 and device == 'cpu':
+        speed_factor /= 1 + (shards - 1) * SHARD_EFFICIENCY
+    return speed_factor
+
+
+def estimate_range(duration, model_size='small', device='cpu', shards=1, use_vad=False, model_loaded=False,
+                   batch_size=1):
+    """Оценка по истории завершённых задач на этом компьютере; таблица MODEL_PARAMS служит априорной оценкой.
+
+    Скорость (RTF) усредняется в логарифмах, потому что ошибки оценок мультипликативные.
+    """
+    model_params = MODEL_PARAMS.get(model_size, {'coefficient': 2.0, 'load_time': 10})  # Значения по умолчанию
+    from app.model_registry import cpu_backend
+
+    backend = cpu_backend() if device == 'cpu' else 'torch'
+    history = load_history(model=model_size, device=device, shards=shards, use_vad=use_vad, backend=backend,
+                           batch_size=batch_size)
+    log_rtfs = [math.log(record['rtf']) for record in history if record.get('rtf', 0) > 0]
+
+    prior_mean = math.log(prior_speed_factor(model_size, device, shards))
+    n = len(log_rtfs)
+    mean = (PRIOR_WEIGHT * prior_mean + sum(log_rtfs)) / (PRIOR_WEIGHT + n)
+
+    if n >= 2:
+        sample_mean = sum(log_rtfs) / n
+        sample_var = sum((value - sample_mean) ** 2 for value in log_rtfs) / (n - 1)
+        variance = (PRIOR_WEIGHT * PRIOR_LOG_STD ** 2 + (n - 1) * sample_var) / (PRIOR_WEIGHT + n - 1)
+    else:
+        variance = PRIOR_LOG_STD ** 2
+    # Разброс для новой задачи: неопределённость среднего плюс разброс отдельных задач
+    spread = math.sqrt(variance * (1 + 1 / (PRIOR_WEIGHT + n))) * INTERVAL_Z
+
+    if model_loaded or (shards > 1 and n):
+        # Модель уже в памяти, или загрузка в воркерах уже вошла в замеренную скорость
+        load_seconds = 0.0
+    else:
+        cold_loads = sorted(record['load_seconds']
+                            for record in load_history(model=model_size, device=device, backend=backend)
+                            if record.get('load_seconds', 0) > WARM_LOAD_SECONDS)
+        load_seconds = cold_loads[len(cold_loads) // 2] if cold_loads else model_params['load_time']
+
+    return Estimate(duration * math.exp(mean) + load_seconds,
+                    duration * math.exp(mean - spread) + load_seconds,
+                    duration * math.exp(mean + spread) + load_seconds,
+                    n, load_seconds)
+
+
+def estimate_seconds(duration, model_size='small', device='cpu', shards=1):
+    """Оценка времени расшифровки (с) для записи длительностью duration."""
+    return estimate_range(duration, model_size, device, shards).seconds
+
+
+def estimate_transcription_time(file_path, model_size='small', shards=1, use_vad=False):
     """Оценивает примерное время расшифровки, включая загрузку модели."""
     try:
+        from app.model_registry import model_registry
+
         duration = get_audio_duration(file_path)
         if duration is None:
             return 'Не удалось определить длительность файла'
 
-        device = get_best_device()
-        gpu_boost = 0.5 if device in ('cuda', 'mps') else 1.0
-
-        model_params = MODEL_PARAMS.get(model_size, {'coefficient': 2.0, 'load_time': 10})  # Значения по умолчанию
-        speed_factor = model_params['coefficient'] * gpu_boost
-        estimated_time = duration * speed_factor
+        plan = plan_execution(model_size)
+        device = plan.device
+        # Короткие файлы transcribe_audio на куски не делит - и ускорения от кусков не ждём
+        shards = shard_count(duration, shards)
+        sharded = shards > 1 and device == 'cpu'
+        estimate = estimate_range(duration, model_size, device, shards, use_vad,
+                                  model_registry.is_loaded(model_size, device, plan.precision),
+                                  1 if sharded else plan.batch_size)
 
-        # Учитываем время загрузки модели
-        total_time = estimated_time + model_params['load_time']
+        if estimate.samples:
+            basis = f'Оценка по {estimate.samples} завершённым задачам на этом компьютере'
+        else:
+            basis = 'Истории задач пока нет, оценка по таблице по умолчанию'
 
         msg = (f'Будем использовать: {device}\n'
-               f'Примерное время расшифровки: {format_time(total_time)}')
+               f'Примерное время расшифровки: {format_time(estimate.seconds)}\n'
+               f'Скорее всего от {format_time(estimate.low)} до {format_time(estimate.high)}\n'
+               f'{basis}')
+        if not plan.fits:
+            msg += f'\n\nВнимание: модель {model_size} не помещается в память, ' \
+                   f'рекомендуется {plan.recommended_model or "модель поменьше"}'
         return msg
 
     except Exception as e:
-        print(f'Error estimate_transcription_time => {e}')
+        log.exception('Error estimate_transcription_time => %s', e)
+
+
+def measure_sharding_speedup(file_path, model_size='small', shards=None):
+    """Замеряет реальное время обычной и параллельной расшифровки и сравнивает его с оценкой."""
+    from app.transcribe import prepare_audio, transcribe_audio
+
+    shards = shards or default_shard_count()
+    duration = get_audio_duration(file_path)
+    audio = prepare_audio(file_path, save_converted=False)
+
+    measured = {}
+    for shards_used in (1, shards):
+        started = time.perf_counter()
+        transcribe_audio(audio, model_size, shards=shards_used)
+        measured[shards_used] = time.perf_counter() - started
+
+        estimated = estimate_seconds(duration, model_size, 'cpu', shards_used)
+        print(f'Кусков: {shards_used}: фактически {format_time(measured[shards_used])}, '
+              f'оценка {format_time(estimated)}, RTF {measured[shards_used] / duration:.2f}')
+
+    estimated_speedup = (estimate_seconds(duration, model_size, 'cpu')
+                         / estimate_seconds(duration, model_size, 'cpu', shards))
+    print(f'Ускорение: x{measured[1] / measured[shards]:.2f} (оценка x{estimated_speedup:.2f})')
+    return measured
 
 
 if __name__ == '__main__':
-    file_path = os.path.normpath('../test_materials/test_video_4.mp4')
+    if len(sys.argv) < 2:
+        print('Использование: python -m app.time_estimator <файл> [--shards N]\n'
+              'Замеры скорости по этапам: python run.py --benchmark')
+        sys.exit(1)
+
+    file_path = os.path.normpath(sys.argv[1])
     print(estimate_transcription_time(file_path, 'small'))
+
+    if '--shards' in sys.argv:
+        measure_sharding_speedup(file_path, 'small', int(sys.argv[sys.argv.index('--shards') + 1]))
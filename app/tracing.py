@@ -0,0 +1,249 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from app import CACHE_DIR
+
+TRACE_DIR = CACHE_DIR / 'traces'
+# Сколько событий держать в памяти для Chrome trace: старые вытесняются, чтобы долгий сервис не рос бесконечно
+MAX_TRACE_EVENTS = 200000
+# Поля LogRecord, которые не нужно дублировать в структурированном логе
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+log = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+_enabled = os.environ.get('VOICE_DECODER_TRACE', '') not in ('', '0')
+_events = []
+_counters = {}
+_started = time.perf_counter()
+
+
+class JobTrace:
+    """Сводка по одной задаче: суммарное время этапов и счётчики. Этапы могут идти в разных потоках."""
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self.stages = {}  # имя этапа -> [секунды, число вызовов]
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'stages': {name: {'seconds': round(seconds, 4), 'calls': calls}
+                           for name, (seconds, calls) in self.stages.items()},
+                'counters': {name: round(value, 3) for name, value in self.counters.items()},
+            }
+
+    def summary(self):
+        """Короткая строка для интерфейса: этапы по убыванию времени."""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1][0], reverse=True)
+        return ' · '.join(f'{name} {seconds:.1f} с' + (f' ×{calls}' if calls > 1 else '')
+                          for name, (seconds, calls) in stages)
+
+
+class Span:
+    """Именованный этап: длительность попадает в сводку текущей задачи, в лог и в Chrome trace."""
+
+    __slots__ = ('name', 'args', 'job', 'started')
+
+    def __init__(self, name, args, job):
+        self.name = name
+        self.args = args
+        self.job = job
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        finished = time.perf_counter()
+        seconds = finished - self.started
+        if self.job is not None:
+            self.job.add(self.name, seconds)
+        if _enabled:
+            _record_span(self, seconds, exc_type)
+        return False
+
+
+class _NoopSpan:
+    """Заглушка, когда трассировка выключена и задача не привязана: почти нулевые накладные расходы."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable(value=True):
+    global _enabled
+    _enabled = value
+
+
+def span(name, **args):
+    """Контекстный менеджер этапа: with span('ffmpeg_decode', file=path): ..."""
+    job = getattr(_local, 'job', None)
+    if job is None and not _enabled:
+        return _NOOP_SPAN
+    return Span(name, args, job)
+
+
+def count(name, value=1):
+    """Увеличивает счётчик (секунды аудио, сегменты, попадания в кэш...)."""
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.count(name, value)
+    if not _enabled:
+        return
+
+    with _lock:
+        total = _counters[name] = _counters.get(name, 0) + value
+        _append_event({'name': name, 'ph': 'C', 'ts': _timestamp(time.perf_counter()), 'pid': os.getpid(),
+                       'args': {name: total}})
+
+
+class bind_job:
+    """Привязывает сводку задачи к текущему потоку: этапы внутри блока попадают в job_trace."""
+
+    def __init__(self, job_trace):
+        self.job_trace = job_trace
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'job', None)
+        _local.job = self.job_trace
+        return self.job_trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.job = self.previous
+        return False
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def _timestamp(perf_seconds):
+    # Chrome trace ожидает микросекунды
+    return round((perf_seconds - _started) * 1000000, 1)
+
+
+def _append_event(event):
+    _events.append(event)
+    if len(_events) > MAX_TRACE_EVENTS:
+        del _events[:len(_events) - MAX_TRACE_EVENTS]
+
+
+def _record_span(current, seconds, exc_type):
+    job_id = current.job.job_id if current.job is not None else None
+    args = {key: str(value) for key, value in current.args.items()}
+    if job_id is not None:
+        args['job'] = job_id
+    if exc_type is not None:
+        args['error'] = exc_type.__name__
+
+    with _lock:
+        _append_event({'name': current.name, 'ph': 'X', 'ts': _timestamp(current.started),
+                       'dur': round(seconds * 1000000, 1), 'pid': os.getpid(), 'tid': threading.get_ident(),
+                       'args': args})
+
+    log.debug('span %s %.4f с', current.name, seconds,
+              extra={'span': current.name, 'seconds': round(seconds, 4), 'span_args': args})
+
+
+def chrome_trace():
+    """Накопленные события в формате Chrome trace (chrome://tracing, Perfetto)."""
+    with _lock:
+        return {'traceEvents': list(_events), 'displayTimeUnit': 'ms'}
+
+
+def export_chrome_trace(path=None):
+    """Сохраняет накопленные события в файл Chrome trace и возвращает путь (None, если событий нет)."""
+    if path is None:
+        path = TRACE_DIR / f'trace_{time.strftime("%Y%m%d_%H%M%S")}_{os.getpid()}.json'
+
+    trace = chrome_trace()
+    if not trace['traceEvents']:
+        return None
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(trace, file, ensure_ascii=False)
+    return path
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога - одна строка JSON; поля из extra попадают в запись как есть."""
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(debug=False, trace=None):
+    """Настраивает лог приложения: консоль, а при включённой трассировке - ещё JSON-лог и Chrome trace.
+
+    trace=None оставляет значение из переменной окружения VOICE_DECODER_TRACE.
+    """
+    if trace is not None:
+        enable(trace)
+
+    root = logging.getLogger('app')
+    root.setLevel(logging.DEBUG if debug or _enabled else logging.INFO)
+    if root.handlers:
+        return
+
+    console = logging.StreamHandler()
+    console.setLevel(logging.DEBUG if debug else logging.INFO)
+    console.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    root.addHandler(console)
+
+    if _enabled:
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        structured = logging.FileHandler(TRACE_DIR / 'voice_decoder.jsonl', encoding='utf-8')
+        structured.setFormatter(JsonFormatter())
+        root.addHandler(structured)
+
+        def export_on_exit():
+            path = export_chrome_trace()
+            if path:
+                log.info('Трасса сохранена: %s', path)
+
+        atexit.register(export_on_exit)
@@ -1,77 +1,289 @@
-import os
+import itertools
+import logging
+import time
 from pathlib import Path
 
-import torch
-import whisper
-
-from app import WHISPER_MODELS_DIR
-from app.convert_to_wav import convert_to_wav
+from app.audio_split import merge_window_segments
+from app.convert_to_wav import SAMPLE_RATE, decode_audio, read_pcm_wav, save_wav, converted_wav_path
+from app.exporters import format_text_line
 from app.format_time import format_time
-from app.get_best_device import get_best_device
+from app.execution_plan import plan_execution
+from app.job_history import record_job
+from app.media_probe import probe_media
+from app.model_registry import cpu_backend, model_registry
+from app.sharding import shard_count, transcribe_sharded
+from app.tracing import count, span
+from app.vad import detect_speech, pack_speech_windows, split_into_windows, VadReport
 
+AUDIO_EXTENSIONS = ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.m4a']
 
-def transcribe(file_path, model_size='small', progress_callback=None, save_converted=True):
-    try:
-        file_ext = Path(file_path).suffix.lower()
-        temp_file = False
 
-        if file_ext in ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.m4a']:
-            audio_path = file_path
-        else:
-            audio_path = convert_to_wav(file_path)
-            temp_file = True
+# Сколько символов предыдущего текста передаётся в следующее окно как контекст
+PROMPT_CHARS = 200
 
-        if progress_callback:
-            progress_callback(25)
+log = logging.getLogger(__name__)
 
-        print(f'[DEBUG] Whisper будет работать с файлом: {audio_path}')
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError(f'[ERROR] Файл {audio_path} не найден перед обработкой в Whisper!')
 
-        if progress_callback:
-            progress_callback(50)
+class DecodeProgress:
+    """Прогресс по декодированному времени записи: процент, скорость и оставшееся время."""
 
-        device = get_best_device()
-        print(f'Используем устройство: {device}')
+    def __init__(self, total_seconds, callback=None):
+        self.total_seconds = total_seconds
+        self.decoded_seconds = 0.0
+        self.callback = callback
+        self.started_at = time.perf_counter()
+        # Расшифровано в прошлый запуск (контрольная точка) - в скорость не входит
+        self.resumed_seconds = 0.0
 
-        if not WHISPER_MODELS_DIR.exists():
-            raise FileNotFoundError(f'Папка whisper_models не найдена: {WHISPER_MODELS_DIR}')
+    @property
+    def percent(self):
+        if not self.total_seconds:
+            return 100
+        return min(100, int(self.decoded_seconds / self.total_seconds * 100))
 
-        model = whisper.load_model(model_size, device=device, download_root=str(WHISPER_MODELS_DIR))
+    @property
+    def speed(self):
+        """Секунд аудио на секунду работы."""
+        elapsed = time.perf_counter() - self.started_at
+        return (self.decoded_seconds - self.resumed_seconds) / elapsed if elapsed > 0 else 0.0
 
-        if torch.__version__ >= '2.0':
-            try:
-                model = torch.compile(model)
-                print('[DEBUG] PyTorch model compiled successfully!')
-            except Exception as e:
-                print(f'[WARNING] Ошибка при компиляции модели: {e}')
+    @property
+    def eta_seconds(self):
+        speed = self.speed
+        if not speed:
+            return None
+        return max(0.0, self.total_seconds - self.decoded_seconds) / speed
+
+    def resume(self, decoded_seconds):
+        self.resumed_seconds = min(self.total_seconds, decoded_seconds)
+        self.update(decoded_seconds)
+
+    def update(self, decoded_seconds):
+        self.decoded_seconds = min(self.total_seconds, max(self.decoded_seconds, decoded_seconds))
+        if self.callback:
+            self.callback(self.percent)
+
+
+def detect_language(model, audio):
+    """Определяет язык по первым 30 секундам записи."""
+    import whisper
+
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+
+
+def restore_checkpoint(checkpoint, progress=None, segment_callback=None):
+    """Отдаёт сегменты, расшифрованные до контрольной точки, так же, как отдаются новые."""
+    if checkpoint is None or not checkpoint.resumed:
+        return []
+    segments = list(checkpoint.segments)
+    if progress:
+        progress.resume(checkpoint.decoded_seconds)
+    if segment_callback:
+        segment_callback(list(segments), progress)
+    return segments
+
+
+def decode_windows(model, audio, windows, fp16, progress=None, segment_callback=None, batch_size=1,
+                   model_size=None, checkpoint=None, language=None):
+    """Расшифровывает окна и отдаёт сегменты каждого окна сразу после его декодирования.
+
+    batch_size > 1 включает пакетную расшифровку (app.batched_decode); при batch_size=1 окна идут
+    по одному, и текст предыдущего окна передаётся в следующее как контекст.
+    checkpoint (app.job_journal) - окна до контрольной точки пропускаются, их сегменты берутся из журнала.
+    language - уже известный язык записи (иначе определяется по первому окну).
+    """
+    if checkpoint is not None and checkpoint.language:
+        language = checkpoint.language
+
+    if batch_size > 1 and (not isinstance(windows, list) or len(windows) > 1):
+        from app.batched_decode import decode_windows_batched
+
+        # Окна могут идти генератором (потоковый режим): первое нужно для определения языка
+        windows = iter(windows)
+        first = next(windows, None)
+        if first is None:
+            return restore_checkpoint(checkpoint, progress, segment_callback)
+        windows = itertools.chain([first], windows)
+
+        if language is None:
+            with span('language_detection'):
+                language = detect_language(model, first.extract(audio))
+        log.debug('Язык записи: %s, окон в пакете: %s', language, batch_size)
+        return decode_windows_batched(model, audio, windows, fp16, language, batch_size, model_size, progress,
+                                      segment_callback, checkpoint)
+
+    segments = restore_checkpoint(checkpoint, progress, segment_callback)
+    first_window = checkpoint.next_window if checkpoint is not None else 0
+    prompt = checkpoint.prompt if checkpoint is not None else None
+
+    for index, window in enumerate(windows):
+        if index < first_window:
+            continue
+        window_audio = window.extract(audio)
+        # Язык определяем один раз: иначе Whisper заново определяет его в каждом окне
+        if language is None:
+            with span('language_detection'):
+                language = detect_language(model, window_audio)
+            log.debug('Язык записи: %s', language)
+
+        with span('decode_window', index=index):
+            result = model.transcribe(window_audio, fp16=fp16, initial_prompt=prompt, language=language)
+
+        window_segments = [{
+            'start': window.to_source_time(seg['start']),
+            'end': window.to_source_time(seg['end'], is_end=True),
+            'text': seg['text'],
+        } for seg in result.get('segments', [])]
+        # Окна без паузы на стыке перекрываются: из каждого берём только его зону
+        window_segments = merge_window_segments(segments, window_segments, window.core_start, window.core_end)
+        segments.extend(window_segments)
+        count('windows')
+        count('segments', len(window_segments))
+
+        window_text = result.get('text', '').strip()
+        if window_text:
+            prompt = window_text[-PROMPT_CHARS:]
+
+        if progress:
+            progress.update(window.source_end)
+        if segment_callback:
+            segment_callback(window_segments, progress)
+        if checkpoint is not None:
+            checkpoint.record(index + 1, window_segments, window.source_end, prompt, language)
+
+    return segments
 
-        if progress_callback:
-            progress_callback(75)
 
-        result = model.transcribe(audio_path, fp16=(device != 'cpu'))
+def transcribe_speech_only(model, audio, fp16, report_callback=None, progress=None, segment_callback=None,
+                           batch_size=1, model_size=None, checkpoint=None, language=None):
+    """Расшифровывает только участки речи, найденные VAD, и возвращает сегменты на исходной шкале времени."""
+    with span('vad'):
+        spans = detect_speech(audio)
+        windows = pack_speech_windows(spans)
 
-        segments = result.get('segments', [])
+    report = VadReport(len(audio), spans, len(windows))
+    log.debug('%s', report)
+    if report_callback:
+        report_callback(str(report))
 
-        dialogue_text = ''
-        previous_end = 0
+    segments = decode_windows(model, audio, windows, fp16, progress, segment_callback, batch_size, model_size,
+                              checkpoint, language)
 
+    # Хвост записи без речи тоже считается обработанным
+    if progress:
+        progress.update(progress.total_seconds)
+    return segments
+
+
+def prepare_audio(file_path, save_converted=True):
+    """Декодирует файл в память и при необходимости сохраняет конвертированный WAV."""
+    file_ext = Path(file_path).suffix.lower()
+
+    # Файл уже в нужном формате - читаем его напрямую, иначе декодируем один раз прямо в память
+    if probe_media(file_path).is_whisper_pcm:
+        audio = read_pcm_wav(file_path)
+    else:
+        audio = decode_audio(file_path)
+    log.debug('Whisper будет работать с файлом: %s (%.1f с)', file_path, len(audio) / SAMPLE_RATE)
+
+    if save_converted and file_ext not in AUDIO_EXTENSIONS:
+        save_wav(audio, converted_wav_path(file_path))
+
+    return audio
+
+
+def transcribe_audio(audio, model_size='small', progress_callback=None, use_vad=False, report_callback=None,
+                     model_slot=0, shards=1, segment_callback=None, checkpoint=None):
+    """Расшифровывает уже декодированный буфер резидентной моделью и возвращает список сегментов.
+
+    progress_callback получает процент декодированного времени записи, segment_callback -
+    сегменты очередного окна и объект DecodeProgress (скорость, оставшееся время).
+    shards > 1 (или None - автоматически) включает параллельную обработку кусков записи на CPU.
+    checkpoint (app.job_journal) - продолжить с контрольной точки и сохранять новые; куски записи
+    расшифровываются в отдельных процессах, поэтому при делении на куски контрольные точки не ведутся.
+    """
+    # План выбирает устройство, точность и потоки; модель, которая заведомо не поместится, не загружаем
+    plan = plan_execution(model_size)
+    plan.check()
+    device = plan.device
+    log.info('Используем устройство: %s (%s, потоков: %s)', device, plan.precision, plan.threads)
+
+    duration = len(audio) / SAMPLE_RATE
+    # Сколько кусков получится на самом деле: под этим числом задача попадёт в историю скорости
+    shards = shard_count(duration, shards)
+    progress = DecodeProgress(duration, progress_callback)
+
+    if shards > 1 and device == 'cpu':
+        started = time.perf_counter()
+        with span('sharded_decode', shards=shards):
+            segments = transcribe_sharded(audio, model_size, shards, use_vad, progress, segment_callback)
+        count('audio_seconds', duration)
+        # Модели в воркерах грузятся внутри пула, поэтому загрузка входит во время расшифровки
+        record_job(model_size, device, duration, 0.0, time.perf_counter() - started, use_vad=use_vad,
+                   shards=shards, backend=cpu_backend(), batch_size=1)
+        return segments
+
+    from app.compile_manager import compile_manager
+
+    plan.apply()
+    precision = plan.precision
+    load_started = time.perf_counter()
+    model = model_registry.get(model_size, device, precision, model_slot)
+    compile_manager.prepare(model, model_size, device, duration)
+
+    if checkpoint is not None:
+        # Пакет окон влияет на результат (без контекста между окнами), поэтому он тоже сверяется с журналом
+        checkpoint.begin(device=device, precision=precision, batch_size=plan.batch_size, use_vad=use_vad)
+        if checkpoint.resumed and report_callback:
+            report_callback(f'Продолжение с контрольной точки: {format_time(checkpoint.decoded_seconds)}')
+
+    # Скорость считаем с момента, когда модель готова
+    progress.started_at = time.perf_counter()
+
+    if use_vad:
+        segments = transcribe_speech_only(model, audio, precision == 'fp16', report_callback, progress,
+                                          segment_callback, plan.batch_size, model_size, checkpoint)
+    else:
+        segments = decode_windows(model, audio, split_into_windows(audio), precision == 'fp16', progress,
+                                  segment_callback, plan.batch_size, model_size, checkpoint)
+    count('audio_seconds', duration)
+
+    # В историю скорости идёт только то, что расшифровано в этот запуск
+    record_job(model_size, device, duration - progress.resumed_seconds, progress.started_at - load_started,
+               time.perf_counter() - progress.started_at, use_vad=use_vad, shards=1, batch_size=plan.batch_size,
+               backend=cpu_backend() if device == 'cpu' else 'torch', compiled=compile_manager.is_compiled(model))
+    return segments
+
+
+def format_segments(segments, previous_end=0):
+    """Собирает текст диалога из сегментов, разделяя абзацы по паузам (формат как у TextExporter)."""
+    lines = []
+
+    with span('format_segments'):
         for seg in segments:
-            start, end, text = seg['start'], seg['end'], seg['text']
-            if start - previous_end > 1.2:
-                dialogue_text += '\n'
-            dialogue_text += f'{format_time(start)} - {format_time(end)} {text}\n'
-            previous_end = end
+            lines.append(format_text_line(seg, previous_end))
+            previous_end = seg['end']
+
+    return ''.join(lines)
+
+
+def transcribe(file_path, model_size='small', progress_callback=None, save_converted=True, use_vad=False,
+               report_callback=None, segment_callback=None):
+    try:
+        audio = prepare_audio(file_path, save_converted)
+
+        segments = transcribe_audio(audio, model_size, progress_callback, use_vad, report_callback,
+                                    segment_callback=segment_callback)
+        dialogue_text = format_segments(segments)
 
         if progress_callback:
             progress_callback(100)
 
-        if temp_file and not save_converted:
-            os.remove(audio_path)
-
         return dialogue_text
     except Exception as e:
         if progress_callback:
             progress_callback(0)
-        print(f'Error transcribe => {e}')
+        log.exception('Error transcribe => %s', e)
         return 'Ошибка при обработке файла'
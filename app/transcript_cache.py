@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from app import CACHE_DIR
+from app.time_estimator import get_audio_duration
+from app.tracing import count
+
+# Версия формата записей: при изменении старые записи просто перестают находиться
+CACHE_VERSION = 1
+# Размер блоков (байт), по которым считается быстрый хэш файла: начало, середина и конец
+FINGERPRINT_BLOCK = 1024 * 1024
+# Бюджет кэша на диске (МБ), можно переопределить через переменную окружения
+DEFAULT_CACHE_BUDGET_MB = int(os.environ.get('VOICE_DECODER_CACHE_BUDGET_MB', 500))
+
+
+def file_fingerprint(file_path):
+    """Быстрый отпечаток содержимого файла: хэш трёх блоков + размер + длительность.
+
+    Не зависит от имени и пути, поэтому копии одной записи дают одинаковый отпечаток.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(size).encode())
+
+    with open(file_path, 'rb') as file:
+        for offset in (0, max(0, size // 2 - FINGERPRINT_BLOCK // 2), max(0, size - FINGERPRINT_BLOCK)):
+            file.seek(offset)
+            digest.update(file.read(FINGERPRINT_BLOCK))
+
+    duration = get_audio_duration(str(file_path))
+    return f'{digest.hexdigest()}-{size}-{duration or 0:.2f}'
+
+
+class TranscriptCache:
+    """Кэш расшифровок на диске с вытеснением давно не использованных записей (LRU) по размеру."""
+
+    def __init__(self, cache_dir, budget_mb=DEFAULT_CACHE_BUDGET_MB):
+        self.cache_dir = Path(cache_dir)
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, file_path, model_size, **options):
+        """Ключ записи: отпечаток файла, модель и параметры, влияющие на результат."""
+        payload = json.dumps({
+            'version': CACHE_VERSION,
+            'fingerprint': file_fingerprint(file_path),
+            'model': model_size,
+            'options': options,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Возвращает сегменты из кэша или None."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, encoding='utf-8') as file:
+                    entry = json.load(file)
+                # Время последнего обращения храним в mtime - по нему вытесняются старые записи
+                os.utime(path)
+            except (OSError, ValueError):
+                self.misses += 1
+                count('cache_misses')
+                return None
+
+            self.hits += 1
+            count('cache_hits')
+            return entry['segments']
+
+    def put(self, key, segments, **meta):
+        entry = {'segments': [{'start': seg['start'], 'end': seg['end'], 'text': seg['text']} for seg in segments],
+                 'created': time.time(), **meta}
+
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._path(key).with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(entry, file, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+
+    def invalidate(self, key):
+        with self._lock:
+            try:
+                self._path(key).unlink()
+                return True
+            except FileNotFoundError:
+                return False
+
+    def clear(self):
+        with self._lock:
+            for path in self._entries():
+                path.unlink(missing_ok=True)
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {
+                'entries': len(entries),
+                'size_mb': round(sum(path.stat().st_size for path in entries) / 1024 / 1024, 2),
+                'budget_mb': round(self.budget_bytes / 1024 / 1024, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _path(self, key):
+        return self.cache_dir / f'{key}.json'
+
+    def _entries(self):
+        if not self.cache_dir.exists():
+            return []
+        return list(self.cache_dir.glob('*.json'))
+
+    def _evict(self):
+        entries = [(path, path.stat()) for path in self._entries()]
+        total = sum(stat.st_size for _, stat in entries)
+
+        for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if total <= self.budget_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+
+transcript_cache = TranscriptCache(CACHE_DIR / 'transcripts')
@@ -1,30 +1,46 @@
-from PyQt6.QtCore import QThread, pyqtSignal, Qt, QTimer
+import logging
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal, Qt, QTimer
 from PyQt6.QtGui import QAction, QIcon
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QFileDialog, QTextEdit, QLabel, QSlider, QHBoxLayout, \
-    QMenuBar, QMenu, QLineEdit, QProgressBar, QMessageBox, QCheckBox
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QSlider, QHBoxLayout, \
+    QMenuBar, QMenu, QProgressBar, QMessageBox, QCheckBox, QListWidget, QListWidgetItem, QApplication, QInputDialog
 
 from . import APP_VERSION, ICON_PATH
-from .get_best_device import get_best_device
-from .time_estimator import estimate_transcription_time
-from .transcribe import transcribe
+from .exporters import DEFAULT_FORMATS, EXPORTERS, export_path, export_segments
+from .format_time import format_time
+from .execution_plan import plan_execution
+from .job_queue import JobQueue, STATUS_TITLES, TRANSCRIBING, DONE, ERROR
+from .live import DEFAULT_LATENCY_SECONDS, LiveTranscriber, parse_source
+from .model_registry import cpu_backend, model_registry, set_cpu_backend
+from .segment_view import SegmentView
+from .sharding import default_shard_count
+from .startup import EngineLoader, startup_timer
+from .time_estimator import estimate_transcription_time, format_time as format_duration
+from .transcript_cache import transcript_cache
 
+log = logging.getLogger(__name__)
 
-class TranscriptionThread(QThread):
-    progress = pyqtSignal(int)
-    result = pyqtSignal(str)
 
-    def __init__(self, file_path, model_name, save_converted):
-        super().__init__()
-        self.file_path = file_path
-        self.model_name = model_name
-        self.save_converted = save_converted
+class JobQueueSignals(QObject):
+    """Переносит события очереди из рабочих потоков в поток интерфейса."""
+    job_updated = pyqtSignal(object)
+    progress = pyqtSignal(object, int)
+    report = pyqtSignal(object, str)
+    segments = pyqtSignal(object, object, object)
+
+
+class EngineSignals(QObject):
+    """Сообщает интерфейсу, что фоновая загрузка движка закончилась."""
+    ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
 
-    def run(self):
-        try:
-            text = transcribe(self.file_path, self.model_name, self.progress.emit, self.save_converted)
-            self.result.emit(text)
-        except Exception as e:
-            print(f'Error run => {e}')
+
+class LiveSignals(QObject):
+    """Переносит сегменты живой расшифровки из её потока в интерфейс."""
+    segments = pyqtSignal(object, bool)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
 
 
 class WhisperApp(QWidget):
@@ -35,7 +51,7 @@ class WhisperApp(QWidget):
     def initUI(self):
         self.setWindowTitle(f'Whisper Расшифровка {APP_VERSION}')
         self.setWindowIcon(QIcon(str(ICON_PATH)))
-        self.setMinimumSize(600, 500)
+        self.setMinimumSize(600, 650)
 
         main_layout = QVBoxLayout()
 
@@ -52,6 +68,25 @@ class WhisperApp(QWidget):
         self.time_estimate_action.triggered.connect(self.check_estimate)
         file_menu.addAction(self.time_estimate_action)
 
+        self.live_action = QAction('Живая расшифровка...', self)
+        self.live_action.triggered.connect(self.toggle_live)
+        file_menu.addAction(self.live_action)
+
+        self.clear_cache_action = QAction('Очистить кэш расшифровок', self)
+        self.clear_cache_action.triggered.connect(self.clear_cache)
+        file_menu.addAction(self.clear_cache_action)
+
+        # Форматы, в которых расшифровка сохраняется рядом с файлом (за один проход)
+        formats_menu = QMenu('Сохранять расшифровку как', self)
+        self.format_actions = {}
+        for fmt in EXPORTERS:
+            action = QAction(fmt.upper(), self)
+            action.setCheckable(True)
+            action.setChecked(fmt in DEFAULT_FORMATS)
+            formats_menu.addAction(action)
+            self.format_actions[fmt] = action
+        file_menu.addMenu(formats_menu)
+
         exit_action = QAction('Выход', self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
@@ -64,22 +99,66 @@ class WhisperApp(QWidget):
         self.menu_bar.addMenu(about_menu)
         main_layout.addWidget(self.menu_bar)
 
-        # Панель выбора файла
+        # Панель выбора файлов
         file_layout = QHBoxLayout()
-        self.btn_select = QPushButton('Выбрать файл')
+        self.btn_select = QPushButton('Добавить файлы')
         self.btn_select.clicked.connect(self.select_file)
-        self.file_path_display = QLineEdit()
-        self.file_path_display.setReadOnly(True)
+        self.btn_select_folder = QPushButton('Добавить папку')
+        self.btn_select_folder.clicked.connect(self.select_folder)
 
         self.save_checkbox = QCheckBox('Сохранить конвертированный файл')
         self.save_checkbox.setChecked(False)
         self.save_checkbox.setStyleSheet("QCheckBox { text-align: right; }")
 
         file_layout.addWidget(self.btn_select)
-        file_layout.addWidget(self.file_path_display)
+        file_layout.addWidget(self.btn_select_folder)
+        file_layout.addStretch()
         file_layout.addWidget(self.save_checkbox)
         main_layout.addLayout(file_layout)
 
+        # Очередь файлов
+        self.job_list = QListWidget()
+        self.job_list.currentItemChanged.connect(self.show_selected_job)
+        main_layout.addWidget(self.job_list)
+
+        queue_layout = QHBoxLayout()
+        self.btn_job_up = QPushButton('Вверх')
+        self.btn_job_up.clicked.connect(lambda: self.move_selected_job(-1))
+        self.btn_job_down = QPushButton('Вниз')
+        self.btn_job_down.clicked.connect(lambda: self.move_selected_job(1))
+        self.btn_job_cancel = QPushButton('Отменить')
+        self.btn_job_cancel.clicked.connect(self.cancel_selected_job)
+        self.btn_clear_finished = QPushButton('Убрать завершённые')
+        self.btn_clear_finished.clicked.connect(self.clear_finished_jobs)
+
+        queue_layout.addWidget(self.btn_job_up)
+        queue_layout.addWidget(self.btn_job_down)
+        queue_layout.addWidget(self.btn_job_cancel)
+        queue_layout.addStretch()
+        queue_layout.addWidget(self.btn_clear_finished)
+        main_layout.addLayout(queue_layout)
+
+        options_layout = QHBoxLayout()
+        self.vad_checkbox = QCheckBox('Пропускать тишину (VAD)')
+        self.vad_checkbox.setChecked(False)
+        self.shards_checkbox = QCheckBox('Делить длинные записи между ядрами CPU')
+        self.shards_checkbox.setChecked(False)
+        self.cache_checkbox = QCheckBox('Брать готовую расшифровку из кэша')
+        self.cache_checkbox.setChecked(True)
+        # ONNX Runtime ускоряет расшифровку на CPU; int8 включается через VOICE_DECODER_CPU_BACKEND=onnx-int8
+        self.onnx_backend = cpu_backend() if cpu_backend() != 'torch' else 'onnx'
+        self.onnx_checkbox = QCheckBox('ONNX Runtime на CPU')
+        self.onnx_checkbox.setChecked(cpu_backend() != 'torch')
+        self.onnx_checkbox.stateChanged.connect(self.select_backend)
+        options_layout.addWidget(self.vad_checkbox)
+        options_layout.addStretch()
+        options_layout.addWidget(self.shards_checkbox)
+        options_layout.addStretch()
+        options_layout.addWidget(self.cache_checkbox)
+        options_layout.addStretch()
+        options_layout.addWidget(self.onnx_checkbox)
+        main_layout.addLayout(options_layout)
+
         # Верхние метки (Быстро - Качественно)
         speed_layout = QHBoxLayout()
         self.fast_label = QLabel('Быстро')
@@ -96,6 +175,7 @@ class WhisperApp(QWidget):
         self.slider_model = QSlider(Qt.Orientation.Horizontal)
         self.slider_model.setMinimum(0)
         self.slider_model.setMaximum(2)
+        self.slider_model.valueChanged.connect(self.preload_model)
         main_layout.addWidget(self.slider_model)
 
         # Подписи для ползунка
@@ -116,10 +196,14 @@ class WhisperApp(QWidget):
         self.btn_transcribe.clicked.connect(self.transcribe_file)
         main_layout.addWidget(self.btn_transcribe)
 
-        # Поле вывода текста
-        self.text_output = QTextEdit()
-        self.text_output.setReadOnly(True)
-        main_layout.addWidget(self.text_output)
+        # Состояние движка: torch и whisper грузятся в фоне, окно доступно сразу
+        self.engine_label = QLabel('Загрузка движка...')
+        main_layout.addWidget(self.engine_label)
+
+        # Расшифровка: список сегментов с поиском (строки рисуются по мере прокрутки)
+        self.transcript_view = SegmentView()
+        self.transcript_view.timestamp_selected.connect(self.show_timestamp)
+        main_layout.addWidget(self.transcript_view)
 
         # Прогресс-бар с плавным обновлением
         self.progress_bar = QProgressBar()
@@ -144,80 +228,384 @@ class WhisperApp(QWidget):
         ''')
         main_layout.addWidget(self.progress_bar)
 
-        # Кнопка "Сохранить в Word" (неактивная)
+        # Один таймер на всё время работы: плавно догоняет целевое значение прогресса
+        self.progress_target = 0
+        self.progress_status = ''
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.smooth_progress)
+
+        # Строка со сводкой по обработке (например, сколько тишины пропущено)
+        self.report_label = QLabel('')
+        main_layout.addWidget(self.report_label)
+
+        # Кнопка "Сохранить в Word": доступна, когда выбрана готовая расшифровка
         self.save_word_button = QPushButton('Сохранить в Word')
         self.save_word_button.setEnabled(False)
+        self.save_word_button.clicked.connect(self.save_word)
         main_layout.addWidget(self.save_word_button)
 
         self.setLayout(main_layout)
-        self.file_path = ''
         self.model_names = ['small', 'medium', 'large-v3']
 
+        # Очередь задач: события приходят из рабочих потоков и передаются в интерфейс через сигналы
+        self.queue_signals = JobQueueSignals()
+        self.queue_signals.job_updated.connect(self.on_job_updated)
+        self.queue_signals.progress.connect(self.on_job_progress)
+        self.queue_signals.report.connect(self.on_job_report)
+        self.queue_signals.segments.connect(self.on_job_segments)
+        self.job_queue = JobQueue(on_update=self.queue_signals.job_updated.emit,
+                                  on_progress=self.queue_signals.progress.emit,
+                                  on_report=self.queue_signals.report.emit,
+                                  on_segments=self.queue_signals.segments.emit)
+        self.job_items = {}  # job.id -> QListWidgetItem
+
+        # Задача, сегменты которой сейчас дописываются в список по мере расшифровки
+        self.displayed_job_id = None
+
+        # Живая расшифровка потока (микрофон, трансляция): сегменты идут в тот же список
+        self.live = None
+        self.live_signals = LiveSignals()
+        self.live_signals.segments.connect(self.on_live_segments)
+        self.live_signals.finished.connect(self.on_live_finished)
+        self.live_signals.failed.connect(self.on_live_failed)
+
+        # Пока движок не готов, действия, которым нужны torch и whisper, недоступны
+        self.engine_actions = (self.btn_transcribe, self.check_hardware_action, self.time_estimate_action,
+                               self.live_action)
+        for action in self.engine_actions:
+            action.setEnabled(False)
+
+        self.engine_signals = EngineSignals()
+        self.engine_signals.ready.connect(self.on_engine_ready)
+        self.engine_signals.failed.connect(self.on_engine_failed)
+        self.engine = EngineLoader(on_ready=self.engine_signals.ready.emit,
+                                   on_error=self.engine_signals.failed.emit)
+        self.engine.start()
+
+    def on_engine_ready(self, device):
+        for action in self.engine_actions:
+            action.setEnabled(True)
+        self.engine_label.setText(f'Движок готов: {device} ({startup_timer.marks["engine_ready"]:.1f} с)')
+        self.preload_model()
+
+    def on_engine_failed(self, error):
+        self.engine_label.setText(f'Ошибка загрузки движка: {error}')
+        QMessageBox.critical(self, 'Ошибка', f'Не удалось загрузить движок расшифровки:\n{error}')
+
+    def preload_model(self):
+        """Заранее загружает выбранную на ползунке модель, пока пользователь выбирает файл."""
+        if not self.engine.ready:
+            # Модель выбранного размера загрузится, когда движок будет готов
+            return
+        model_name = self.model_names[self.slider_model.value()]
+        plan = plan_execution(model_name)
+        if plan.fits:
+            model_registry.preload(model_name, plan.device, plan.precision)
+
+    def select_backend(self):
+        """Переключает бэкенд CPU для следующих задач и заранее готовит модель."""
+        set_cpu_backend(self.onnx_backend if self.onnx_checkbox.isChecked() else 'torch')
+        self.preload_model()
+
+    def job_options(self):
+        """Текущие настройки интерфейса для новых задач."""
+        return {
+            'model_size': self.model_names[self.slider_model.value()],
+            'save_converted': self.save_checkbox.isChecked(),
+            'use_vad': self.vad_checkbox.isChecked(),
+            'shards': default_shard_count() if self.shards_checkbox.isChecked() else 1,
+            'use_cache': self.cache_checkbox.isChecked(),
+            'formats': tuple(fmt for fmt, action in self.format_actions.items() if action.isChecked()),
+        }
+
     def select_file(self):
-        filters = 'Video Files (*.mp4 *.mkv *.avi *.mov *.wmv *.flv *.webm);;' \
+        filters = 'Media Files (*.mp4 *.mkv *.avi *.mov *.wmv *.flv *.webm ' \
+                  '*.mp3 *.wav *.flac *.aac *.ogg *.m4a *.wma *.aiff *.aif);;' \
+                  'Video Files (*.mp4 *.mkv *.avi *.mov *.wmv *.flv *.webm);;' \
                   'Audio Files (*.mp3 *.wav *.flac *.aac *.ogg *.m4a *.wma *.aiff *.aif)'
 
-        file_path, _ = QFileDialog.getOpenFileName(self, 'Выбрать файл', '', filters)
+        file_paths, _ = QFileDialog.getOpenFileNames(self, 'Выбрать файлы', '', filters)
+
+        for file_path in file_paths:
+            self.job_queue.add(file_path, **self.job_options())
+
+    def select_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, 'Выбрать папку')
+
+        if folder:
+            jobs = self.job_queue.add_folder(folder, **self.job_options())
+            if not jobs:
+                QMessageBox.warning(self, 'Ошибка', 'В папке нет аудио- или видеофайлов!')
+
+    def selected_job(self):
+        item = self.job_list.currentItem()
+        if item is None:
+            return None
+        return self.job_queue.get(item.data(Qt.ItemDataRole.UserRole))
+
+    def move_selected_job(self, offset):
+        job = self.selected_job()
+        if job and self.job_queue.move(job.id, offset):
+            self.refresh_job_list()
+
+    def cancel_selected_job(self):
+        job = self.selected_job()
+        if job:
+            self.job_queue.cancel(job.id)
+
+    def clear_finished_jobs(self):
+        self.job_queue.remove_finished()
+        self.refresh_job_list()
+
+    def refresh_job_list(self):
+        """Перестраивает список в порядке очереди, сохраняя выделение."""
+        selected = self.selected_job()
+        self.job_list.clear()
+        self.job_items = {}
+
+        for job in self.job_queue.jobs:
+            item = QListWidgetItem()
+            item.setData(Qt.ItemDataRole.UserRole, job.id)
+            self.job_items[job.id] = item
+            self.job_list.addItem(item)
+            self.update_job_item(job)
+            if selected and job.id == selected.id:
+                self.job_list.setCurrentItem(item)
+
+    def update_job_item(self, job):
+        item = self.job_items.get(job.id)
+        if item is None:
+            return
 
-        if file_path:
-            self.file_path = file_path
-            self.file_path_display.setText(file_path)
+        text = f'{STATUS_TITLES[job.status]} — {job.name}'
+        if job.status == TRANSCRIBING and job.progress:
+            text += f' ({job.progress}%)'
+        item.setText(text)
+        # Разбивка времени по этапам - во всплывающей подсказке
+        item.setToolTip(job.trace.summary())
+
+    @staticmethod
+    def job_report_text(job):
+        """Сводка по задаче: отчёт VAD и, для завершённой задачи, время этапов."""
+        lines = [job.report] if job.report else []
+        if job.finished and job.trace.stages:
+            lines.append(f'Время этапов: {job.trace.summary()}')
+        return '\n'.join(lines)
 
     def check_hardware(self):
-        device = get_best_device()
-        QMessageBox.information(self, 'Определение железа', f'Для работы программы будет использоваться {device}')
+        plan = plan_execution(self.model_names[self.slider_model.value()])
+        QMessageBox.information(self, 'Определение железа', plan.report())
+
+    def clear_cache(self):
+        stats = transcript_cache.stats()
+        answer = QMessageBox.question(self, 'Кэш расшифровок',
+                                      f'Записей в кэше: {stats["entries"]} ({stats["size_mb"]} МБ)\n'
+                                      f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}\n\n'
+                                      f'Очистить кэш?')
+        if answer == QMessageBox.StandardButton.Yes:
+            transcript_cache.clear()
 
     def check_estimate(self):
         """Оценивает примерное время обработки файла."""
-        if not self.file_path:
-            QMessageBox.warning(self, 'Ошибка', 'Выберите файл перед расчетом времени!')
+        job = self.selected_job()
+        if job is None:
+            QMessageBox.warning(self, 'Ошибка', 'Выберите файл в очереди перед расчетом времени!')
             return
 
         model_name = self.model_names[self.slider_model.value()]  # Выбранная модель
-        msg_estimate = estimate_transcription_time(self.file_path, model_name)
+        options = self.job_options()
+        msg_estimate = estimate_transcription_time(job.file_path, model_name, options['shards'],
+                                                   options['use_vad'])
         QMessageBox.information(self, 'Время обработки файла', msg_estimate)
 
     def transcribe_file(self):
         try:
-            if not self.file_path:
-                QMessageBox.warning(self, 'Ошибка', 'Выберите файл для расшифровки!')
+            if not self.job_queue.pending_count():
+                QMessageBox.warning(self, 'Ошибка', 'Добавьте файлы для расшифровки!')
                 return
 
-            self.progress_bar.setValue(0)
-            self.text_output.setText('')
+            # Задачи, которые ещё не начались, получают текущие настройки
+            self.job_queue.update_queued(self.job_options())
+
+            self.job_queue.start()
+        except Exception as e:
+            log.exception('Error transcribe_file => %s', e)
+
+    def on_job_updated(self, job):
+        if job.id not in self.job_items:
+            self.refresh_job_list()
+        self.update_job_item(job)
+
+        selected = self.selected_job()
+
+        if job.status == TRANSCRIBING:
+            # Новый файл пошёл в модель - прогресс считаем заново
+            self.reset_progress('Подготовка модели...')
+            if self.live is None and (selected is None or selected.id == job.id):
+                self.start_live_output(job)
+        elif job.status == ERROR:
+            self.update_progress(0)
+
+        if job.status in (DONE, ERROR):
+            self.update_save_word_button()
+            if selected is None or selected.id == job.id:
+                self.report_label.setText(self.job_report_text(job))
+            if job.status == ERROR or job.id != self.displayed_job_id:
+                if selected is None or selected.id == job.id:
+                    self.display_result(job)
+            if job.id == self.displayed_job_id:
+                self.displayed_job_id = None
+
+        pending = self.job_queue.pending_count()
+        self.btn_transcribe.setText(f'Расшифровать (в работе: {pending})' if pending and self.job_queue.running
+                                    else 'Расшифровать')
+
+    def on_job_progress(self, job, value):
+        self.update_job_item(job)
+        if value == 100:
+            self.update_progress(100)
+
+    def on_job_segments(self, job, segments, progress):
+        """Дописывает новые сегменты в список и обновляет прогресс, скорость и оставшееся время."""
+        if job.id == self.displayed_job_id and segments:
+            self.transcript_view.append_segments(segments)
+
+        if progress is None:
+            return
+
+        status = f'Обработка файла... %p% · x{progress.speed:.1f}'
+        if progress.eta_seconds is not None:
+            status += f' · осталось {format_duration(progress.eta_seconds)}'
+        self.update_progress(progress.percent, status)
+
+    def start_live_output(self, job):
+        self.displayed_job_id = job.id
+        self.transcript_view.clear()
+
+    def show_timestamp(self, seconds):
+        """Щелчок по сегменту: показывает время его начала и копирует его в буфер обмена
+        (чтобы перейти к этому месту в проигрывателе)."""
+        timestamp = format_time(seconds)
+        QApplication.clipboard().setText(timestamp)
+        self.report_label.setText(f'Позиция в записи: {timestamp} (скопировано в буфер обмена)')
+
+    def toggle_live(self):
+        """Запускает живую расшифровку потока или останавливает уже идущую."""
+        if self.live is not None:
+            self.live.stop()
+            self.live_action.setEnabled(False)
+            self.report_label.setText('Остановка живой расшифровки...')
+            return
 
-            self.btn_select.setEnabled(False)
-            self.slider_model.setEnabled(False)
-            self.save_checkbox.setEnabled(False)
-            self.btn_transcribe.setEnabled(False)
+        source, ok = QInputDialog.getText(self, 'Живая расшифровка',
+                                          'Источник: URL трансляции, файл или устройство записи\n'
+                                          '(например, dshow:audio=Микрофон или pulse:default)')
+        if not ok or not source.strip():
+            return
 
-            model_name = self.model_names[self.slider_model.value()]
-            save_converted = self.save_checkbox.isChecked()  # Получаем состояние галки
+        input_format, source = parse_source(source)
+        self.live = LiveTranscriber(source, self.model_names[self.slider_model.value()], DEFAULT_LATENCY_SECONDS,
+                                    input_format, on_segments=self.live_signals.segments.emit)
+        self.displayed_job_id = None
+        self.transcript_view.clear()
+        self.live_action.setText('Остановить живую расшифровку')
+        self.report_label.setText('Живая расшифровка: подготовка модели...')
+        threading.Thread(target=self._run_live, args=(self.live,), name='live', daemon=True).start()
 
-            # Передаём save_converted в поток обработки
-            self.transcription_thread = TranscriptionThread(self.file_path, model_name, save_converted)
-            self.transcription_thread.progress.connect(self.update_progress)
-            self.transcription_thread.result.connect(self.display_result)
-            self.transcription_thread.start()
+    def _run_live(self, transcriber):
+        try:
+            self.live_signals.finished.emit(transcriber.run())
         except Exception as e:
-            print(f'Error transcribe_file => {e}')
+            log.exception('Error live => %s', e)
+            self.live_signals.failed.emit(str(e))
+
+    def on_live_segments(self, segments, final):
+        """Окончательные сегменты дописываются в список, предварительные показываются строкой под ним."""
+        if final:
+            self.transcript_view.append_segments(segments)
+        else:
+            text = ' '.join(seg['text'].strip() for seg in segments)
+            self.report_label.setText(f'… {text}' if text else 'Живая расшифровка: ожидание речи')
+
+    def on_live_finished(self, stats):
+        self.live = None
+        self.live_action.setText('Живая расшифровка...')
+        self.live_action.setEnabled(True)
+        self.report_label.setText(f'Живая расшифровка завершена\n{stats.report()}')
+
+    def on_live_failed(self, error):
+        self.live = None
+        self.live_action.setText('Живая расшифровка...')
+        self.live_action.setEnabled(True)
+        self.report_label.setText('')
+        QMessageBox.warning(self, 'Ошибка', f'Живая расшифровка остановлена:\n{error}')
+
+    def on_job_report(self, job, report):
+        self.report_label.setText(f'{job.name}: {report}')
+
+    def update_save_word_button(self):
+        job = self.selected_job()
+        self.save_word_button.setEnabled(job is not None and job.status == DONE and bool(job.segments))
+
+    def save_word(self):
+        """Сохраняет расшифровку выбранного файла в документ Word."""
+        job = self.selected_job()
+        if job is None or job.status != DONE:
+            QMessageBox.warning(self, 'Ошибка', 'Выберите готовую расшифровку в очереди!')
+            return
+
+        path, _ = QFileDialog.getSaveFileName(self, 'Сохранить в Word', str(export_path(job.file_path, 'docx')),
+                                              'Документ Word (*.docx)')
+        if not path:
+            return
+        try:
+            export_segments(job.segments, path, 'docx')
+        except OSError as e:
+            log.exception('Error save_word => %s', e)
+            QMessageBox.warning(self, 'Ошибка', f'Не удалось сохранить файл:\n{e}')
+            return
+        QMessageBox.information(self, 'Сохранить в Word', f'Расшифровка сохранена: {path}')
 
-    def update_progress(self, target_value):
+    def show_selected_job(self, *args):
+        job = self.selected_job()
+        self.update_save_word_button()
+        if job is None:
+            return
+        if job.status in (DONE, ERROR):
+            self.displayed_job_id = None
+            self.display_result(job)
+        elif job.status == TRANSCRIBING:
+            self.start_live_output(job)
+            self.transcript_view.set_segments(job.segments)
+        else:
+            self.displayed_job_id = None
+            self.transcript_view.clear()
+        self.report_label.setText(self.job_report_text(job))
+
+    def reset_progress(self, status):
+        """Начинает отсчёт прогресса для нового файла."""
+        self.progress_timer.stop()
+        self.progress_target = 0
+        self.progress_status = status
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat(status)
+
+    def update_progress(self, target_value, status=None):
         """Плавное обновление прогресса."""
-        if target_value == 0:
-            if hasattr(self, 'progress_timer'):
-                self.progress_timer.stop()  # Останавливаем таймер, если он работает
+        if target_value == 0 and status is None:
+            self.progress_timer.stop()  # Останавливаем таймер, если он работает
             self.progress_bar.setValue(0)
             self.progress_bar.setFormat('Ошибка в работе программы!')
             self.progress_target = 0  # Сбрасываем целевое значение
-        else:
-            current_value = self.progress_bar.value()
-            if current_value < target_value:
-                self.progress_target = target_value
-                self.progress_step = 1
-                self.progress_timer = QTimer(self)
-                self.progress_timer.timeout.connect(self.smooth_progress)
-                self.progress_timer.start(22)
+            return
+
+        if status:
+            self.progress_status = status
+            self.progress_bar.setFormat(status)
+
+        self.progress_target = max(self.progress_target, target_value)
+        if not self.progress_timer.isActive():
+            self.progress_timer.start(22)
 
     def smooth_progress(self):
         """Плавное заполнение прогресс-бара."""
@@ -225,38 +613,28 @@ class WhisperApp(QWidget):
             current_value = self.progress_bar.value()
 
             if current_value < self.progress_target:
-                self.progress_bar.setValue(current_value + self.progress_step)
+                self.progress_bar.setValue(current_value + 1)
             else:
                 self.progress_timer.stop()
 
-            # Обновление текста статуса в зависимости от прогресса
-            if current_value == 0:
-                self.progress_bar.setFormat('Ошибка в работе программы!')
-            elif current_value < 30:
-                self.progress_bar.setFormat(f'Конвертация файла... {current_value}%')
-            elif current_value < 60:
-                self.progress_bar.setFormat(f'Подготовка модели... {current_value}%')
-            elif current_value < 100:
-                self.progress_bar.setFormat(f'Обработка файла... {current_value}%')
-            elif current_value >= 100:
+            if self.progress_bar.value() >= 100:
                 self.progress_bar.setFormat('Готово!')
                 self.progress_timer.stop()
         except Exception as e:
-            print(f'Error smooth_progress => {e}')
+            log.exception('Error smooth_progress => %s', e)
             self.update_progress(0)
             self.progress_bar.setFormat(f'Ошибка!')
-            self.text_output.setText('Ошибка в smooth_progress')
+            self.transcript_view.set_message('Ошибка в smooth_progress')
 
-    def display_result(self, text):
-        """Выводит результат и завершает процесс."""
-        self.text_output.setText(text)
-
-        self.btn_select.setEnabled(True)
-        self.slider_model.setEnabled(True)
-        self.save_checkbox.setEnabled(True)
-        self.btn_transcribe.setEnabled(True)
+    def display_result(self, job):
+        """Выводит результат завершённой задачи: сегменты или сообщение об ошибке."""
+        if job.status == ERROR:
+            self.transcript_view.clear()
+            self.transcript_view.set_message(job.result_text)
+        else:
+            self.transcript_view.set_segments(job.segments)
 
-        print(f'display_result Done!')
+        log.debug('display_result Done!')
 
     def show_about(self):
         text_information = (f'Whisper Расшифровка {APP_VERSION}\n'
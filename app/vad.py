@@ -0,0 +1,166 @@
+import threading
+
+import numpy as np
+
+from app.audio_split import cut_window
+from app.convert_to_wav import SAMPLE_RATE
+
+# Максимальная длина окна, которое подаётся в Whisper за один проход
+MAX_WINDOW_SECONDS = 30
+# В последних секундах окна ищется самое тихое место для разреза
+WINDOW_CUT_SEARCH_SECONDS = 5
+# Тишина, вставляемая между склеенными фрагментами речи, чтобы Whisper не сливал слова
+PIECE_GAP_SECONDS = 0.2
+
+_vad_model = None
+_vad_lock = threading.RLock()
+
+
+def get_vad_model():
+    """Загружает модель Silero VAD один раз на процесс."""
+    global _vad_model
+    with _vad_lock:
+        if _vad_model is None:
+            from silero_vad import load_silero_vad
+
+            _vad_model = load_silero_vad(onnx=True)
+        return _vad_model
+
+
+def detect_speech(audio):
+    """Возвращает участки речи в виде списка (начало, конец) в сэмплах."""
+    import torch
+    from silero_vad import get_speech_timestamps
+
+    # Модель хранит внутреннее состояние, поэтому запускаем её по одному потоку за раз
+    with _vad_lock:
+        timestamps = get_speech_timestamps(torch.from_numpy(audio), get_vad_model(), sampling_rate=SAMPLE_RATE)
+    return [(ts['start'], ts['end']) for ts in timestamps]
+
+
+class SpeechWindow:
+    """Окно до 30 с, склеенное из участков речи, с отображением времени на исходную запись."""
+
+    def __init__(self):
+        self.pieces = []  # (начало в исходной записи, начало в окне, длина) в сэмплах
+        self.length = 0
+        # Зона окна на исходной шкале (с), если оно перекрывается с соседним: сегменты берутся только из неё
+        self.core_start = None
+        self.core_end = None
+
+    @property
+    def source_end(self):
+        """Конец окна на исходной шкале времени (с)."""
+        source_start, _, piece_length = self.pieces[-1]
+        return (source_start + piece_length) / SAMPLE_RATE
+
+    def can_fit(self, piece_length, max_samples):
+        gap = int(PIECE_GAP_SECONDS * SAMPLE_RATE) if self.pieces else 0
+        return self.length + gap + piece_length <= max_samples
+
+    def add(self, source_start, piece_length):
+        if self.pieces:
+            self.length += int(PIECE_GAP_SECONDS * SAMPLE_RATE)
+        self.pieces.append((source_start, self.length, piece_length))
+        self.length += piece_length
+
+    def extract(self, audio):
+        """Собирает аудио окна из исходного буфера."""
+        window_audio = np.zeros(self.length, dtype=np.float32)
+        for source_start, window_start, piece_length in self.pieces:
+            window_audio[window_start:window_start + piece_length] = audio[source_start:source_start + piece_length]
+        return window_audio
+
+    def to_source_time(self, seconds, is_end=False):
+        """Переводит время внутри окна (с) во время исходной записи (с)."""
+        position = seconds * SAMPLE_RATE
+        previous = None
+
+        for source_start, window_start, piece_length in self.pieces:
+            if position < window_start:
+                # Попали в тишину между фрагментами: конец прижимаем к предыдущему, начало - к следующему
+                if is_end and previous is not None:
+                    return (previous[0] + previous[2]) / SAMPLE_RATE
+                return source_start / SAMPLE_RATE
+            if position <= window_start + piece_length:
+                return (source_start + position - window_start) / SAMPLE_RATE
+            previous = (source_start, window_start, piece_length)
+
+        source_start, window_start, piece_length = self.pieces[-1]
+        return (source_start + piece_length) / SAMPLE_RATE
+
+
+def pack_speech_windows(spans, max_window_seconds=MAX_WINDOW_SECONDS):
+    """Упаковывает участки речи в окна не длиннее max_window_seconds."""
+    max_samples = int(max_window_seconds * SAMPLE_RATE)
+    windows = []
+    window = SpeechWindow()
+
+    for start, end in spans:
+        # Слишком длинную речь без пауз режем на куски по размеру окна
+        for piece_start in range(start, end, max_samples):
+            piece_length = min(max_samples, end - piece_start)
+            if not window.can_fit(piece_length, max_samples):
+                windows.append(window)
+                window = SpeechWindow()
+            window.add(piece_start, piece_length)
+
+    if window.pieces:
+        windows.append(window)
+
+    return windows
+
+
+def split_into_windows(audio, max_window_seconds=MAX_WINDOW_SECONDS):
+    """Делит всю запись (без VAD) на окна, разрезая по самым тихим местам.
+
+    Если паузы в месте разреза нет, соседние окна перекрываются (cut_window), а зоны окон
+    (core_start, core_end) указывают, из какого окна брать сегменты на стыке.
+    """
+    max_samples = int(max_window_seconds * SAMPLE_RATE)
+    windows = []
+    start = 0
+    core_start = None
+
+    while len(audio) - start > max_samples:
+        cut, end, next_start = cut_window(audio, start, max_samples, WINDOW_CUT_SEARCH_SECONDS)
+
+        window = SpeechWindow()
+        window.add(start, end - start)
+        window.core_start = core_start
+        window.core_end = cut / SAMPLE_RATE if end != cut else None
+        windows.append(window)
+        core_start = window.core_end
+        start = next_start
+
+    if start < len(audio):
+        window = SpeechWindow()
+        window.add(start, len(audio) - start)
+        window.core_start = core_start
+        windows.append(window)
+
+    return windows
+
+
+class VadReport:
+    """Сводка о том, сколько тишины было пропущено."""
+
+    def __init__(self, total_samples, spans, windows_count):
+        self.total_seconds = total_samples / SAMPLE_RATE
+        self.speech_seconds = sum(end - start for start, end in spans) / SAMPLE_RATE
+        self.windows_count = windows_count
+
+    @property
+    def skipped_seconds(self):
+        return max(0.0, self.total_seconds - self.speech_seconds)
+
+    @property
+    def skipped_percent(self):
+        if not self.total_seconds:
+            return 0.0
+        return self.skipped_seconds / self.total_seconds * 100
+
+    def __str__(self):
+        return (f'VAD: речь {self.speech_seconds:.1f} с из {self.total_seconds:.1f} с, '
+                f'пропущено {self.skipped_seconds:.1f} с тишины ({self.skipped_percent:.0f}%), '
+                f'окон: {self.windows_count}')
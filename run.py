@@ -1,13 +1,20 @@
-import ctypes
-import sys
+import time
 
-from PyQt6.QtWidgets import QApplication
+STARTED = time.perf_counter()  # отсчёт времени запуска - до всех остальных импортов
 
-from app.ui import WhisperApp
+import json
+import logging
+import sys
 
 
 def enable_console():
     """Создаёт консоль, если запущено с -D."""
+    if sys.platform != 'win32':
+        print('Debug mode enabled (-D)')
+        return
+
+    import ctypes
+
     kernel32 = ctypes.windll.kernel32
     kernel32.AllocConsole()
     sys.stdout = open('CONOUT$', 'w')
@@ -15,18 +22,73 @@ def enable_console():
     print('Debug mode enabled (-D)')
 
 
-def main():
+def main(startup_report=False):
+    """Окно показывается до импорта torch и whisper: движок догружается в фоне (app.startup).
+
+    startup_report - вывести разбивку времени запуска в JSON, когда движок будет готов, и выйти.
+    """
     try:
+        from app.startup import startup_timer
+
+        startup_timer.started = STARTED
+        with startup_timer.measure('qt_import'):
+            from PyQt6.QtWidgets import QApplication
+        with startup_timer.measure('ui_import'):
+            from app.ui import WhisperApp
+
         app = QApplication([])
         window = WhisperApp()
         window.show()
+        startup_timer.mark('window_shown')
+
+        if startup_report:
+            def report(*args):
+                print(json.dumps(startup_timer.to_dict(), ensure_ascii=False, indent=2))
+                app.quit()
+
+            window.engine_signals.ready.connect(report)
+            window.engine_signals.failed.connect(report)
+
         app.exec()
     except Exception as e:
-        print(f'main error -> {e}')
+        logging.getLogger('app').exception(f'main error -> {e}')
+
+
+def run_benchmark():
+    """Запускает бенчмарк расшифровки (Qt не импортируется)."""
+    from app.benchmark import main as benchmark_main
+
+    sys.exit(benchmark_main(sys.argv[1:]))
+
+
+def run_live():
+    """Живая расшифровка потока в консоли (Qt не импортируется)."""
+    from app.live import main as live_main
+
+    sys.exit(live_main(sys.argv[1:]))
+
+
+def run_server():
+    """Запускает сервис расшифровки без графического интерфейса (Qt не импортируется)."""
+    from app.server import main as server_main
+
+    server_main(sys.argv[1:])
 
 
 if __name__ == '__main__':
     if '-D' in sys.argv:
         enable_console()
 
-    main()
+    from app.tracing import setup_logging
+
+    # --trace (или VOICE_DECODER_TRACE=1) включает JSON-лог и Chrome trace в папке cache/traces
+    setup_logging(debug='-D' in sys.argv, trace=True if '--trace' in sys.argv else None)
+
+    if '--server' in sys.argv:
+        run_server()
+    elif '--benchmark' in sys.argv:
+        run_benchmark()
+    elif '--live' in sys.argv:
+        run_live()
+    else:
+        main(startup_report='--startup-report' in sys.argv)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from app.audio_split import OVERLAP_SECONDS, merge_window_segments, trim_seam_repeat
+from app.convert_to_wav import SAMPLE_RATE
+from app.vad import MAX_WINDOW_SECONDS, split_into_windows
+
+
+def _tone(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def _segment(start, end, text):
+    return {'start': start, 'end': end, 'text': text}
+
+
+def test_windows_overlap_without_pause():
+    audio = _tone(100)
+    windows = split_into_windows(audio)
+
+    assert len(windows) > 1
+    for window, following in zip(windows, windows[1:]):
+        window_start, _, length = window.pieces[0]
+        assert length <= MAX_WINDOW_SECONDS * SAMPLE_RATE
+        # Следующее окно начинается раньше, чем кончается текущее, а зоны идут встык
+        assert following.pieces[0][0] < window_start + length
+        assert window.core_end == following.core_start
+        assert window.source_end - window.core_end == OVERLAP_SECONDS
+    assert windows[0].core_start is None and windows[-1].core_end is None
+    assert windows[-1].source_end == len(audio) / SAMPLE_RATE
+
+
+def test_windows_cut_at_pause_do_not_overlap():
+    audio = _tone(100)
+    audio[27 * SAMPLE_RATE:28 * SAMPLE_RATE] = 0
+    windows = split_into_windows(audio)
+
+    assert windows[0].core_end is None and windows[1].core_start is None
+    assert windows[1].pieces[0][0] == windows[0].pieces[0][2]
+
+
+def test_trim_seam_repeat_removes_repeated_words():
+    previous = _segment(10.0, 14.0, ' Мы поехали на дачу в субботу')
+    seg = _segment(13.2, 16.0, ' в субботу утром, рано')
+
+    assert trim_seam_repeat(previous, seg) == _segment(14.0, 16.0, ' утром, рано')
+    assert trim_seam_repeat(previous, _segment(13.5, 14.0, ' В субботу.')) is None
+    # Далеко от стыка совпадение слов - не повтор
+    assert trim_seam_repeat(previous, _segment(20.0, 21.0, ' в субботу')) == _segment(20.0, 21.0, ' в субботу')
+
+
+def test_merge_window_segments_keeps_core_zone():
+    merged = [_segment(0.0, 27.5, ' раз два три')]
+    segments = [_segment(26.0, 27.5, ' два три'), _segment(27.5, 29.0, ' три четыре'), _segment(29.0, 40.0, ' пять')]
+
+    assert merge_window_segments(merged, segments, core_start=28.0) == [
+        _segment(27.5, 29.0, ' четыре'), _segment(29.0, 40.0, ' пять')]
+
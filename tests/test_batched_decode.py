@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import batched_decode
+from app.batched_decode import _is_silence, _needs_fallback, batch_limit, segments_from_tokens
+
+
+class _Tokenizer:
+    """Токены < 100 - слова из словаря, с 100 - метки времени с шагом 0.02 с."""
+    timestamp_begin = 100
+    words = {1: ' Привет', 2: ' мир', 3: ' снова'}
+
+    def decode(self, tokens):
+        return ''.join(self.words[token] for token in tokens)
+
+
+def _time(seconds):
+    return 100 + round(seconds / batched_decode.TIME_PRECISION)
+
+
+def test_segments_from_timestamp_tokens():
+    tokens = [_time(0.0), 1, 2, _time(2.4), _time(2.4), 3, _time(5.0)]
+    assert segments_from_tokens(tokens, _Tokenizer(), 30.0) == [
+        {'start': 0.0, 'end': 2.4, 'text': ' Привет мир'},
+        {'start': 2.4, 'end': 5.0, 'text': ' снова'},
+    ]
+
+
+def test_unclosed_segment_runs_to_window_end():
+    tokens = [_time(1.0), 1, _time(2.0), _time(3.0), 2]
+    assert segments_from_tokens(tokens, _Tokenizer(), 12.5)[-1] == {'start': 3.0, 'end': 12.5, 'text': ' мир'}
+    # Метка времени за концом короткого окна прижимается к нему
+    assert segments_from_tokens([_time(0.0), 3, _time(29.0)], _Tokenizer(), 10.0) == [
+        {'start': 0.0, 'end': 10.0, 'text': ' снова'}]
+
+
+def test_fallback_and_silence_thresholds():
+    good = SimpleNamespace(compression_ratio=1.5, avg_logprob=-0.3, no_speech_prob=0.1)
+    assert not _needs_fallback(good) and not _is_silence(good)
+    assert _needs_fallback(SimpleNamespace(compression_ratio=3.0, avg_logprob=-0.3))
+    assert _needs_fallback(SimpleNamespace(compression_ratio=1.5, avg_logprob=-1.5))
+    assert _is_silence(SimpleNamespace(no_speech_prob=0.9, avg_logprob=-1.5))
+    assert not _is_silence(SimpleNamespace(no_speech_prob=0.9, avg_logprob=-0.2))
+
+
+def test_batch_limit_remembers_smaller_size(monkeypatch):
+    monkeypatch.setattr(batched_decode, '_batch_limits', {})
+    assert batch_limit('cuda:0', 'small', 8) == 8
+    batched_decode._lower_batch_limit('cuda:0', 'small', 4)
+    batched_decode._lower_batch_limit('cuda:0', 'small', 6)
+    assert batch_limit('cuda:0', 'small', 8) == 4
+    assert batch_limit('cuda:0', 'small', 2) == 2
+    assert batch_limit('cuda:0', 'medium', 8) == 8
+
+
+def test_out_of_memory_batch_is_split(monkeypatch):
+    torch = pytest.importorskip('torch')
+    monkeypatch.setattr(batched_decode, '_batch_limits', {})
+
+    class Model:
+        def decode(self, mel, options):
+            if len(mel) > 2:
+                raise RuntimeError('CUDA out of memory')
+            return [float(row.sum()) for row in mel]
+
+    mel = torch.arange(8.0).reshape(8, 1)
+    assert batched_decode._decode_batch(Model(), mel, None, 'small') == [float(value) for value in range(8)]
+    assert batch_limit('cpu', 'small', 8) == 2
@@ -0,0 +1,62 @@
+import copy
+
+import pytest
+
+from app.benchmark import REPORT_VERSION, STAGES, _summarize, compare_reports, current_rss_mb, main, save_report
+
+
+def _run(decode_seconds, rss=500.0, audio_seconds=60.0):
+    stages = {name: {'seconds': 1.0, 'peak_rss_mb': rss, 'peak_vram_mb': None} for name in STAGES}
+    stages['decode']['seconds'] = decode_seconds
+    return {'model': 'small', 'device': 'cpu', 'precision': 'fp32', 'compile': False, 'audio': 'synthetic_60s.mp3',
+            'audio_seconds': audio_seconds, 'segments': 10, 'stages': stages}
+
+
+def _report(*results):
+    return {'version': REPORT_VERSION, 'results': list(results)}
+
+
+def test_repeats_are_summarized_by_median_time_and_max_memory():
+    result = _summarize([_run(30.0, 400.0), _run(12.0, 600.0), _run(15.0, 500.0)])
+
+    assert result['repeat'] == 3
+    assert result['stages']['decode']['seconds'] == 15.0
+    assert result['stages']['decode']['peak_rss_mb'] == 600.0
+    assert result['stages']['decode']['peak_vram_mb'] is None
+    assert result['rtf'] == 0.25
+    assert result['total_seconds'] == 15.0 + len(STAGES) - 1
+
+
+def test_compare_reports_finds_only_real_regressions():
+    baseline = _report(_summarize([_run(10.0)]))
+    slower = copy.deepcopy(baseline)
+    slower['results'][0]['stages']['decode']['seconds'] = 12.0
+    slower['results'][0]['stages']['load']['peak_rss_mb'] = 505.0
+
+    (regression,) = compare_reports(baseline, slower)
+    assert regression.startswith('small/cpu synthetic_60s.mp3: decode.seconds 10.0 -> 12.0')
+    # Меньше порога и меньше абсолютного минимума - не регрессия
+    assert compare_reports(baseline, slower, threshold=0.5) == []
+    assert compare_reports(slower, baseline) == []
+
+
+def test_reports_of_different_versions_are_not_compared():
+    with pytest.raises(ValueError):
+        compare_reports({'version': REPORT_VERSION - 1, 'results': []}, _report())
+
+
+def test_compare_command_exit_code(tmp_path, capsys):
+    baseline = _report(_summarize([_run(10.0)]))
+    slower = copy.deepcopy(baseline)
+    slower['results'][0]['stages']['decode']['seconds'] = 20.0
+    for name, report in (('old.json', baseline), ('new.json', slower)):
+        save_report(report, tmp_path / name)
+
+    assert main(['--compare', str(tmp_path / 'old.json'), str(tmp_path / 'old.json')]) == 0
+    assert main(['--compare', str(tmp_path / 'old.json'), str(tmp_path / 'new.json')]) == 1
+    assert 'Найдено регрессий: 1' in capsys.readouterr().out
+
+
+def test_current_rss_is_measured():
+    rss = current_rss_mb()
+    assert rss is None or rss > 0
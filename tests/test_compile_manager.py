@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+pytest.importorskip('torch')
+compile_manager_module = pytest.importorskip('app.compile_manager')
+
+CompileManager = compile_manager_module.CompileManager
+CompilePayoff = compile_manager_module.CompilePayoff
+payoffs_from_report = compile_manager_module.payoffs_from_report
+
+
+def _result(audio, audio_seconds, compiled, decode_seconds, compile_seconds):
+    return {'model': 'small', 'device': 'cpu', 'precision': 'fp32', 'compile': compiled, 'audio': audio,
+            'audio_seconds': audio_seconds,
+            'stages': {'decode': {'seconds': decode_seconds}, 'compile': {'seconds': compile_seconds}}}
+
+
+def _report(torch_version=compile_manager_module.TORCH_VERSION):
+    return {'system': {'torch': torch_version}, 'results': [
+        _result('a_60s.mp3', 60, False, 30.0, 1.0), _result('a_60s.mp3', 60, True, 24.0, 31.0),
+        _result('a_600s.mp3', 600, False, 300.0, 1.0), _result('a_600s.mp3', 600, True, 240.0, 31.0),
+    ]}
+
+
+def test_payoff_break_even():
+    payoff = CompilePayoff(gain_per_second=0.1, overhead_seconds=30.0, samples=2)
+    assert payoff.break_even_seconds == 300.0
+    assert payoff.saved_seconds(600) == 30.0
+    assert payoff.saved_seconds(600, include_overhead=False) == 60.0
+    assert CompilePayoff(-0.01, 30.0, 1).break_even_seconds is None
+
+
+def test_payoffs_from_report_pairs_runs():
+    payoff = payoffs_from_report(_report())[('small', 'cpu')]
+    assert payoff.gain_per_second == pytest.approx(0.1)
+    assert payoff.overhead_seconds == pytest.approx(30.0)
+    assert payoff.samples == 2
+    # Замеры другой версии torch не используются
+    assert payoffs_from_report(_report('0.0')) == {}
+
+
+def test_should_compile_follows_report_and_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(compile_manager_module, 'compile_supported', lambda: True)
+    path = tmp_path / 'benchmark.json'
+    path.write_text(json.dumps(_report()), encoding='utf-8')
+
+    manager = CompileManager(path)
+    assert not manager.should_compile('small', 'cpu', 120)
+    assert manager.should_compile('small', 'cpu', 600)
+    assert manager.should_compile('small', 'cpu')
+    assert not manager.should_compile('medium', 'cpu', 600)
+
+    assert CompileManager(path, mode='1').should_compile('medium', 'cpu', 10)
+    assert not CompileManager(path, mode='0').should_compile('small', 'cpu', 600)
+    assert not CompileManager(tmp_path / 'missing.json').should_compile('small', 'cpu', 600)
@@ -0,0 +1,60 @@
+import subprocess
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import transcribe
+from app.convert_to_wav import SAMPLE_RATE, converted_wav_path, decode_audio, read_pcm_wav, save_wav
+
+
+def test_decode_audio_reads_pcm_from_ffmpeg_pipe(tmp_path, monkeypatch):
+    pcm = np.array([0, 16384, -32768, 32767], dtype='<i2')
+    commands = []
+
+    def run(command, stdout=None, stderr=None):
+        commands.append(command)
+        return SimpleNamespace(returncode=0, stdout=pcm.tobytes(), stderr=b'')
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    audio = decode_audio(tmp_path / 'rec.mp3')
+
+    assert audio.dtype == np.float32
+    np.testing.assert_allclose(audio, [0.0, 0.5, -1.0, 32767 / 32768])
+    # Звук идёт в stdout, временных файлов нет
+    assert commands[0][-1] == '-' and str(tmp_path / 'rec.mp3') in commands[0]
+
+
+def test_decode_audio_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(subprocess, 'run', lambda command, stdout=None, stderr=None: SimpleNamespace(
+        returncode=1, stdout=b'', stderr=b'Invalid data found'))
+    with pytest.raises(RuntimeError):
+        decode_audio(tmp_path / 'broken.mp3')
+
+
+def test_save_wav_round_trip(tmp_path):
+    audio = np.linspace(-1.0, 1.0, SAMPLE_RATE, dtype=np.float32)
+    path = save_wav(audio, tmp_path / 'out.wav')
+    np.testing.assert_allclose(read_pcm_wav(path), audio, atol=1 / 32768)
+
+
+def test_prepare_audio_reads_whisper_wav_without_ffmpeg(tmp_path, monkeypatch):
+    def decode(path):
+        raise AssertionError('WAV в нужном формате не должен идти через ffmpeg')
+
+    monkeypatch.setattr(transcribe, 'decode_audio', decode)
+    path = save_wav(np.zeros(SAMPLE_RATE, dtype=np.float32), tmp_path / 'rec.wav')
+    assert len(transcribe.prepare_audio(path)) == SAMPLE_RATE
+    assert not converted_wav_path(path).exists()
+
+
+def test_prepare_audio_saves_converted_wav_for_video(tmp_path, monkeypatch):
+    video = tmp_path / 'lecture.mp4'
+    video.write_bytes(b'not parsed')
+    monkeypatch.setattr(transcribe, 'probe_media', lambda path: SimpleNamespace(is_whisper_pcm=False))
+    monkeypatch.setattr(transcribe, 'decode_audio', lambda path: np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+    transcribe.prepare_audio(video, save_converted=False)
+    assert not converted_wav_path(video).exists()
+    transcribe.prepare_audio(video)
+    assert len(read_pcm_wav(converted_wav_path(video))) == SAMPLE_RATE
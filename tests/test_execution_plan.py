@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+from app import execution_plan
+from app.execution_plan import HardwareInfo, ModelTooLargeError, _env_int, plan_execution, required_mb
+
+
+@pytest.fixture
+def hardware(monkeypatch):
+    info = HardwareInfo()
+    info.logical_cores = 8
+    info.physical_cores = 4
+    info.ram_total_mb = 16 * 1024
+    info.ram_available_mb = 8 * 1024
+    monkeypatch.setattr(execution_plan, '_hardware', info)
+    monkeypatch.setattr(execution_plan, 'THREADS_OVERRIDE', None)
+    monkeypatch.setattr(execution_plan, 'BATCH_SIZE_OVERRIDE', None)
+    monkeypatch.setattr(execution_plan.model_registry, 'is_loaded', lambda *args: False)
+    return info
+
+
+def test_env_override_falls_back_on_bad_value(monkeypatch, caplog):
+    monkeypatch.setenv('VOICE_DECODER_THREADS', 'восемь')
+    with caplog.at_level(logging.WARNING):
+        assert _env_int('VOICE_DECODER_THREADS') is None
+    assert 'VOICE_DECODER_THREADS' in caplog.text
+
+    monkeypatch.setenv('VOICE_DECODER_THREADS', '0')
+    assert _env_int('VOICE_DECODER_THREADS') == 1
+    monkeypatch.setenv('VOICE_DECODER_THREADS', '6')
+    assert _env_int('VOICE_DECODER_THREADS') == 6
+    monkeypatch.delenv('VOICE_DECODER_THREADS')
+    assert _env_int('VOICE_DECODER_THREADS') is None
+
+
+def test_cpu_plan(hardware):
+    plan = plan_execution('small')
+    assert (plan.device, plan.precision, plan.threads, plan.batch_size) == ('cpu', 'fp32', 4, 1)
+    assert plan.fits
+    assert plan.recommended_model == 'large-v3'
+
+
+def test_model_that_does_not_fit_vram_goes_to_cpu(hardware):
+    hardware.cuda_name = 'GeForce'
+    hardware.cuda_capability = (8, 6)
+    hardware.vram_free_mb = 1024
+
+    plan = plan_execution('medium')
+    assert plan.device == 'cpu'
+    assert any('видеопамять' in note for note in plan.notes)
+
+    hardware.vram_free_mb = 24 * 1024
+    plan = plan_execution('medium')
+    assert (plan.device, plan.precision, plan.threads) == ('cuda', 'fp16', 4)
+    assert plan.batch_size > 1
+
+
+def test_check_uses_current_free_memory(hardware, monkeypatch):
+    plan = plan_execution('large-v3')
+    assert plan.fits
+
+    # За время работы свободная память кончилась: снимок при опросе железа уже неверен
+    monkeypatch.setattr(execution_plan, 'available_ram_mb', lambda: required_mb('large-v3', 'fp32') / 2)
+    with pytest.raises(ModelTooLargeError):
+        plan.check()
+
+    # Загруженной модели новая память не нужна
+    monkeypatch.setattr(execution_plan.model_registry, 'is_loaded', lambda *args: True)
+    plan = plan_execution('large-v3')
+    plan.check()
@@ -0,0 +1,86 @@
+import json
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+from app.exporters import DocxExporter, ExportSet, SrtExporter, export_segments, format_timestamp
+from app.format_time import format_time
+
+SEGMENTS = [
+    {'start': 0.0, 'end': 2.5, 'text': ' Привет.'},
+    {'start': 3661.2345, 'end': 3663.0, 'text': ' Кот & <пёс>\x01'},
+]
+
+
+def test_format_timestamp():
+    assert format_timestamp(3661.2345) == '01:01:01.234'
+    assert format_timestamp(3661.2345, ',') == '01:01:01,234'
+    assert format_timestamp(59.9996) == '00:01:00.000'
+    assert format_timestamp(-1) == '00:00:00.000'
+
+
+def test_srt_and_vtt(tmp_path):
+    srt = export_segments(SEGMENTS, tmp_path / 'rec.srt')
+    assert srt.read_text(encoding='utf-8').startswith(
+        '1\n00:00:00,000 --> 00:00:02,500\nПривет.\n\n2\n01:01:01,234 --> 01:01:03,000\n')
+
+    vtt = export_segments(SEGMENTS, tmp_path / 'rec.vtt')
+    assert vtt.read_text(encoding='utf-8').startswith('WEBVTT\n\n00:00:00.000 --> 00:00:02.500\nПривет.\n\n')
+
+
+def test_jsonl(tmp_path):
+    path = export_segments(SEGMENTS[:1], tmp_path / 'rec.jsonl')
+    assert [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()] == [
+        {'start': 0.0, 'end': 2.5, 'text': 'Привет.'}]
+
+
+def test_docx_layout(tmp_path):
+    path = export_segments(SEGMENTS, tmp_path / 'rec.docx')
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == ['[Content_Types].xml', '_rels/.rels', 'word/document.xml']
+        document = ElementTree.fromstring(archive.read('word/document.xml'))
+    namespace = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    paragraphs = document.find(f'{namespace}body').findall(f'{namespace}p')
+    texts = [''.join(node.text or '' for node in paragraph.iter(f'{namespace}t')) for paragraph in paragraphs]
+    # Пустой абзац после долгой паузы, спецсимволы экранированы, управляющие убраны
+    assert texts == [f'{format_time(0.0)} - {format_time(2.5)} Привет.', '',
+                     f'{format_time(3661.2345)} - {format_time(3663.0)} Кот & <пёс>']
+
+
+def test_file_gets_its_name_only_when_closed(tmp_path):
+    exporter = SrtExporter(tmp_path / 'rec.srt')
+    exporter.write(SEGMENTS)
+    assert exporter.tmp_path.name == 'rec.srt.part'
+    assert exporter.tmp_path.exists() and not exporter.path.exists()
+
+    assert exporter.close() == tmp_path / 'rec.srt'
+    assert exporter.path.exists() and not exporter.tmp_path.exists()
+
+
+def test_export_set_abort_removes_parts(tmp_path):
+    exports = ExportSet(tmp_path / 'rec.mp3', ('txt', 'docx'))
+    exports.write(SEGMENTS)
+    exports.abort()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_set_keeps_no_formats_when_one_fails(tmp_path, monkeypatch):
+    def broken_tail(self):
+        raise OSError('диск заполнен')
+
+    monkeypatch.setattr(DocxExporter, '_write_tail', broken_tail)
+    exports = ExportSet(tmp_path / 'rec.mp3', ('txt', 'srt', 'docx', 'vtt'))
+    exports.write(SEGMENTS)
+
+    with pytest.raises(OSError):
+        exports.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_set_writes_every_format(tmp_path):
+    exports = ExportSet(tmp_path / 'rec.mp3', ('txt', 'vtt'))
+    exports.write(SEGMENTS)
+    assert exports.close() == [tmp_path / 'rec.txt', tmp_path / 'rec.vtt']
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['rec.txt', 'rec.vtt']
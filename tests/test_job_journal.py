@@ -0,0 +1,34 @@
+from app.job_journal import JobJournal
+
+
+def _segment(start, end, text):
+    return {'start': start, 'end': end, 'text': text}
+
+
+def test_interrupted_job_resumes_from_checkpoint(tmp_path):
+    journal = JobJournal(tmp_path)
+    checkpoint = journal.open('key', file='rec.mp3')
+    checkpoint.begin(device='cpu', batch_size=1)
+    checkpoint.record(2, [_segment(0.0, 25.0, ' Привет')], 55.0, 'Привет', 'ru')
+    checkpoint.close()
+
+    resumed = journal.open('key', file='rec.mp3')
+    resumed.begin(device='cpu', batch_size=1)
+    assert resumed.resumed
+    assert (resumed.next_window, resumed.decoded_seconds, resumed.language) == (2, 55.0, 'ru')
+    assert resumed.segments == [_segment(0.0, 25.0, ' Привет')]
+
+
+def test_second_live_checkpoint_for_same_key_is_refused(tmp_path):
+    journal = JobJournal(tmp_path)
+    first = journal.open('key')
+    first.begin(device='cpu')
+
+    # Такая же задача в соседнем воркере идёт без журнала и не удаляет чужой
+    assert journal.open('key') is None
+    assert journal.open('other') is not None
+
+    first.record(1, [_segment(0.0, 1.0, ' да')], 30.0)
+    first.discard()
+    assert not (tmp_path / 'key.jsonl').exists()
+    assert journal.open('key') is not None
@@ -0,0 +1,53 @@
+import time
+from types import SimpleNamespace
+
+from app.job_queue import CANCELLED, DECODING, DONE, Job, JobQueue
+from app.transcript_cache import transcript_cache
+
+
+def test_cancelled_cached_job_ends_cancelled(tmp_path, monkeypatch):
+    audio_path = tmp_path / 'rec.wav'
+    audio_path.write_bytes(b'RIFF')
+    monkeypatch.setattr(transcript_cache, 'get', lambda key: [{'start': 0.0, 'end': 1.0, 'text': ' да'}])
+
+    queue = JobQueue()
+    job = Job(audio_path, formats=('txt',))
+    # Отмена пришла, пока задача искалась в кэше
+    job.status = CANCELLED
+
+    assert queue._finish_from_cache(job)
+    assert job.status == CANCELLED
+    assert job.segments == []
+    assert not (tmp_path / 'rec.txt').exists()
+
+
+def test_update_queued_changes_only_jobs_not_started(tmp_path):
+    queue = JobQueue()
+    waiting = queue.add(tmp_path / 'a.mp3')
+    started = queue.add(tmp_path / 'b.mp3')
+    started.status = DECODING
+
+    queue.update_queued({'model_size': 'medium', 'use_vad': True, 'shards': 4, 'formats': ['srt']})
+
+    assert (waiting.model_size, waiting.use_vad, waiting.shards, waiting.formats) == ('medium', True, 4, ('srt',))
+    assert (started.model_size, started.use_vad, started.shards) == ('small', False, 1)
+
+
+def test_cached_job_counts_in_throughput(tmp_path, monkeypatch):
+    import app.job_queue as job_queue
+
+    audio_path = tmp_path / 'rec.wav'
+    audio_path.write_bytes(b'RIFF')
+    monkeypatch.setattr(transcript_cache, 'get', lambda key: [{'start': 0.0, 'end': 1.0, 'text': ' да'}])
+    monkeypatch.setattr(job_queue, 'probe_media', lambda path: SimpleNamespace(duration=90.0))
+
+    queue = JobQueue()
+    job = queue.add(audio_path, formats=())
+    queue.start()
+    deadline = time.time() + 10
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.02)
+    queue.stop()
+
+    assert job.status == DONE and job.from_cache
+    assert queue.stats()['done_audio_seconds'] == 90.0
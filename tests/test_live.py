@@ -0,0 +1,130 @@
+import time
+
+import numpy as np
+import pytest
+
+from app import live
+from app.convert_to_wav import SAMPLE_RATE
+from app.live import LIVE_BLOCK_SECONDS, LatencyStats, LiveTranscriber
+
+
+class _FakeModel:
+    """Вместо Whisper: один сегмент на весь кусок, запоминает длину каждого куска."""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, fp16=False, initial_prompt=None, language=None):
+        self.calls.append(len(audio) / SAMPLE_RATE)
+        text = f' фраза {len(self.calls)}'
+        return {'text': text, 'segments': [{'start': 0.0, 'end': len(audio) / SAMPLE_RATE, 'text': text}]}
+
+
+def _fake_speech(audio):
+    """VAD по громкости: речь - ненулевые сэмплы."""
+    loud = np.flatnonzero(np.abs(audio) > 0.01)
+    if not len(loud):
+        return []
+    breaks = np.flatnonzero(np.diff(loud) > 1)
+    starts = np.concatenate([[loud[0]], loud[breaks + 1]])
+    ends = np.concatenate([loud[breaks], [loud[-1]]]) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+@pytest.fixture
+def transcriber(monkeypatch):
+    monkeypatch.setattr(live, 'detect_speech', _fake_speech)
+    received = []
+    transcriber = LiveTranscriber('-', latency=2.0, on_segments=lambda segments, final: received.append(
+        (final, [seg['text'] for seg in segments])))
+    transcriber.model = _FakeModel()
+    transcriber._language = 'ru'
+    transcriber.received = received
+    return transcriber
+
+
+def _feed(transcriber, *parts):
+    """Кладёт в очередь блоки по LIVE_BLOCK_SECONDS: ('speech', с) или ('silence', с)."""
+    block = int(LIVE_BLOCK_SECONDS * SAMPLE_RATE)
+    for kind, seconds in parts:
+        for _ in range(int(round(seconds / LIVE_BLOCK_SECONDS))):
+            value = 0.5 if kind == 'speech' else 0.0
+            transcriber._blocks.put((np.full(block, value, dtype=np.float32), time.perf_counter()))
+    return transcriber._receive(wait=0)
+
+
+def test_phrase_without_pause_is_provisional(transcriber):
+    _feed(transcriber, ('silence', 1.0), ('speech', 1.0))
+    transcriber._step()
+
+    assert transcriber.received == [(False, [' фраза 1'])]
+    # Тишина перед речью освобождена, остаётся только отступ перед ней
+    assert transcriber._pending_start == int((1.0 - live.SPEECH_PAD_SECONDS) * SAMPLE_RATE)
+
+
+def test_pause_after_speech_finalizes_phrase(transcriber):
+    _feed(transcriber, ('speech', 1.0), ('silence', 1.0))
+    transcriber._step()
+
+    assert transcriber.received == [(True, [' фраза 1'])]
+    assert transcriber._prompt.endswith('фраза 1')
+    # Речь и отступ после неё освобождены, пауза за ними ещё в буфере
+    assert transcriber._pending_start == int((1.0 + live.SPEECH_PAD_SECONDS) * SAMPLE_RATE)
+    assert transcriber.stats.to_dict()['final']['count'] == 1
+
+
+def test_finalize_keeps_cut_last_segment(transcriber):
+    class TwoSegments(_FakeModel):
+        def transcribe(self, audio, fp16=False, initial_prompt=None, language=None):
+            self.calls.append(len(audio) / SAMPLE_RATE)
+            return {'text': ' раз два', 'segments': [{'start': 0.0, 'end': 1.0, 'text': ' раз'},
+                                                     {'start': 1.0, 'end': 2.0, 'text': ' два'}]}
+
+    transcriber.model = TwoSegments()
+    _feed(transcriber, ('speech', 2.0))
+    transcriber._finalize(len(transcriber._pending), keep_last=True)
+
+    assert transcriber.received == [(True, [' раз'])]
+    # Оборванный последний сегмент остался в буфере
+    assert transcriber._pending_start == SAMPLE_RATE
+    assert len(transcriber._pending) == SAMPLE_RATE
+
+
+def test_provisional_decodes_are_skipped_when_behind(transcriber):
+    _feed(transcriber, ('speech', 3.0))
+    transcriber._step(backlog=transcriber.latency + 1)
+
+    assert transcriber.model.calls == []
+    assert transcriber.received == []
+
+    # Пауза после речи: фраза расшифровывается окончательно и при отставании
+    _feed(transcriber, ('silence', 1.0))
+    transcriber._step(backlog=transcriber.latency + 1)
+    assert transcriber.received == [(True, [' фраза 1'])]
+
+    _feed(transcriber, ('speech', 1.0))
+    transcriber._step(backlog=transcriber.latency / 2)
+    assert transcriber.received[-1][0] is False
+
+
+def test_reader_waits_when_queue_is_full(transcriber, monkeypatch):
+    monkeypatch.setattr(live, 'LIVE_BLOCK_SECONDS', 0.01)
+    transcriber._blocks.maxsize = 1
+    assert transcriber._put(('block', 0.0))
+    transcriber.stop()
+    assert not transcriber._put(('block', 0.0))
+    assert transcriber._blocks.qsize() == 1
+
+
+def test_latency_stats_percentiles():
+    stats = LatencyStats()
+    for value in range(1, 101):
+        stats.add('final', value / 100)
+
+    result = stats.to_dict()
+    assert result['provisional'] == {'count': 0}
+    assert result['final']['count'] == 100
+    assert result['final']['max'] == 1.0
+    assert result['final']['p50'] == pytest.approx(0.505)
+    assert result['final']['p99'] == pytest.approx(0.99, abs=0.01)
+    assert stats.report().startswith('Окончательные (100)')
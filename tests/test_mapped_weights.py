@@ -0,0 +1,62 @@
+import sys
+
+import pytest
+
+from app import mapped_weights
+from app.mapped_weights import memory_mb
+
+TINY_DIMS = {'n_mels': 80, 'n_audio_ctx': 16, 'n_audio_state': 32, 'n_audio_head': 2, 'n_audio_layer': 1,
+             'n_vocab': 51865, 'n_text_ctx': 8, 'n_text_state': 32, 'n_text_head': 2, 'n_text_layer': 2}
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='состав RSS есть только в /proc')
+def test_memory_breakdown_on_linux():
+    memory = memory_mb()
+    assert memory['rss_mb'] > 0
+    assert memory['anon_mb'] > 0
+    assert 'file_mb' in memory
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('whisper')
+    from whisper.model import ModelDimensions, Whisper
+
+    if not mapped_weights.mmap_supported():
+        pytest.skip('нужен PyTorch 2.1')
+    torch.manual_seed(0)
+    model = Whisper(ModelDimensions(**TINY_DIMS)).half()
+    source = tmp_path / 'tiny-test.pt'
+    torch.save({'dims': TINY_DIMS, 'model_state_dict': model.state_dict()}, source)
+
+    monkeypatch.setattr(mapped_weights, 'MAPPED_DIR', tmp_path / 'mmap')
+    monkeypatch.setattr(mapped_weights, 'checkpoint_path', lambda model_size: source)
+    return model
+
+
+def test_converted_weights_load_through_mmap(checkpoint):
+    import torch
+
+    assert not mapped_weights.is_converted('tiny-test')
+    mapped_weights.convert_checkpoint('tiny-test')
+    assert mapped_weights.is_converted('tiny-test')
+
+    model = mapped_weights.load_mapped_model('tiny-test', 'cpu')
+    for name, tensor in checkpoint.state_dict().items():
+        loaded = model.state_dict()[name]
+        # Веса хранятся в fp32 - в той точности, в которой модель работает на CPU
+        assert loaded.dtype == (torch.float32 if tensor.is_floating_point() else tensor.dtype)
+        torch.testing.assert_close(loaded, tensor.to(loaded.dtype))
+    assert not any(tensor.is_meta for tensor in model.state_dict().values())
+
+
+def test_missing_checkpoint_falls_back_to_whisper_loader(checkpoint, monkeypatch):
+    import whisper
+
+    loaded = []
+    monkeypatch.setattr(mapped_weights, 'checkpoint_path', lambda model_size: mapped_weights.MAPPED_DIR / 'нет.pt')
+    monkeypatch.setattr(whisper, 'load_model', lambda model_size, device, download_root: loaded.append(model_size))
+
+    mapped_weights.load_model('tiny-test', 'cpu')
+    assert loaded == ['tiny-test']
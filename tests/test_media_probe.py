@@ -0,0 +1,95 @@
+import os
+import struct
+import wave
+
+import numpy as np
+
+from app import media_probe
+from app.convert_to_wav import SAMPLE_RATE, read_pcm_wav
+from app.media_probe import _probe_headers, probe_media
+
+# GUID KSDATAFORMAT_SUBTYPE_PCM / IEEE_FLOAT без первых двух байт (кода формата)
+GUID_TAIL = b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+
+def write_extensible_wav(path, samples, sub_format=1, bits=16):
+    data = samples.tobytes()
+    block_align = bits // 8
+    fmt = struct.pack('<HHIIHHHHI', 0xFFFE, 1, SAMPLE_RATE, SAMPLE_RATE * block_align, block_align, bits,
+                      22, bits, 0x4) + struct.pack('<H', sub_format) + GUID_TAIL
+    with open(path, 'wb') as file:
+        file.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(data)) + b'WAVE')
+        file.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        file.write(b'data' + struct.pack('<I', len(data)) + data)
+
+
+def test_extensible_pcm_wav_is_read_directly(tmp_path):
+    samples = (np.sin(np.arange(SAMPLE_RATE) / 10) * 10000).astype('<i2')
+    path = tmp_path / 'extensible.wav'
+    write_extensible_wav(path, samples)
+
+    info = _probe_headers(str(path))
+    assert info.codec == 'pcm_s16le'
+    assert info.is_whisper_pcm
+    assert info.duration == 1.0
+    np.testing.assert_array_equal(read_pcm_wav(path), samples.astype(np.float32) / 32768.0)
+
+
+def test_extensible_float_wav_is_not_whisper_pcm(tmp_path):
+    path = tmp_path / 'float.wav'
+    write_extensible_wav(path, np.zeros(SAMPLE_RATE, dtype='<f4'), sub_format=3, bits=32)
+
+    info = _probe_headers(str(path))
+    assert info.codec == 'pcm_f32le'
+    assert not info.is_whisper_pcm
+
+
+def test_plain_wav_is_read_directly(tmp_path):
+    samples = np.arange(-500, 500, dtype='<i2')
+    path = tmp_path / 'plain.wav'
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(samples.tobytes())
+
+    assert _probe_headers(str(path)).is_whisper_pcm
+    np.testing.assert_array_equal(read_pcm_wav(path), samples.astype(np.float32) / 32768.0)
+
+
+def _write_pcm_wav(path, seconds=1.0):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(np.zeros(int(seconds * SAMPLE_RATE), dtype='<i2').tobytes())
+    return path
+
+
+def test_streamed_wav_size_is_clamped_to_file(tmp_path):
+    path = _write_pcm_wav(tmp_path / 'streamed.wav')
+    data = bytearray(path.read_bytes())
+    # Запись потоком: размеры RIFF и data не известны заранее
+    data[4:8] = data[40:44] = struct.pack('<I', 0xFFFFFFFF)
+    path.write_bytes(bytes(data))
+
+    assert _probe_headers(str(path)).duration == 1.0
+
+
+def test_probe_cache_forgets_deleted_then_oldest_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_probe, 'PROBE_CACHE_PATH', tmp_path / 'probe_cache.json')
+    monkeypatch.setattr(media_probe, '_cache', None)
+    monkeypatch.setattr(media_probe, 'MAX_PROBE_CACHE_ENTRIES', 2)
+    paths = [_write_pcm_wav(tmp_path / f'{name}.wav') for name in ('a', 'b', 'c', 'd')]
+
+    def cached():
+        return sorted(os.path.basename(key.split('|')[0]) for key in media_probe._cache)
+
+    probe_media(paths[0])
+    probe_media(paths[1])
+    paths[0].unlink()
+    probe_media(paths[2])
+    assert cached() == ['b.wav', 'c.wav']
+
+    probe_media(paths[3])
+    assert cached() == ['c.wav', 'd.wav']
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from app.model_registry import MODEL_MEMORY_MB, ModelRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry(ram_budget_mb=MODEL_MEMORY_MB['small'] * 2, vram_budget_mb=MODEL_MEMORY_MB['large'])
+    registry.loads = []
+
+    def load(model_size, device, precision):
+        registry.loads.append((model_size, device, precision))
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setattr(registry, '_load', load)
+    # Без torch: освобождать видеопамять нечего
+    monkeypatch.setattr(registry, '_release_memory', lambda device: None)
+    return registry
+
+
+def test_model_is_loaded_once_and_reused(registry):
+    model = registry.get('small', 'cpu', 'fp32')
+    assert registry.get('small', 'cpu', 'fp32') is model
+    assert registry.loads == [('small', 'cpu', 'fp32')]
+    assert registry.is_loaded('small', 'cpu', 'fp32')
+    assert not registry.is_loaded('small', 'cpu', 'fp32', slot=1)
+    assert registry.is_loaded('small', 'cpu', 'fp32', slot=None)
+
+
+def test_concurrent_requests_share_one_load(registry):
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get('small', 'cpu', 'fp32')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(registry.loads) == 1
+    assert all(model is models[0] for model in models)
+
+
+def test_slots_get_separate_instances(registry):
+    assert registry.get('small', 'cpu', 'fp32', slot=0) is not registry.get('small', 'cpu', 'fp32', slot=1)
+    assert len(registry.loads) == 2
+
+
+def test_least_recently_used_model_is_evicted_over_budget(registry):
+    first = registry.get('small', 'cpu', 'fp32', slot=0)
+    registry.get('small', 'cpu', 'fp32', slot=1)
+    # Обращение делает модель свежей: вытеснена будет вторая
+    assert registry.get('small', 'cpu', 'fp32', slot=0) is first
+    registry.get('small', 'cpu', 'fp32', slot=2)
+
+    assert registry.is_loaded('small', 'cpu', 'fp32', slot=0)
+    assert not registry.is_loaded('small', 'cpu', 'fp32', slot=1)
+    assert registry.is_loaded('small', 'cpu', 'fp32', slot=2)
+    # Бюджет видеопамяти отдельный
+    registry.get('large', 'cuda', 'fp16')
+    assert registry.is_loaded('small', 'cpu', 'fp32', slot=0)
+
+
+def test_unload_and_clear(registry):
+    registry.get('small', 'cpu', 'fp32')
+    registry.unload('small', 'cpu', 'fp32')
+    assert not registry.is_loaded('small', 'cpu', 'fp32')
+
+    registry.get('small', 'cpu', 'fp32')
+    registry.clear()
+    assert not registry.is_loaded('small', 'cpu', 'fp32', slot=None)
+    assert len(registry.loads) == 2
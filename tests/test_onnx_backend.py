@@ -0,0 +1,25 @@
+import pytest
+
+# Модуль импортирует torch и whisper сразу; без них (и без onnxruntime) тесты пропускаются
+for module in ('torch', 'whisper', 'onnxruntime'):
+    pytest.importorskip(module)
+onnx_backend = pytest.importorskip('app.onnx_backend')
+
+
+def test_int8_without_onnx_fails_before_export(monkeypatch):
+    monkeypatch.setattr(onnx_backend, 'is_exported', lambda model_size, quantize=False: False)
+    monkeypatch.setattr(onnx_backend.importlib.util, 'find_spec', lambda name: None)
+
+    def export_model(model_size):
+        raise AssertionError('экспорт не должен начинаться')
+
+    monkeypatch.setattr(onnx_backend, 'export_model', export_model)
+    with pytest.raises(RuntimeError, match='pip install onnx'):
+        onnx_backend.ensure_exported('small', quantize=True)
+
+
+def test_graph_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(onnx_backend, 'ONNX_DIR', tmp_path)
+    assert onnx_backend.graph_path('small', 'encoder').name == 'encoder.onnx'
+    assert onnx_backend.graph_path('small', 'encoder', quantize=True).name == 'encoder_int8.onnx'
+    assert not onnx_backend.is_exported('small')
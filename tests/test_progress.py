@@ -0,0 +1,53 @@
+import numpy as np
+
+from app.convert_to_wav import SAMPLE_RATE
+from app.transcribe import DecodeProgress, decode_windows
+from app.vad import split_into_windows
+
+
+class _FakeModel:
+    def transcribe(self, audio, fp16=False, initial_prompt=None, language=None):
+        seconds = len(audio) / SAMPLE_RATE
+        return {'text': ' окно', 'segments': [{'start': 0.0, 'end': seconds, 'text': ' окно'}]}
+
+
+def test_progress_percent_and_eta():
+    percents = []
+    progress = DecodeProgress(200.0, percents.append)
+    progress.started_at -= 10
+    progress.update(50.0)
+    # Время назад не идёт, конец не превышает длительность записи
+    progress.update(40.0)
+    assert percents == [25, 25]
+    assert 4.0 < progress.speed <= 5.0
+    assert 30.0 <= progress.eta_seconds < 40.0
+
+    progress.update(500.0)
+    assert progress.percent == 100
+    assert progress.eta_seconds == 0.0
+    assert DecodeProgress(0).percent == 100
+
+
+def test_resumed_part_does_not_count_in_speed():
+    progress = DecodeProgress(100.0)
+    progress.resume(60.0)
+    assert progress.percent == 60
+    assert progress.speed == 0.0
+    assert progress.eta_seconds is None
+
+
+def test_segments_arrive_window_by_window_with_progress():
+    audio = np.full(75 * SAMPLE_RATE, 0.1, dtype=np.float32)
+    windows = split_into_windows(audio)
+    percents = []
+    batches = []
+    progress = DecodeProgress(75.0, percents.append)
+
+    segments = decode_windows(_FakeModel(), audio, windows, False, progress,
+                              lambda window_segments, current: batches.append((len(window_segments), current.percent)),
+                              language='ru')
+
+    assert len(batches) == len(windows) == 3
+    assert sum(count for count, _ in batches) == len(segments)
+    assert [percent for _, percent in batches] == percents
+    assert percents == sorted(percents) and percents[-1] == 100
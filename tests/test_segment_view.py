@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip('PyQt6.QtWidgets')
+segment_view = pytest.importorskip('app.segment_view')
+Qt = segment_view.Qt
+
+
+def _segments(*texts, start=0.0):
+    return [{'start': start + index, 'end': start + index + 1, 'text': f' {text}'} for index, text in enumerate(texts)]
+
+
+def test_append_and_display():
+    model = segment_view.SegmentListModel()
+    model.append_segments(_segments('Привет', 'мир'))
+    model.append_segments(_segments('снова', start=2.0))
+    # Пакет, который уже в списке, повторно не добавляется
+    model.append_segments(_segments('снова', start=2.0))
+
+    assert model.rowCount() == 3
+    assert model.data(model.index(2), Qt.ItemDataRole.DisplayRole).endswith(' снова')
+    assert model.data(model.index(0), segment_view.SegmentRole)['text'] == ' Привет'
+
+
+def test_search_finds_rows_without_crossing_segments():
+    model = segment_view.SegmentListModel()
+    model.set_segments(_segments('Кот спит', 'кот-кот', 'ток', 'с'))
+
+    assert model.search('КОТ') == [0, 1]
+    # «т» в конце одного сегмента и «т» в начале следующего не склеиваются в «т\nт»
+    assert model.find('тт') == []
+    assert model.find('  ') == []
+
+    assert model.current_match == 0
+    assert model.step_match(1) == 1
+    assert model.step_match(1) == 0
+    assert model.step_match(-1) == 1
+    assert model.data(model.index(1), Qt.ItemDataRole.BackgroundRole) == segment_view.CURRENT_MATCH_COLOR
+    assert model.data(model.index(0), Qt.ItemDataRole.BackgroundRole) == segment_view.MATCH_COLOR
+    assert model.data(model.index(2), Qt.ItemDataRole.BackgroundRole) is None
+
+
+def test_search_index_is_rebuilt_after_append():
+    model = segment_view.SegmentListModel()
+    model.set_segments(_segments('один'))
+    assert model.find('два') == []
+    model.append_segments(_segments('два', start=1.0))
+    assert model.find('два') == [1]
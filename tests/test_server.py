@@ -0,0 +1,85 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from app import job_queue
+from app.server import TranscriptionServer
+
+
+@pytest.fixture
+def server():
+    server = TranscriptionServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.job_queue.stop()
+    server.server_close()
+
+
+def _request(connection, method, path, body=None):
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def test_uploaded_file_is_removed_when_job_finishes(server, monkeypatch):
+    checked = threading.Event()
+
+    def broken_probe(path):
+        # Задача не должна закончиться раньше, чем тест увидит загруженный файл
+        checked.wait(5)
+        raise ValueError('not an audio file')
+
+    monkeypatch.setattr(job_queue, 'probe_media', broken_probe)
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    response, body = _request(connection, 'POST', '/jobs?filename=broken.mp3', b'not an audio file')
+    assert response.status == 202
+    job_id = json.loads(body)['id']
+    assert len(list(server.upload_dir.iterdir())) == 1
+    checked.set()
+
+    # Все запросы идут по одному соединению: ответы с Content-Length его не закрывают
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        response, body = _request(connection, 'GET', f'/jobs/{job_id}')
+        assert response.version == 11
+        if json.loads(body)['status'] in ('done', 'error', 'cancelled'):
+            break
+        time.sleep(0.1)
+
+    response, body = _request(connection, 'GET', f'/jobs/{job_id}/result')
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    assert json.loads(body.splitlines()[-1])['status'] == 'error'
+
+    deadline = time.time() + 5
+    while list(server.upload_dir.iterdir()) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not list(server.upload_dir.iterdir())
+
+
+@pytest.mark.parametrize('options', [
+    {'shards': None}, {'shards': 0}, {'shards': -2}, {'shards': 'два'}, {'shards': True},
+    {'formats': 5}, {'formats': [1]}, {'formats': ['pdf']},
+    {'model': 'huge'}, {'model': ['small']},
+])
+def test_invalid_options_get_400(server, tmp_path, options):
+    audio_path = tmp_path / 'rec.wav'
+    audio_path.write_bytes(b'RIFF')
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request('POST', '/jobs', json.dumps({'path': str(audio_path), **options}),
+                       {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+
+    assert response.status == 400
+    assert 'error' in json.loads(response.read())
+    assert not server.job_queue.jobs
+
+
+def test_non_object_json_gets_400(server):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request('POST', '/jobs', '[1, 2]', {'Content-Type': 'application/json'})
+    assert connection.getresponse().status == 400
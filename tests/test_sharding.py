@@ -0,0 +1,75 @@
+import numpy as np
+
+from app import sharding
+from app.convert_to_wav import SAMPLE_RATE
+from app.sharding import MIN_SHARD_SECONDS, merge_shard_segments, plan_shards, shard_count, use_pool
+
+
+def _segment(start, end, text):
+    return {'start': start, 'end': end, 'text': text}
+
+
+def test_merge_shard_segments_removes_partial_repeat_at_seam():
+    audio = np.full(60 * SAMPLE_RATE, 0.3, dtype=np.float32)
+    plan = plan_shards(audio, 2)
+    (_, _, _, seam), (start, _, _, _) = plan
+    seam /= SAMPLE_RATE
+    assert start < seam * SAMPLE_RATE
+
+    first = [_segment(0.0, seam + 0.5, ' и тогда мы решили')]
+    second = [_segment(seam - 0.5, seam + 3.0, ' мы решили остаться дома')]
+
+    merged = merge_shard_segments(plan, [first, second])
+    assert [seg['text'] for seg in merged] == [' и тогда мы решили', ' остаться дома']
+
+
+def test_pool_in_use_is_not_shut_down_by_other_shape():
+    with use_pool(2) as first:
+        with use_pool(3) as second:
+            assert second is not first
+        # Пул первой задачи ещё работает, хотя вторая задача просила другую форму
+        assert not first._shutdown_thread
+        with use_pool(2) as again:
+            assert again is first
+
+    with use_pool(3):
+        assert first._shutdown_thread
+    for pool, _ in sharding._pools.values():
+        pool.shutdown()
+    sharding._pools.clear()
+
+
+def test_shard_count_matches_what_runs():
+    assert shard_count(MIN_SHARD_SECONDS, 4) == 1
+    assert shard_count(2 * MIN_SHARD_SECONDS - 1, 4) == 1
+    assert shard_count(3 * MIN_SHARD_SECONDS, 4) == 3
+    assert shard_count(10 * MIN_SHARD_SECONDS, 4) == 4
+    assert shard_count(10 * MIN_SHARD_SECONDS, 1) == 1
+
+
+class _FakeModel:
+    """Вместо Whisper: по сегменту на окно, запоминает язык и контекст каждого вызова."""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, fp16=False, initial_prompt=None, language=None):
+        self.calls.append((len(audio), initial_prompt, language))
+        seconds = len(audio) / SAMPLE_RATE
+        text = f' окно {len(self.calls)}'
+        return {'text': text, 'segments': [{'start': 0.0, 'end': seconds, 'text': text}]}
+
+
+def test_shard_is_decoded_window_by_window_with_parent_language(monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(sharding, '_shard_model', lambda model_size, seconds: model)
+    audio = np.full(70 * SAMPLE_RATE, 0.3, dtype=np.float32)
+
+    segments = sharding._transcribe_shard(audio, 'small', False, 600.0, 'ru')
+
+    # Как в обычном пути: окна до 30 с, язык один на всю запись, контекст переносится между окнами
+    assert len(model.calls) == 3
+    assert all(length <= 30 * SAMPLE_RATE for length, _, _ in model.calls)
+    assert [language for _, _, language in model.calls] == ['ru'] * 3
+    assert [prompt for _, prompt, _ in model.calls] == [None, 'окно 1', 'окно 2']
+    assert segments[0]['start'] == 600.0 and segments[-1]['end'] == 670.0
@@ -0,0 +1,73 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from app import startup
+from app.startup import EngineLoader, StartupTimer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Модули, которые окно импортирует до показа (кроме Qt): тяжёлые библиотеки в них грузиться не должны
+BLOCK_HEAVY_IMPORTS = '''
+import sys
+
+class Blocker:
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in ('torch', 'whisper', 'silero_vad'):
+            raise ImportError(f'{name} импортирован при запуске')
+
+sys.meta_path.insert(0, Blocker())
+import app.exporters, app.execution_plan, app.job_queue, app.live, app.model_registry, app.sharding
+import app.startup, app.time_estimator, app.transcript_cache
+'''
+
+
+def test_window_modules_do_not_import_engine():
+    result = subprocess.run([sys.executable, '-c', BLOCK_HEAVY_IMPORTS], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_timer_measures_steps_and_saves(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup, 'STARTUP_LOG_PATH', tmp_path / 'startup.jsonl')
+    timer = StartupTimer()
+    with timer.measure('qt_import'):
+        pass
+    timer.mark('window_shown')
+    timer.save()
+    timer.save()
+
+    records = [json.loads(line) for line in (tmp_path / 'startup.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert len(records) == 2
+    assert set(records[0]['steps']) == {'qt_import'}
+    assert records[0]['marks']['window_shown'] >= 0
+
+
+def test_engine_loader_reports_device(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup, 'STARTUP_LOG_PATH', tmp_path / 'startup.jsonl')
+    ready = []
+    loader = EngineLoader(on_ready=ready.append, timer=StartupTimer())
+    loader.STEPS = (('torch', lambda: None), ('device', lambda: 'cpu'))
+
+    loader.start().join(5)
+    assert loader.ready
+    assert ready == ['cpu']
+    assert set(loader.timer.steps) == {'torch', 'device'}
+    assert 'engine_ready' in loader.timer.marks
+
+
+def test_engine_loader_reports_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup, 'STARTUP_LOG_PATH', tmp_path / 'startup.jsonl')
+    errors = []
+
+    def broken():
+        raise ImportError('No module named torch')
+
+    loader = EngineLoader(on_error=errors.append, timer=StartupTimer())
+    loader.STEPS = (('torch', broken),)
+
+    loader.start().join(5)
+    assert loader.wait(0)
+    assert not loader.ready
+    assert errors == ['No module named torch']
+    assert not (tmp_path / 'startup.jsonl').exists()
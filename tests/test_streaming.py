@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from app.benchmark import current_rss_mb
+from app.convert_to_wav import SAMPLE_RATE
+from app.streaming import (STREAMING_MIN_SECONDS, STREAMING_RSS_BUDGET_MB, RingBuffer, should_stream, stream_windows,
+                           synthetic_blocks)
+from app.vad import MAX_WINDOW_SECONDS, split_into_windows
+
+# Длина синтетической записи для проверки памяти (ч): целиком она заняла бы ~660 МБ
+MEMORY_CHECK_HOURS = 3
+
+
+def _layout(windows):
+    return [(window.source_end, window.core_start, window.core_end) for window in windows]
+
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(10)
+    buffer.write(np.arange(7, dtype=np.float32))
+    buffer.consume(5)
+    buffer.write(np.arange(7, 14, dtype=np.float32))
+
+    assert buffer.available == 9
+    assert buffer.read(9).tolist() == list(range(5, 14))
+    with pytest.raises(OverflowError):
+        buffer.write(np.zeros(2, dtype=np.float32))
+
+
+def test_stream_windows_match_split_into_windows():
+    audio = np.concatenate(list(synthetic_blocks(0.05)))
+    # Блоки неровного размера: нарезка не должна от них зависеть
+    windows = list(stream_windows(np.array_split(audio, 37)))
+    expected = split_into_windows(audio)
+
+    assert all(len(window.audio) <= MAX_WINDOW_SECONDS * SAMPLE_RATE for window in windows)
+    assert _layout(windows) == _layout(expected)
+    for window, reference in zip(windows, expected):
+        assert np.array_equal(window.audio, reference.extract(audio))
+
+
+def test_stream_windows_overlap_without_pause():
+    t = np.arange(100 * SAMPLE_RATE) / SAMPLE_RATE
+    audio = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    windows = list(stream_windows(np.array_split(audio, 23)))
+
+    assert len(windows) > 1 and windows[0].core_end is not None
+    assert _layout(windows) == _layout(split_into_windows(audio))
+
+
+def test_streaming_peak_rss_is_bounded():
+    baseline = current_rss_mb()
+    if baseline is None:
+        pytest.skip('Нечем измерить RSS процесса (нет psutil и /proc)')
+
+    peak = baseline
+    seconds = 0.0
+    for index, window in enumerate(stream_windows(synthetic_blocks(MEMORY_CHECK_HOURS))):
+        seconds = window.source_end
+        if index % 10 == 0:
+            peak = max(peak, current_rss_mb())
+
+    assert seconds == pytest.approx(MEMORY_CHECK_HOURS * 3600)
+    assert peak - baseline < STREAMING_RSS_BUDGET_MB
+
+
+def test_vad_and_shards_keep_the_whole_recording_path():
+    long = STREAMING_MIN_SECONDS + 1
+
+    assert should_stream(long)
+    assert not should_stream(long, use_vad=True)
+    assert not should_stream(long, shards=4)
+    assert not should_stream(long, shards=None)
+    assert not should_stream(long, save_converted=True)
+    assert not should_stream(STREAMING_MIN_SECONDS - 1)
@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+from app import job_history
+from app.job_history import load_history, record_job
+from app.time_estimator import INTERVAL_Z, MODEL_PARAMS, PRIOR_LOG_STD, PRIOR_WEIGHT, estimate_range
+
+
+@pytest.fixture(autouse=True)
+def history(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_history, 'HISTORY_PATH', tmp_path / 'job_history.jsonl')
+    monkeypatch.setattr(job_history, '_since_trim', job_history.TRIM_EVERY - 1)
+    return tmp_path / 'job_history.jsonl'
+
+
+def test_without_history_estimate_comes_from_model_table():
+    params = MODEL_PARAMS['small']
+    estimate = estimate_range(600, 'small', 'cpu')
+
+    assert estimate.samples == 0
+    assert estimate.load_seconds == params['load_time']
+    assert estimate.seconds == pytest.approx(600 * params['coefficient'] + params['load_time'])
+
+    spread = PRIOR_LOG_STD * math.sqrt(1 + 1 / PRIOR_WEIGHT) * INTERVAL_Z
+    assert estimate.low == pytest.approx(600 * params['coefficient'] * math.exp(-spread) + params['load_time'])
+    assert estimate.high == pytest.approx(600 * params['coefficient'] * math.exp(spread) + params['load_time'])
+
+
+def test_history_outweighs_table_and_narrows_interval():
+    prior = estimate_range(600, 'small', 'cpu')
+    for rtf in (0.09, 0.1, 0.11) * 7:
+        record_job('small', 'cpu', 100, 3.0, 100 * rtf)
+    # Модель уже была в памяти: такая загрузка не считается холодной
+    record_job('small', 'cpu', 100, 0.1, 10)
+
+    estimate = estimate_range(600, 'small', 'cpu')
+    assert estimate.samples == 22
+    assert estimate.load_seconds == 3.0
+    # Оценка ближе к истории (RTF 0.1), чем к таблице (0.5)
+    assert 600 * 0.1 < estimate.seconds - 3.0 < 600 * 0.2
+    assert estimate.low < estimate.seconds < estimate.high
+    assert (estimate.high - estimate.low) < (prior.high - prior.low) / 3
+
+
+def test_history_is_matched_by_job_options():
+    for _ in range(10):
+        record_job('small', 'cpu', 100, 3.0, 10, shards=4)
+
+    assert estimate_range(600, 'small', 'cpu').samples == 0
+    estimate = estimate_range(600, 'small', 'cpu', shards=4)
+    assert estimate.samples == 10
+    # Загрузка в воркерах уже вошла в замеренную скорость
+    assert estimate.load_seconds == 0.0
+    assert estimate_range(600, 'small', 'cpu', model_loaded=True).load_seconds == 0.0
+
+
+def test_history_is_trimmed_every_n_records(history, monkeypatch):
+    monkeypatch.setattr(job_history, 'MAX_RECORDS', 10)
+    monkeypatch.setattr(job_history, 'TRIM_EVERY', 5)
+    monkeypatch.setattr(job_history, '_since_trim', 0)
+
+    for index in range(14):
+        record_job('small', 'cpu', 100, 1.0, index + 1)
+    # Проверки были на 5-й и 10-й записи, и файл ещё не превышал порог; между ними он не перечитывается
+    assert len(load_history()) == 14
+
+    # 15-я запись: проверка, 15 записей больше порога - остаются последние MAX_RECORDS
+    record_job('small', 'cpu', 100, 1.0, 15)
+    records = load_history()
+    assert len(records) == 10
+    assert records[-1]['decode_seconds'] == 15
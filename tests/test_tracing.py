@@ -0,0 +1,89 @@
+import json
+import logging
+import threading
+
+import pytest
+
+from app import tracing
+from app.tracing import JobTrace, JsonFormatter, bind_job, count, span
+
+
+@pytest.fixture
+def trace_state(monkeypatch):
+    monkeypatch.setattr(tracing, '_events', [])
+    monkeypatch.setattr(tracing, '_counters', {})
+    return tracing
+
+
+def test_disabled_span_without_job_is_noop(trace_state, monkeypatch):
+    monkeypatch.setattr(tracing, '_enabled', False)
+    with span('decode_window', index=1):
+        count('segments', 3)
+    assert tracing.chrome_trace()['traceEvents'] == []
+    assert tracing.counters() == {}
+
+
+def test_job_trace_collects_stages_from_threads(trace_state, monkeypatch):
+    monkeypatch.setattr(tracing, '_enabled', False)
+    job = JobTrace('job-1')
+
+    def work():
+        with bind_job(job):
+            with span('decode_window'):
+                count('segments', 2)
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with bind_job(job):
+        with span('format_segments'):
+            pass
+
+    result = job.to_dict()
+    assert result['stages']['decode_window']['calls'] == 3
+    assert result['stages']['format_segments']['calls'] == 1
+    assert result['counters'] == {'segments': 6}
+    assert 'decode_window' in job.summary() and '×3' in job.summary()
+    # Вне блока задача к потоку больше не привязана
+    with span('probe'):
+        pass
+    assert 'probe' not in job.to_dict()['stages']
+
+
+def test_enabled_tracing_records_chrome_events(trace_state, monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, '_enabled', True)
+    with bind_job(JobTrace('job-2')):
+        with pytest.raises(ValueError):
+            with span('ffmpeg_decode', file='rec.mp3'):
+                raise ValueError
+    count('cache_hits')
+    count('cache_hits')
+
+    events = tracing.chrome_trace()['traceEvents']
+    assert events[0]['ph'] == 'X' and events[0]['name'] == 'ffmpeg_decode'
+    assert events[0]['args'] == {'file': 'rec.mp3', 'job': 'job-2', 'error': 'ValueError'}
+    assert [event['args']['cache_hits'] for event in events[1:]] == [1, 2]
+    assert tracing.counters() == {'cache_hits': 2}
+
+    path = tracing.export_chrome_trace(tmp_path / 'trace.json')
+    assert json.loads(path.read_text(encoding='utf-8'))['traceEvents'] == events
+
+
+def test_trace_events_are_bounded(trace_state, monkeypatch):
+    monkeypatch.setattr(tracing, '_enabled', True)
+    monkeypatch.setattr(tracing, 'MAX_TRACE_EVENTS', 5)
+    for _ in range(12):
+        count('windows')
+    events = tracing.chrome_trace()['traceEvents']
+    assert len(events) == 5
+    assert events[-1]['args']['windows'] == 12
+
+
+def test_json_formatter_keeps_extra_fields():
+    record = logging.makeLogRecord({'name': 'app.test', 'levelname': 'DEBUG', 'msg': 'span %s',
+                                    'args': ('probe',), 'span': 'probe', 'seconds': 0.25})
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'span probe'
+    assert (entry['span'], entry['seconds']) == ('probe', 0.25)
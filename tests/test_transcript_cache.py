@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from app import transcript_cache as cache_module
+from app.transcript_cache import TranscriptCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, 'get_audio_duration', lambda path: 90.0)
+    return TranscriptCache(tmp_path / 'transcripts')
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def _segments(text):
+    return [{'start': 0.0, 'end': 1.5, 'text': text, 'final': True}]
+
+
+def test_key_depends_on_content_model_and_options_not_on_name(cache, tmp_path):
+    first = _write(tmp_path / 'rec.mp3', b'audio' * 1000)
+    copy = _write(tmp_path / 'копия.mp3', b'audio' * 1000)
+    other = _write(tmp_path / 'other.mp3', b'voice' * 1000)
+
+    key = cache.make_key(first, 'small', use_vad=False, shards=1)
+    assert cache.make_key(copy, 'small', shards=1, use_vad=False) == key
+    assert cache.make_key(other, 'small', use_vad=False, shards=1) != key
+    assert cache.make_key(first, 'medium', use_vad=False, shards=1) != key
+    assert cache.make_key(first, 'small', use_vad=True, shards=1) != key
+
+
+def test_changed_file_gets_new_key(cache, tmp_path):
+    path = _write(tmp_path / 'rec.mp3', b'a' * 3 * 1024 * 1024)
+    key = cache.make_key(path, 'small')
+
+    # Правка в середине большого файла тоже попадает в отпечаток
+    data = bytearray(path.read_bytes())
+    data[len(data) // 2] = ord('b')
+    path.write_bytes(bytes(data))
+    assert cache.make_key(path, 'small') != key
+
+
+def test_get_put_invalidate_and_stats(cache):
+    assert cache.get('k') is None
+    cache.put('k', _segments(' привет'), model='small')
+
+    assert cache.get('k') == [{'start': 0.0, 'end': 1.5, 'text': ' привет'}]
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (1, 1, 1)
+
+    assert cache.invalidate('k')
+    assert not cache.invalidate('k')
+    assert cache.get('k') is None
+
+
+def test_least_recently_used_entries_are_evicted_over_budget(cache):
+    for index, key in enumerate(('old', 'used', 'new')):
+        cache.put(key, _segments(' слово' * 100))
+        os.utime(cache._path(key), (1000 + index, 1000 + index))
+    # Размер записей чуть отличается (время создания): бюджет - три записи с запасом меньше одной
+    entry_size = max(cache._path(key).stat().st_size for key in ('old', 'used', 'new'))
+
+    # Обращение делает запись свежей
+    assert cache.get('old') is not None
+    cache.budget_bytes = entry_size * 3 + entry_size // 2
+    cache.put('newest', _segments(' слово' * 100))
+
+    assert cache.get('used') is None
+    assert cache.get('old') is not None
+    assert cache.get('new') is not None
+    assert cache.get('newest') is not None
@@ -0,0 +1,78 @@
+import numpy as np
+
+from app import transcribe
+from app.convert_to_wav import SAMPLE_RATE
+from app.vad import MAX_WINDOW_SECONDS, PIECE_GAP_SECONDS, VadReport, pack_speech_windows
+
+GAP = int(PIECE_GAP_SECONDS * SAMPLE_RATE)
+
+
+def _seconds(value):
+    return int(value * SAMPLE_RATE)
+
+
+def test_speech_spans_are_packed_with_short_gaps():
+    spans = [(_seconds(10), _seconds(15)), (_seconds(100), _seconds(104))]
+    (window,) = pack_speech_windows(spans)
+
+    assert window.length == _seconds(9) + GAP
+    assert window.pieces == [(_seconds(10), 0, _seconds(5)), (_seconds(100), _seconds(5) + GAP, _seconds(4))]
+    assert window.source_end == 104.0
+
+
+def test_long_speech_is_cut_to_window_size():
+    windows = pack_speech_windows([(0, _seconds(MAX_WINDOW_SECONDS * 2 + 5))])
+    assert [window.length for window in windows] == [_seconds(MAX_WINDOW_SECONDS)] * 2 + [_seconds(5)]
+    assert windows[2].pieces[0][0] == _seconds(MAX_WINDOW_SECONDS * 2)
+
+
+def test_window_time_maps_back_to_source():
+    (window,) = pack_speech_windows([(_seconds(10), _seconds(15)), (_seconds(100), _seconds(104))])
+
+    assert window.to_source_time(1.0) == 11.0
+    assert window.to_source_time(6.0) == 100.8
+    # Время в тишине между фрагментами: начало прижимается к следующему, конец - к предыдущему
+    assert window.to_source_time(5.1) == 100.0
+    assert window.to_source_time(5.1, is_end=True) == 15.0
+    assert window.to_source_time(60.0) == 104.0
+
+
+def test_extract_takes_only_speech():
+    audio = np.zeros(_seconds(20), dtype=np.float32)
+    audio[_seconds(2):_seconds(3)] = 0.5
+    audio[_seconds(10):_seconds(11)] = -0.5
+    (window,) = pack_speech_windows([(_seconds(2), _seconds(3)), (_seconds(10), _seconds(11))])
+
+    extracted = window.extract(audio)
+    assert len(extracted) == _seconds(2) + GAP
+    assert (extracted[:_seconds(1)] == 0.5).all()
+    assert (extracted[_seconds(1):_seconds(1) + GAP] == 0).all()
+    assert (extracted[-_seconds(1):] == -0.5).all()
+
+
+def test_vad_report():
+    report = VadReport(_seconds(100), [(0, _seconds(20)), (_seconds(50), _seconds(55))], 1)
+    assert report.speech_seconds == 25.0
+    assert report.skipped_seconds == 75.0
+    assert report.skipped_percent == 75.0
+    assert 'пропущено 75.0 с тишины (75%)' in str(report)
+
+
+def test_speech_only_decodes_speech_and_reports(monkeypatch):
+    class FakeModel:
+        def __init__(self):
+            self.lengths = []
+
+        def transcribe(self, audio, fp16=False, initial_prompt=None, language=None):
+            self.lengths.append(len(audio))
+            return {'text': ' привет', 'segments': [{'start': 0.5, 'end': 1.0, 'text': ' привет'}]}
+
+    monkeypatch.setattr(transcribe, 'detect_speech', lambda audio: [(_seconds(40), _seconds(42))])
+    model = FakeModel()
+    reports = []
+    segments = transcribe.transcribe_speech_only(model, np.zeros(_seconds(60), dtype=np.float32), False,
+                                                 reports.append, language='ru')
+
+    assert model.lengths == [_seconds(2)]
+    assert segments == [{'start': 40.5, 'end': 41.0, 'text': ' привет'}]
+    assert reports and reports[0].startswith('VAD: речь 2.0 с из 60.0 с')